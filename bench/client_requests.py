@@ -0,0 +1,92 @@
+"""Benchmark of AsyncClient request throughput with many pending requests.
+
+The client keeps a window of ?watchdog requests outstanding, sending a new
+request as soon as each reply arrives, and the rate of completed requests is
+reported for a range of window sizes. All the requests have the same name and
+a timeout, which exercises the client's pending request bookkeeping. The same
+windows are also used with AsyncClient.future_requests(), which writes the
+requests to the socket in batches.
+"""
+
+import time
+
+from concurrent.futures import Future
+from tornado import gen
+
+from katcp import DeviceServer, AsyncClient, Message
+from util import standard_parser
+
+
+class BenchmarkServer(DeviceServer):
+
+    def setup_sensors(self):
+        pass
+
+
+@gen.coroutine
+def windowed_requests(client, window, no_requests):
+    sent = [0]
+    done = Future()
+
+    def send():
+        sent[0] += 1
+        client.callback_request(Message.request('watchdog'),
+                                reply_cb=reply_cb)
+
+    def reply_cb(msg):
+        if sent[0] < no_requests:
+            send()
+        elif not client._async_queue:
+            done.set_result(None)
+
+    t0 = time.time()
+    for i in range(min(window, no_requests)):
+        send()
+    yield done
+    raise gen.Return(no_requests / (time.time() - t0))
+
+
+@gen.coroutine
+def batched_requests(client, window, no_requests):
+    t0 = time.time()
+    yield client.future_requests(
+        [Message.request('watchdog') for i in range(no_requests)],
+        window=window)
+    raise gen.Return(no_requests / (time.time() - t0))
+
+
+def run(requester, window, options):
+    server = BenchmarkServer('127.0.0.1', options.port)
+    server.set_concurrency_options(thread_safe=False, handler_thread=False)
+    server.start(timeout=1)
+    client = AsyncClient('127.0.0.1', options.port, timeout=60)
+    client.start(timeout=1)
+    try:
+        client.wait_protocol(timeout=1)
+        result = Future()
+        client.ioloop.add_callback(
+            lambda: gen.chain_future(
+                requester(client, window, options.requests), result))
+        return result.result()
+    finally:
+        client.stop()
+        client.join()
+        server.stop()
+        server.join()
+
+
+def main():
+    parser = standard_parser(1238)
+    parser.add_option('--requests', type=int, default=50000,
+                      help='number of requests sent for each window size')
+    parser.add_option('--windows', default='1,100,1000,10000',
+                      help='comma-separated numbers of outstanding requests')
+    options, args = parser.parse_args()
+    for window in [int(w) for w in options.windows.split(',')]:
+        rate = run(windowed_requests, window, options)
+        batched_rate = run(batched_requests, window, options)
+        print "WINDOW: %d, REQUESTS/S: %d, BATCHED REQUESTS/S: %d" % (
+            window, rate, batched_rate)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark of the ioloop cost of many period sampling strategies.
+
+A large number of 'period' strategies are started, with their start times
+spread over one period, and the ioloop is run for a few seconds. Strategies are
+also cancelled and restarted while running to simulate clients changing their
+sampling. The CPU time used per second is reported with every strategy adding
+its own ioloop timeouts, and with all strategies sharing a SampleScheduler.
+"""
+
+import random
+import time
+
+import tornado.ioloop
+
+from tornado import gen
+
+from katcp import Sensor
+from katcp.sampling import SamplePeriod, SampleScheduler
+from util import standard_parser
+
+
+def run(no_strategies, use_scheduler, options):
+    ioloop = tornado.ioloop.IOLoop()
+    scheduler = SampleScheduler(ioloop, 0.001) if use_scheduler else None
+    sensor = Sensor.integer('an.int', params=[0, 10], default=1)
+    informs = [0]
+
+    def inform_callback(sensor, reading):
+        informs[0] += 1
+
+    def new_strategy(start_delay=None):
+        strategy = SamplePeriod(inform_callback, sensor, options.period,
+                                ioloop=ioloop, scheduler=scheduler)
+        if start_delay is None:
+            strategy.start()
+        else:
+            ioloop.call_later(start_delay, strategy.start)
+        return strategy
+
+    @gen.coroutine
+    def measure():
+        strategies = [new_strategy(random.random() * options.period)
+                      for i in range(no_strategies)]
+        # Wait until all strategies are running
+        yield gen.sleep(options.period * 1.1)
+        informs[0] = 0
+        t0 = time.time()
+        c0 = time.clock()
+        while time.time() - t0 < options.duration:
+            yield gen.sleep(0.1)
+            # Churn a fraction of the strategies
+            for i in range(no_strategies // 100):
+                index = random.randrange(no_strategies)
+                strategies[index].cancel()
+                strategies[index] = new_strategy()
+        cpu = time.clock() - c0
+        elapsed = time.time() - t0
+        raise gen.Return((cpu / elapsed, informs[0] / elapsed))
+
+    try:
+        return ioloop.run_sync(measure)
+    finally:
+        ioloop.close()
+
+
+def main():
+    parser = standard_parser()
+    parser.add_option('--period', type=float, default=1.,
+                      help='sampling period in seconds')
+    parser.add_option('--duration', type=float, default=5.,
+                      help='seconds to run each test for')
+    options, args = parser.parse_args()
+    for no_strategies in (10000, 100000):
+        for use_scheduler in (False, True):
+            cpu, rate = run(no_strategies, use_scheduler, options)
+            print ("STRATEGIES: %d, SCHEDULER: %s, CPU: %.2f, INFORMS/S: %d"
+                   % (no_strategies, use_scheduler, cpu, rate))
+
+if __name__ == '__main__':
+    main()
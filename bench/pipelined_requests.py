@@ -0,0 +1,80 @@
+"""Benchmark of the server read loop for clients that pipeline requests.
+
+A number of raw socket clients each send a batch of ?watchdog requests in one
+go and then wait for all the replies. The test is repeated with and without
+KATCPServer.BULK_READ and the rate of handled messages is reported. With
+--metrics the server also times the requests (see DeviceServer.REQUEST_METRICS).
+"""
+
+import socket
+import threading
+import time
+
+from katcp import DeviceServer
+from util import standard_parser
+
+
+class BenchmarkServer(DeviceServer):
+
+    def setup_sensors(self):
+        pass
+
+
+class MetricsBenchmarkServer(BenchmarkServer):
+
+    REQUEST_METRICS = True
+
+
+def pipelined_client(address, no_requests, results):
+    sock = socket.create_connection(address)
+    sock.sendall('?watchdog\n' * no_requests)
+    replies = 0
+    data = ''
+    while replies < no_requests:
+        data += sock.recv(65536)
+        lines = data.split('\n')
+        data = lines.pop()
+        replies += sum(1 for line in lines if line.startswith('!watchdog'))
+    sock.close()
+    results.append(replies)
+
+
+def run(bulk_read, options):
+    server_class = MetricsBenchmarkServer if options.metrics else BenchmarkServer
+    server = server_class('127.0.0.1', options.port)
+    server._server.BULK_READ = bulk_read
+    server.set_concurrency_options(thread_safe=False, handler_thread=False)
+    server.start(timeout=1)
+    try:
+        results = []
+        clients = [threading.Thread(target=pipelined_client,
+                                    args=(server.bind_address,
+                                          options.requests, results))
+                   for i in range(options.clients)]
+        t0 = time.time()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.time() - t0
+    finally:
+        server.stop()
+        server.join()
+    return sum(results) / elapsed
+
+
+def main():
+    parser = standard_parser(1237)
+    parser.add_option('--clients', type=int, default=4,
+                      help='number of pipelining clients')
+    parser.add_option('--requests', type=int, default=20000,
+                      help='number of requests sent by each client')
+    parser.add_option('--metrics', action='store_true', default=False,
+                      help='time requests and publish the metrics as sensors')
+    options, args = parser.parse_args()
+    for bulk_read in (False, True):
+        rate = run(bulk_read, options)
+        print "BULK_READ: %s, MSGS/S: %d" % (bulk_read, rate)
+
+if __name__ == '__main__':
+    main()
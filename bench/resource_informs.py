@@ -0,0 +1,94 @@
+"""Benchmark of #sensor-status inform handling by a KATCPClientResource.
+
+A KATCPClientResource is synced with a server that has many sensors, after
+which pre-built #sensor-status informs are passed to its inspecting client
+as fast as possible, and the rate at which they are applied to the resource's
+sensor objects is reported. This is compared to an inspecting client that
+handles every reading in a coroutine, as InspectingClientAsync used to do.
+"""
+
+import time
+
+import tornado.gen
+import tornado.ioloop
+
+from katcp import DeviceServer, Message, Sensor
+from katcp.resource_client import (KATCPClientResource,
+                                   ReplyWrappedInspectingClientAsync)
+from util import standard_parser
+
+
+class BenchmarkServer(DeviceServer):
+
+    def __init__(self, host, port, no_sensors):
+        self.no_sensors = no_sensors
+        super(BenchmarkServer, self).__init__(host, port)
+
+    def setup_sensors(self):
+        for i in range(self.no_sensors):
+            self.add_sensor(Sensor.integer('int.sensor%d' % i,
+                                           params=[0, 1000000]))
+
+
+class CoroutineInspectingClient(ReplyWrappedInspectingClientAsync):
+
+    @tornado.gen.coroutine
+    def update_sensor(self, name, timestamp, status, value):
+        sensor = self._sensor_object_cache.get(name)
+        if not sensor:
+            sensor = yield self.future_get_sensor(name)
+        katcp_major = self.katcp_client.protocol_flags.major
+        sensor.set_formatted(timestamp, status, value, katcp_major)
+
+
+class CoroutineClientResource(KATCPClientResource):
+
+    def inspecting_client_factory(self, host, port, ioloop_set_to):
+        return CoroutineInspectingClient(host, port, ioloop=ioloop_set_to,
+                                         auto_reconnect=self.auto_reconnect)
+
+
+def run(resource_class, options):
+    server = BenchmarkServer('127.0.0.1', options.port, options.sensors)
+    server.start(timeout=1)
+    ioloop = tornado.ioloop.IOLoop()
+    resource = resource_class(dict(name='bench',
+                                   address=('127.0.0.1', options.port)))
+    resource.set_ioloop(ioloop)
+
+    @tornado.gen.coroutine
+    def measure():
+        resource.start()
+        yield resource.until_synced()
+        ic = resource._inspecting_client
+        msgs = [Message.inform('sensor-status', '%d.5' % value, '1',
+                               'int.sensor%d' % i, 'nominal', str(value))
+                for value in range(options.updates)
+                for i in range(options.sensors)]
+        t0 = time.time()
+        for msg in msgs:
+            ic._cb_inform_sensor_status(msg)
+        raise tornado.gen.Return(len(msgs) / (time.time() - t0))
+
+    try:
+        return ioloop.run_sync(measure)
+    finally:
+        resource.stop()
+        server.stop()
+        server.join()
+        ioloop.close()
+
+
+def main():
+    parser = standard_parser()
+    parser.add_option('--sensors', type=int, default=1000,
+                      help='number of sensors on the server')
+    parser.add_option('--updates', type=int, default=100,
+                      help='number of informs received for each sensor')
+    options, args = parser.parse_args()
+    coroutine_rate = run(CoroutineClientResource, options)
+    rate = run(KATCPClientResource, options)
+    print "COROUTINE INFORMS/S: %d, INFORMS/S: %d" % (coroutine_rate, rate)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark of setting many numeric sensors per update cycle.
+
+A large number of integer sensors, a fraction of which are sampled with the
+'event' strategy, are all set on every cycle, with only a fraction of the
+values changing between cycles. The update rate is measured when setting each
+Sensor individually, and when setting all the sensors of a SensorBank with a
+single vectorised set_many() call.
+"""
+
+import time
+
+import numpy as np
+import tornado.ioloop
+
+from tornado import gen
+
+from katcp import Sensor
+from katcp.sampling import SampleStrategy
+from katcp.sensor_bank import SensorBank
+from util import standard_parser
+
+
+def make_values(options):
+    """Generate the values for each cycle, a fraction of which change."""
+    rng = np.random.RandomState(1)
+    values = np.zeros((options.cycles, options.sensors), dtype=np.int64)
+    for cycle in range(1, options.cycles):
+        values[cycle] = values[cycle - 1]
+        changed = rng.rand(options.sensors) < options.changed
+        values[cycle][changed] += 1
+    return values
+
+
+def run(use_bank, values, options):
+    ioloop = tornado.ioloop.IOLoop()
+    names = ['int.sensor%d' % i for i in range(options.sensors)]
+    if use_bank:
+        bank = SensorBank(Sensor.INTEGER, names)
+        sensors = bank.sensors
+    else:
+        sensors = [Sensor.integer(name) for name in names]
+    informs = [0]
+
+    def inform_callback(sensor, reading):
+        informs[0] += 1
+
+    @gen.coroutine
+    def measure():
+        sampled = sensors[::int(1 / options.sampled)]
+        for sensor in sampled:
+            SampleStrategy.get_strategy(
+                'event', inform_callback, sensor, ioloop=ioloop).start()
+        # Let the strategies attach to their sensors
+        yield gen.moment
+        yield gen.moment
+        informs[0] = 0
+        t0 = time.time()
+        for cycle_values in values:
+            timestamp = time.time()
+            if use_bank:
+                bank.set_many(None, cycle_values, Sensor.NOMINAL, timestamp)
+            else:
+                for sensor, value in zip(sensors, cycle_values.tolist()):
+                    sensor.set(timestamp, Sensor.NOMINAL, value)
+        raise gen.Return(time.time() - t0)
+
+    elapsed = ioloop.run_sync(measure)
+    ioloop.close(all_fds=True)
+    return elapsed, informs[0]
+
+
+def main():
+    parser = standard_parser()
+    parser.add_option('--sensors', type=int, default=100000,
+                      help='number of sensors')
+    parser.add_option('--cycles', type=int, default=20,
+                      help='number of times every sensor is set')
+    parser.add_option('--sampled', type=float, default=0.1,
+                      help='fraction of sensors with an event strategy')
+    parser.add_option('--changed', type=float, default=0.01,
+                      help='fraction of sensor values changing per cycle')
+    options, args = parser.parse_args()
+    values = make_values(options)
+    updates = options.sensors * options.cycles
+    for use_bank in (False, True):
+        elapsed, informs = run(use_bank, values, options)
+        print "%-10s UPDATES/S: %d, INFORMS: %d" % (
+            'BANK:' if use_bank else 'INDIVIDUAL:', updates / elapsed, informs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark of the memory used by large numbers of sensor objects.
+
+Many integer, float and discrete Sensor objects, as created by a large device
+server, and KATCPSensor objects, as created by a client resource of such a
+device, are allocated and the memory used per object is reported. Memory is
+traced with tracemalloc where it is available, otherwise the growth of the
+maximum resident set size of the process is used. Each kind of sensor is
+measured in a fresh process.
+"""
+
+import gc
+import multiprocessing
+import resource
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from katcp import Sensor
+from katcp.resource import KATCPSensor
+from util import standard_parser
+
+
+class BenchmarkSensorManager(object):
+    """Stands in for the sensor manager of a client resource."""
+
+
+def make_sensors(kind, number):
+    if kind == 'integer':
+        return [Sensor.integer('int.sensor%d' % i, params=[0, 1000000])
+                for i in range(number)]
+    elif kind == 'float':
+        return [Sensor.float('float.sensor%d' % i, params=[0.0, 1.0])
+                for i in range(number)]
+    elif kind == 'discrete':
+        values = ['on', 'off', 'standby']
+        return [Sensor.discrete('discrete.sensor%d' % i, params=values)
+                for i in range(number)]
+    elif kind == 'katcp':
+        manager = BenchmarkSensorManager()
+        return [KATCPSensor(dict(sensor_type=Sensor.INTEGER,
+                                 name='int.sensor%d' % i,
+                                 params=[0, 1000000]), manager)
+                for i in range(number)]
+
+
+def measure(kind, number):
+    """Return the number of bytes used per sensor of the given kind."""
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+        sensors = make_sensors(kind, number)
+        used, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    else:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        sensors = make_sensors(kind, number)
+        used = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss -
+                maxrss) * 1024
+    del sensors
+    return used / float(number)
+
+
+def main():
+    parser = standard_parser()
+    parser.add_option('--sensors', type=int, default=100000,
+                      help='number of sensors of each kind')
+    options, args = parser.parse_args()
+    if not tracemalloc:
+        print "tracemalloc not available, using maximum resident set size"
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    for kind in ('integer', 'float', 'discrete', 'katcp'):
+        used = pool.apply(measure, (kind, options.sensors))
+        print "%-10s BYTES/SENSOR: %d" % (kind.upper() + ':', used)
+    pool.close()
+
+
+if __name__ == '__main__':
+    main()
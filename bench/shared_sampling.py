@@ -0,0 +1,87 @@
+"""Benchmark of sensor set() throughput with many clients sampling a sensor.
+
+Every client samples the same sensors using the 'event' strategy. The rate at
+which sensor values can be set is measured with a separate strategy (and
+inform formatting) per client, as well as with a single SharedSampleStrategy
+per sensor fanned out to all the clients. Each client serialises the inform
+messages it receives, as the server would before writing them to the socket.
+"""
+
+import time
+
+import tornado.ioloop
+
+from tornado import gen
+
+from katcp import Sensor
+from katcp.sampling import (SampleStrategy, SharedSampleStrategy,
+                            format_inform_v5)
+from util import standard_parser
+
+
+def setup_unshared(sensors, no_clients, ioloop):
+    def inform_callback(sensor, reading):
+        format_inform_v5(sensor, *reading).to_wire()
+    strategies = []
+    for sensor in sensors:
+        for i in range(no_clients):
+            strategy = SampleStrategy.get_strategy(
+                'event', inform_callback, sensor, ioloop=ioloop)
+            strategy.start()
+            strategies.append(strategy)
+    return strategies
+
+
+def setup_shared(sensors, no_clients, ioloop):
+    def send_inform(msg):
+        msg.to_wire()
+    subscriptions = []
+    for sensor in sensors:
+        shared = SharedSampleStrategy(format_inform_v5, 'event', sensor,
+                                      ioloop=ioloop)
+        for i in range(no_clients):
+            subscriptions.append(shared.subscribe(i, send_inform))
+    return subscriptions
+
+
+def run(setup, no_clients, options):
+    ioloop = tornado.ioloop.IOLoop()
+    sensors = [Sensor.integer('int.sensor%d' % i, params=[0, 1000000])
+               for i in range(options.sensors)]
+
+    @gen.coroutine
+    def measure():
+        strategies = setup(sensors, no_clients, ioloop)
+        # Let the strategies attach to their sensors
+        yield gen.moment
+        yield gen.moment
+        t0 = time.time()
+        for value in range(options.updates):
+            for sensor in sensors:
+                sensor.set_value(value)
+        elapsed = time.time() - t0
+        for strategy in strategies:
+            strategy.cancel()
+        raise gen.Return(options.updates * len(sensors) / elapsed)
+
+    try:
+        return ioloop.run_sync(measure)
+    finally:
+        ioloop.close()
+
+
+def main():
+    parser = standard_parser()
+    parser.add_option('--sensors', type=int, default=100,
+                      help='number of sensors sampled by each client')
+    parser.add_option('--updates', type=int, default=20,
+                      help='number of times each sensor is set')
+    options, args = parser.parse_args()
+    for no_clients in (1, 10, 50):
+        unshared = run(setup_unshared, no_clients, options)
+        shared = run(setup_shared, no_clients, options)
+        print "CLIENTS: %d, SETS/S UNSHARED: %d, SETS/S SHARED: %d" % (
+            no_clients, unshared, shared)
+
+if __name__ == '__main__':
+    main()
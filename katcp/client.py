@@ -8,6 +8,7 @@
 from __future__ import division, print_function, absolute_import
 
 import sys
+import heapq
 import traceback
 import logging
 
@@ -15,6 +16,7 @@ import tornado.ioloop
 import tornado.tcpclient
 import tornado.iostream
 
+from collections import OrderedDict, deque, namedtuple
 from functools import partial, wraps
 from thread import get_ident as get_thread_ident
 
@@ -26,7 +28,7 @@ from concurrent.futures import Future, TimeoutError
 from .core import (DeviceMetaclass, MessageParser, Message,
                    KatcpClientError, KatcpVersionError, KatcpClientDisconnected,
                    ProtocolFlags, AsyncEvent, until_later, LatencyTimer,
-                   SEC_TS_KATCP_MAJOR, FLOAT_TS_KATCP_MAJOR, SEC_TO_MS_FAC)
+                   RequestStats, SEC_TS_KATCP_MAJOR, FLOAT_TS_KATCP_MAJOR, SEC_TO_MS_FAC)
 from .ioloop_manager import IOLoopManager
 
 
@@ -396,7 +398,26 @@ class DeviceClient(object):
 
         """
         assert get_thread_ident() == self.ioloop_thread_id
-        data = str(msg) + "\n"
+        return self._write_wire(msg.to_wire(), str(msg))
+
+    @make_threadsafe_blocking
+    def send_messages(self, msgs):
+        """Send a batch of messages of any kind in a single stream write.
+
+        Parameters
+        ----------
+        msgs : list of Message objects
+            The messages to send.
+
+        """
+        assert get_thread_ident() == self.ioloop_thread_id
+        data = ''.join(msg.to_wire() for msg in msgs)
+        return self._write_wire(
+            data, '{0} messages starting with {1}'.format(
+                len(msgs), msgs[0] if msgs else None))
+
+    def _write_wire(self, data, description):
+        """Write serialised messages to the stream."""
         # Log all sent messages here so no one else has to.
         if self._logger.isEnabledFor(logging.DEBUG):
             self._logger.debug("Sending to {}: {}"
@@ -408,7 +429,8 @@ class DeviceClient(object):
             return self._stream.write(data)
         except Exception:
             self._logger.warn('Could not send message {0!r} to {1!r}'
-                              .format(str(msg), self._bindaddr), exc_info=True)
+                              .format(description, self._bindaddr),
+                              exc_info=True)
             self._disconnect(exc_info=True)
 
     @gen.coroutine
@@ -1030,6 +1052,188 @@ class DeviceClient(object):
         pass
 
 
+class RequestRecord(namedtuple(
+        'RequestRecord', 'name mid outcome latency informs bytes_out bytes_in')):
+    """Round trip of a single request sent by an :class:`AsyncClient`
+
+    Fields
+    ------
+    name : str
+        Name of the request.
+    mid : str
+        Message id of the request, which is internal to the client if the
+        server does not support message ids.
+    outcome : str
+        Reply status (e.g. 'ok', 'fail' or 'invalid'), 'timeout' if no reply
+        arrived in time, or 'abandoned' if the client stopped or disconnected
+        before the reply arrived.
+    latency : float or None
+        Seconds from sending the request until its reply arrived, or None if
+        there was no reply.
+    informs : int
+        Number of informs received in reply to the request.
+    bytes_out : int
+        Size of the request message in bytes.
+    bytes_in : int
+        Size of the reply and inform messages received in bytes.
+    """
+
+
+class RoundTripStats(RequestStats):
+    """Statistics of the requests of one name sent by an AsyncClient.
+
+    Extends the reply count, failures and latency histogram of RequestStats
+    with the number of requests sent, timed out and abandoned, and their
+    informs and traffic.
+
+    """
+
+    __slots__ = ('sent', 'timeouts', 'abandoned', 'informs', 'bytes_out',
+                 'bytes_in')
+
+    def __init__(self):
+        super(RoundTripStats, self).__init__()
+        self.sent = 0
+        self.timeouts = 0
+        self.abandoned = 0
+        self.informs = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+    def summary(self):
+        summary = super(RoundTripStats, self).summary()
+        summary.update(sent=self.sent, timeouts=self.timeouts,
+                       abandoned=self.abandoned, informs=self.informs,
+                       bytes_out=self.bytes_out, bytes_in=self.bytes_in)
+        return summary
+
+
+class RequestTelemetry(object):
+    """Round-trip telemetry of the requests sent by an AsyncClient.
+
+    Created by :meth:`AsyncClient.enable_request_telemetry`. The client tells
+    it when requests are sent, and when informs, replies and timeouts for
+    them occur. Statistics are kept per request name, and a
+    :class:`RequestRecord` is passed to the optional callback as each request
+    completes, e.g. for exporting to a monitoring system. Must only be used
+    in the ioloop thread of the client.
+
+    Parameters
+    ----------
+    callback : callable, optional
+        Called with a RequestRecord for every completed request.
+    logger : logging.Logger object, optional
+        Logger for errors raised by the callback.
+
+    """
+
+    def __init__(self, callback=None, logger=log):
+        self.callback = callback
+        self._logger = logger
+        # map request names to RoundTripStats objects
+        self._stats = {}
+        # map msg_ids of pending requests to
+        # [name, mid, start time, informs, bytes_out, bytes_in] lists
+        self._pending = {}
+
+    def request_sent(self, msg_id, request, now):
+        """Start timing a request that is about to be sent."""
+        name = request.name
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = RoundTripStats()
+        size = len(request.to_wire())
+        stats.sent += 1
+        stats.bytes_out += size
+        self._pending[msg_id] = [name, msg_id, now, 0, size, 0]
+
+    def inform_received(self, msg_id, inform):
+        """Count an inform received in reply to a pending request."""
+        pending = self._pending.get(msg_id)
+        if pending is None:
+            return
+        size = len(inform.to_wire())
+        stats = self._stats[pending[0]]
+        stats.informs += 1
+        stats.bytes_in += size
+        pending[3] += 1
+        pending[5] += size
+
+    def reply_received(self, msg_id, reply, now):
+        """Record the round trip of a request that has been replied to."""
+        pending = self._pending.pop(msg_id, None)
+        if pending is None:
+            return
+        name, mid, start_time, informs, bytes_out, bytes_in = pending
+        size = len(reply.to_wire())
+        outcome = reply.arguments[0] if reply.arguments else ''
+        latency = now - start_time
+        stats = self._stats[name]
+        stats.add(latency, outcome != 'ok')
+        stats.bytes_in += size
+        self._completed(RequestRecord(name, mid, outcome, latency, informs,
+                                      bytes_out, bytes_in + size))
+
+    def request_timed_out(self, msg_id):
+        """Record a request that did not receive a reply in time."""
+        self._request_failed(msg_id, 'timeout')
+
+    def request_abandoned(self, msg_id):
+        """Record a request that will never receive a reply."""
+        self._request_failed(msg_id, 'abandoned')
+
+    def _request_failed(self, msg_id, outcome):
+        pending = self._pending.pop(msg_id, None)
+        if pending is None:
+            return
+        name, mid, start_time, informs, bytes_out, bytes_in = pending
+        stats = self._stats[name]
+        if outcome == 'timeout':
+            stats.timeouts += 1
+        else:
+            stats.abandoned += 1
+        self._completed(RequestRecord(name, mid, outcome, None, informs,
+                                      bytes_out, bytes_in))
+
+    def _completed(self, record):
+        if self.callback is None:
+            return
+        try:
+            self.callback(record)
+        except Exception:
+            self._logger.error('Error in request telemetry callback for {0}'
+                               .format(record), exc_info=True)
+
+    def snapshot(self):
+        """Statistics of the requests sent so far.
+
+        Returns
+        -------
+        stats : dict
+            Maps request names to dicts as returned by RequestStats.summary(),
+            with the additional keys:
+
+            sent : int
+                Number of requests sent.
+            timeouts : int
+                Number of requests that timed out.
+            abandoned : int
+                Number of requests abandoned on disconnection.
+            informs : int
+                Number of informs received in reply to the requests.
+            bytes_out : int
+                Bytes of request messages sent.
+            bytes_in : int
+                Bytes of reply and inform messages received.
+
+            The count and failures are those of the replies received, with
+            failures counting replies that were not 'ok'.
+
+        """
+        return dict((name, stats.summary())
+                    for name, stats in self._stats.items())
+
+
 class AsyncClient(DeviceClient):
     """Implement async and callback-based requests on top of DeviceClient.
 
@@ -1074,6 +1278,16 @@ class AsyncClient(DeviceClient):
     >>> c.join()
     """
 
+    TIMEOUT_RESOLUTION = 0.05
+    """Minimum interval in seconds between sweeps for timed-out requests.
+
+    All pending requests share a single ioloop timeout that fires at the
+    earliest request deadline, but no sooner than this interval after the
+    previous sweep. Requests may therefore time out up to this many seconds
+    late when many of them expire in quick succession.
+
+    """
+
     def __init__(self, host, port, tb_limit=20, timeout=5.0, logger=log,
                  auto_reconnect=True):
         super(AsyncClient, self).__init__(host, port, tb_limit=tb_limit,
@@ -1081,8 +1295,50 @@ class AsyncClient(DeviceClient):
                                           auto_reconnect=auto_reconnect)
 
         self._request_timeout = timeout
+        # Handle and time of the next timeout sweep, if one is scheduled
+        self._timeout_sweep_handle = None
+        self._timeout_sweep_time = None
+        self.request_telemetry = None
+        "RequestTelemetry object, set by enable_request_telemetry()"
         self._reset_async_requests()
 
+    def enable_request_telemetry(self, callback=None):
+        """Record the round trip of every request sent from now on.
+
+        The send-to-reply latency, number of informs, bytes and timeouts are
+        recorded per request name, see :meth:`request_stats`. Telemetry is
+        off by default so that clients which do not use it pay only a None
+        check per request, inform and reply.
+
+        Parameters
+        ----------
+        callback : callable, optional
+            Called in the ioloop with a :class:`RequestRecord` as every
+            request completes, e.g. to export it to a monitoring system.
+
+        Returns
+        -------
+        telemetry : :class:`RequestTelemetry` object
+            The telemetry, also available as the `request_telemetry`
+            attribute.
+
+        """
+        self.request_telemetry = RequestTelemetry(callback, self._logger)
+        return self.request_telemetry
+
+    @make_threadsafe_blocking
+    def request_stats(self):
+        """Statistics of the requests sent since telemetry was enabled.
+
+        Returns a dict mapping request names to their statistics as described
+        by :meth:`RequestTelemetry.snapshot`, which is empty if telemetry has
+        not been enabled with :meth:`enable_request_telemetry`.
+
+        """
+        if self.request_telemetry is None:
+            return {}
+        return self.request_telemetry.snapshot()
+
     def _reset_async_requests(self):
         """Initialize / clear out async request structures.
 
@@ -1090,24 +1346,33 @@ class AsyncClient(DeviceClient):
 
         """
         # pending requests
-        # msg_id -> (request, reply_cb, inform_cb, user_data, timeout_handle)
+        # msg_id -> (request, reply_cb, inform_cb, user_data, deadline)
         #           callback tuples
         self._async_queue = {}
 
-        # stack mapping request names to a stack of message ids
-        # msg_name -> [ list of msg_ids ]
+        # stack mapping request names to the message ids of pending requests
+        # in the order they were sent, allowing O(1) removal of any of them
+        # msg_name -> OrderedDict(msg_id -> None)
         self._async_id_stack = {}
 
+        # heap of (deadline, msg_id, start_time) tuples for requests with a
+        # timeout. Entries of requests that have already been replied to are
+        # only discarded once their deadline has passed.
+        self._timeout_heap = []
+
     def _push_async_request(self, msg_id, request, reply_cb, inform_cb,
-                            user_data, timeout_handle):
+                            user_data, deadline):
         """Store reply / inform callbacks for request we've sent."""
         assert get_thread_ident() == self.ioloop_thread_id
         self._async_queue[msg_id] = (
-            request, reply_cb, inform_cb, user_data, timeout_handle)
-        if request.name in self._async_id_stack:
-            self._async_id_stack[request.name].append(msg_id)
-        else:
-            self._async_id_stack[request.name] = [msg_id]
+            request, reply_cb, inform_cb, user_data, deadline)
+        if self.request_telemetry is not None:
+            self.request_telemetry.request_sent(msg_id, request,
+                                                self.ioloop.time())
+        msg_ids = self._async_id_stack.get(request.name)
+        if msg_ids is None:
+            msg_ids = self._async_id_stack[request.name] = OrderedDict()
+        msg_ids[msg_id] = None
 
     def _pop_async_request(self, msg_id, msg_name):
         """Pop the set of callbacks for a request.
@@ -1118,10 +1383,13 @@ class AsyncClient(DeviceClient):
         assert get_thread_ident() == self.ioloop_thread_id
         if msg_id is None:
             msg_id = self._msg_id_for_name(msg_name)
-        if msg_id in self._async_queue:
-            callback_tuple = self._async_queue[msg_id]
-            del self._async_queue[msg_id]
-            self._async_id_stack[callback_tuple[0].name].remove(msg_id)
+        callback_tuple = self._async_queue.pop(msg_id, None)
+        if callback_tuple is not None:
+            msg_name = callback_tuple[0].name
+            msg_ids = self._async_id_stack[msg_name]
+            del msg_ids[msg_id]
+            if not msg_ids:
+                del self._async_id_stack[msg_name]
             return callback_tuple
         else:
             return None, None, None, None, None
@@ -1146,8 +1414,59 @@ class AsyncClient(DeviceClient):
         Return None if no message id exists.
 
         """
-        if msg_name in self._async_id_stack and self._async_id_stack[msg_name]:
-            return self._async_id_stack[msg_name][0]
+        msg_ids = self._async_id_stack.get(msg_name)
+        if msg_ids:
+            return next(iter(msg_ids))
+
+    def _add_request_timeout(self, msg_id, timeout):
+        """Time out a pending request after `timeout` seconds.
+
+        Return the deadline of the request.
+
+        """
+        heap = self._timeout_heap
+        if len(heap) > 2 * len(self._async_queue) + 64:
+            # Mostly entries of requests that have already been replied to
+            heap[:] = [entry for entry in heap
+                       if self._request_deadline(entry[1]) == entry[0]]
+            heapq.heapify(heap)
+        start_time = self.ioloop.time()
+        deadline = start_time + timeout
+        heapq.heappush(heap, (deadline, msg_id, start_time))
+        self._schedule_timeout_sweep(deadline)
+        return deadline
+
+    def _request_deadline(self, msg_id):
+        """Deadline of a pending request, or None if there is none."""
+        callback_tuple = self._async_queue.get(msg_id)
+        if callback_tuple is not None:
+            return callback_tuple[-1]
+
+    def _schedule_timeout_sweep(self, sweep_time):
+        """Make sure that a timeout sweep happens no later than `sweep_time`."""
+        if self._timeout_sweep_handle is not None:
+            if self._timeout_sweep_time <= sweep_time:
+                return
+            self.ioloop.remove_timeout(self._timeout_sweep_handle)
+        self._timeout_sweep_time = sweep_time
+        self._timeout_sweep_handle = self.ioloop.call_at(
+            sweep_time, self._sweep_timeouts)
+
+    def _sweep_timeouts(self):
+        """Time out all the pending requests whose deadlines have passed."""
+        self._timeout_sweep_handle = None
+        self._timeout_sweep_time = None
+        heap = self._timeout_heap
+        now = self.ioloop.time()
+        while heap and heap[0][0] <= now:
+            deadline, msg_id, start_time = heapq.heappop(heap)
+            # Skip requests that have been replied to, and requests that have
+            # since reused the message id with a different deadline
+            if self._request_deadline(msg_id) == deadline:
+                self._handle_timeout(msg_id, start_time)
+        if heap:
+            self._schedule_timeout_sweep(
+                max(heap[0][0], now + self.TIMEOUT_RESOLUTION))
 
     @make_threadsafe
     def callback_request(self, msg, reply_cb=None, inform_cb=None,
@@ -1181,13 +1500,12 @@ class AsyncClient(DeviceClient):
         mid = self._get_mid_and_update_msg(msg, use_mid)
 
         if timeout is None:  # deal with 'no timeout', i.e. None
-            timeout_handle = None
+            deadline = None
         else:
-            timeout_handle = self.ioloop.call_later(
-                timeout, partial(self._handle_timeout, mid, self.ioloop.time()))
+            deadline = self._add_request_timeout(mid, timeout)
 
         self._push_async_request(
-            mid, msg, reply_cb, inform_cb, user_data, timeout_handle)
+            mid, msg, reply_cb, inform_cb, user_data, deadline)
 
         try:
             self.send_request(msg)
@@ -1239,6 +1557,115 @@ class AsyncClient(DeviceClient):
             f.set_exc_info(sys.exc_info())
         return f
 
+    def future_requests(self, msgs, window=None, timeout=None, use_mid=None):
+        """Send many request messages, with future replies.
+
+        The requests are written to the stream in batches, with a single
+        write per batch, keeping up to `window` requests outstanding at a
+        time. The window is refilled once at least half of its requests have
+        been replied to. Must be called from the ioloop.
+
+        Parameters
+        ----------
+        msgs : iterable of Message objects
+            The request Messages to send.
+        window : int or None, optional
+            Maximum number of requests waiting for replies at any time. All
+            the requests are sent at once if None.
+        timeout : float in seconds
+            How long to wait for each reply, starting from when the request is
+            sent. The default is the timeout set when creating the
+            AsyncClient.
+        use_mid : boolean, optional
+            Whether to use message IDs. Default is to use message IDs
+            if the server supports them.
+
+        Returns
+        -------
+        futures : list of tornado.concurrent.Future objects
+            One future per request, in the same order as `msgs`, each of which
+            resolves like the future returned by :meth:`future_request`.
+
+        """
+        assert get_thread_ident() == self.ioloop_thread_id
+        if timeout is None:
+            timeout = self._request_timeout
+        if window is not None and window < 1:
+            raise ValueError('Request window must be at least 1')
+
+        futures = []
+        pending = deque()
+        for msg in msgs:
+            f = tornado_Future()
+            futures.append(f)
+            pending.append((msg, f))
+        outstanding = [0]
+        send_scheduled = [False]
+
+        def reply_cb(msg, f, informs):
+            if not f.done():
+                f.set_result((msg, informs))
+            outstanding[0] -= 1
+            # Refill the window once it is half empty, after handling the rest
+            # of the replies that have already arrived, to send larger batches
+            if (pending and not send_scheduled[0] and
+                    outstanding[0] <= window // 2):
+                send_scheduled[0] = True
+                self.ioloop.add_callback(send_batch)
+
+        def inform_cb(msg, f, informs):
+            informs.append(msg)
+
+        def send_batch():
+            send_scheduled[0] = False
+            batch = []
+            while pending and (window is None or outstanding[0] < window):
+                msg, f = pending.popleft()
+                outstanding[0] += 1
+                batch.append((msg, (f, [])))
+            try:
+                self._send_request_batch(batch, reply_cb, inform_cb,
+                                         timeout, use_mid)
+            except Exception:
+                exc_info = sys.exc_info()
+                for _msg, (f, _informs) in batch:
+                    if not f.done():
+                        f.set_exc_info(exc_info)
+
+        send_batch()
+        return futures
+
+    def _send_request_batch(self, batch, reply_cb, inform_cb, timeout,
+                            use_mid):
+        """Send (msg, user_data) requests with the same callbacks at once."""
+        msgs = []
+        for msg, user_data in batch:
+            mid = self._get_mid_and_update_msg(msg, use_mid)
+            if timeout is None:
+                deadline = None
+            else:
+                deadline = self._add_request_timeout(mid, timeout)
+            self._push_async_request(
+                mid, msg, reply_cb, inform_cb, user_data, deadline)
+            assert(msg.mtype == Message.REQUEST)
+            if msg.mid and not self._server_supports_ids:
+                self._fail_unsent_request(
+                    msg, mid, 'Message IDs not supported by server')
+            else:
+                msgs.append((msg, mid))
+        if not msgs:
+            return
+        try:
+            self.send_messages([msg for msg, mid in msgs])
+        except KatcpClientError, e:
+            for msg, mid in msgs:
+                self._fail_unsent_request(msg, mid, str(e))
+
+    def _fail_unsent_request(self, msg, mid, reason):
+        error_reply = Message.request(msg.name, "fail", reason)
+        error_reply.mid = mid
+        self.handle_reply(error_reply)
+
     def blocking_request(self, msg, timeout=None, use_mid=None):
         """Send a request messsage and wait for its reply.
 
@@ -1313,14 +1740,19 @@ class AsyncClient(DeviceClient):
         # this may also result in inform_cb being None if no
         # inform_cb was passed to the request method.
         if msg.mid is not None:
-            _request, _reply_cb, inform_cb, user_data, _timeout_handle = \
-                self._peek_async_request(msg.mid, None)
+            msg_id = msg.mid
+            request, _reply_cb, inform_cb, user_data, _deadline = \
+                self._peek_async_request(msg_id, None)
         else:
-            request, _reply_cb, inform_cb, user_data, _timeout_handle = \
-                self._peek_async_request(None, msg.name)
+            msg_id = self._msg_id_for_name(msg.name)
+            request, _reply_cb, inform_cb, user_data, _deadline = \
+                self._peek_async_request(msg_id, None)
             if request is not None and request.mid is not None:
                 # we sent a mid but this inform doesn't have one
-                inform_cb, user_data = None, None
+                request, inform_cb, user_data = None, None, None
+
+        if request is not None and self.request_telemetry is not None:
+            self.request_telemetry.inform_received(msg_id, msg)
 
         if inform_cb is None:
             inform_cb = super(AsyncClient, self).handle_inform
@@ -1340,7 +1772,7 @@ class AsyncClient(DeviceClient):
                                (msg.name, reason))
 
     def _do_fail_callback(
-            self, reason, msg, reply_cb, inform_cb, user_data, timeout_handle):
+            self, reason, msg, reply_cb, inform_cb, user_data, deadline):
         """Do callback for a failed request."""
         # this may also result in reply_cb being None if no
         # reply_cb was passed to the request method
@@ -1372,7 +1804,7 @@ class AsyncClient(DeviceClient):
             The name of the reply which was expected.
 
         """
-        msg, reply_cb, inform_cb, user_data, timeout_handle = \
+        msg, reply_cb, inform_cb, user_data, deadline = \
             self._pop_async_request(msg_id, None)
         # We may have been racing with the actual reply handler if the reply
         # arrived close to the timeout expiry,
@@ -1381,13 +1813,15 @@ class AsyncClient(DeviceClient):
         #
         # NM 2014-09-17 Not sure if this is true after porting to tornado,
         # but I'm too afraid to remove this code :-/
-        if timeout_handle is None:
+        if msg is None:
             return
+        if self.request_telemetry is not None:
+            self.request_telemetry.request_timed_out(msg_id)
 
         reason = "Request {0.name} timed out after {1:f} seconds.".format(
             msg, self.ioloop.time() - start_time)
         self._do_fail_callback(
-            reason, msg, reply_cb, inform_cb, user_data, timeout_handle)
+            reason, msg, reply_cb, inform_cb, user_data, deadline)
 
     def handle_reply(self, msg):
         """Handle a reply message related to the current request.
@@ -1404,20 +1838,23 @@ class AsyncClient(DeviceClient):
         # this may also result in reply_cb being None if no
         # reply_cb was passed to the request method
         if msg.mid is not None:
-            _request, reply_cb, _inform_cb, user_data, timeout_handle = \
-                self._pop_async_request(msg.mid, None)
+            msg_id = msg.mid
+            request, reply_cb, _inform_cb, user_data, _deadline = \
+                self._pop_async_request(msg_id, None)
         else:
-            request, _reply_cb, _inform_cb, _user_data, timeout_handle = \
-                self._peek_async_request(None, msg.name)
+            msg_id = self._msg_id_for_name(msg.name)
+            request, _reply_cb, _inform_cb, _user_data, _deadline = \
+                self._peek_async_request(msg_id, None)
             if request is not None and request.mid is None:
                 # we didn't send a mid so this is the request we want
-                _request, reply_cb, _inform_cb, user_data, timeout_handle = \
-                    self._pop_async_request(None, msg.name)
+                request, reply_cb, _inform_cb, user_data, _deadline = \
+                    self._pop_async_request(msg_id, None)
             else:
-                reply_cb, user_data = None, None
+                request, reply_cb, user_data = None, None, None
 
-        if timeout_handle is not None:
-            self.ioloop.remove_timeout(timeout_handle)
+        if request is not None and self.request_telemetry is not None:
+            self.request_telemetry.reply_received(msg_id, msg,
+                                                  self.ioloop.time())
 
         if reply_cb is None:
             reply_cb = super(AsyncClient, self).handle_reply
@@ -1442,12 +1879,11 @@ class AsyncClient(DeviceClient):
         super(AsyncClient, self).stop(*args, **kwargs)
 
     def _fail_waiting_requests(self, reason):
+        if self.request_telemetry is not None:
+            for msg_id in self._async_queue:
+                self.request_telemetry.request_abandoned(msg_id)
         # Fail all requests that have not yet received their replies
         for request_data in self._async_queue.values():
-            # Last one should be timeout handle
-            timeout_handle = request_data[-1]
-            if timeout_handle is not None:
-                self.ioloop.remove_timeout(timeout_handle)
             # Do add_callback to prevent callback functions from scheduling
             # new requests before we call _reset_async_requests()
             self.ioloop.add_callback(self._do_fail_callback, reason,
@@ -10,13 +10,14 @@ from __future__ import division, print_function, absolute_import
 
 import re
 import sys
+import bisect
 import time
 import warnings
 import logging
 
 import tornado
 
-from collections import namedtuple, defaultdict
+from collections import namedtuple, defaultdict, Mapping, MutableMapping
 from functools import wraps, partial
 
 from concurrent.futures import Future, TimeoutError
@@ -253,11 +254,15 @@ class Message(object):
     # @brief List of string message arguments.
 
     ## @brief Attempt to optimize messages by specifying attributes up front
-    __slots__ = ["mtype", "name", "mid", "arguments"]
+    __slots__ = ["mtype", "name", "mid", "arguments", "_wire_cache"]
+
+    ## @brief Attributes that define the message content, used for comparisons
+    _CONTENT_ATTRS = ("mtype", "name", "mid", "arguments")
 
     def __init__(self, mtype, name, arguments=None, mid=None):
         self.mtype = mtype
         self.name = name
+        self._wire_cache = None
 
         if mid is None:
             self.mid = None
@@ -292,6 +297,36 @@ class Message(object):
                                    "alphabetic character (got %r)."
                                    % (name,))
 
+    @classmethod
+    def trusted(cls, mtype, name, arguments=None, mid=None):
+        """Create a Message from parts that are already known to be valid.
+
+        Unlike the normal constructor no validation of the message type, name
+        or id is done and the arguments are used as is, without formatting.
+        Only use this if the parts come from a trusted source, e.g. the
+        MessageParser, that has already checked them.
+
+        Parameters
+        ----------
+        mtype : Message type constant
+            The message type (request, reply or inform).
+        name : str
+            The message name.
+        arguments : list of str
+            The message arguments, already formatted as strings. The list is
+            used directly and not copied.
+        mid : str or None
+            The message identifier, digits only.
+
+        """
+        msg = cls.__new__(cls)
+        msg.mtype = mtype
+        msg.name = name
+        msg.mid = mid
+        msg.arguments = arguments if arguments is not None else []
+        msg._wire_cache = None
+        return msg
+
     def format_argument(self, arg):
         """Format a Message argument to a string"""
         if isinstance(arg, float):
@@ -321,6 +356,35 @@ class Message(object):
            The message encoded as a ASCII string.
 
         """
+        return self.to_wire()[:-1]
+
+    def to_wire(self):
+        """Return Message serialized for transmission, including the newline.
+
+        The serialized message is cached, so that sending the same message
+        more than once (e.g. to all connected clients) only escapes the
+        arguments once. The cache is discarded if the message type, name or
+        id change, or if a new arguments list is assigned. Changes made to
+        the arguments list in place are not detected, so treat the
+        arguments of a message as immutable once it has been serialized.
+
+        Returns
+        -------
+        wire : str
+           The message encoded as a ASCII string terminated by a newline.
+
+        """
+        cache = self._wire_cache
+        if (cache is None or cache[0] != self.mid or
+                cache[1] is not self.arguments or cache[2] != self.name or
+                cache[3] != self.mtype):
+            cache = self._wire_cache = (self.mid, self.arguments,
+                                        self.name, self.mtype,
+                                        self._serialize() + "\n")
+        return cache[4]
+
+    def _serialize(self):
+        """Escape and join the message parts, without the newline."""
         if self.arguments:
             escaped_args = [self.ESCAPE_RE.sub(self._escape_match, x)
                             for x in self.arguments]
@@ -355,7 +419,7 @@ class Message(object):
     def __eq__(self, other):
         if not isinstance(other, Message):
             return NotImplemented
-        for name in self.__slots__:
+        for name in self._CONTENT_ATTRS:
             if getattr(self, name) != getattr(other, name):
                 return False
         return True
@@ -496,6 +560,10 @@ class MessageParser(object):
     NAME_RE = re.compile(
         r"^(?P<name>[a-zA-Z][a-zA-Z0-9\-]*)(\[(?P<id>[0-9]+)\])?$")
 
+    ## @brief Regular expression matching characters that prevent the use of
+    #  the fast parsing path (escapes and unescaped specials)
+    SLOW_PATH_RE = re.compile(r"[\\\0\n\r\x1b]")
+
     def _unescape_match(self, match):
         """Given an re.Match, unescape the escape code it represents."""
         char = match.group(1)
@@ -538,15 +606,23 @@ class MessageParser(object):
 
         mtype = self.TYPE_SYMBOL_LOOKUP[type_char]
 
-        # find command and arguments name
-        # (removing possible empty argument resulting from whitespace at end
-        #  of command)
-        parts = self.WHITESPACE_RE.split(line)
-        if not parts[-1]:
-            del parts[-1]
+        if self.SLOW_PATH_RE.search(line) is None:
+            # Fast path for the common case: with no escapes or specials
+            # present the arguments are simply the whitespace separated
+            # tokens. Empty tokens result from runs of whitespace.
+            parts = [x for x in line.replace("\t", " ").split(" ") if x]
+            name = parts[0][1:]
+            arguments = parts[1:]
+        else:
+            # find command and arguments name
+            # (removing possible empty argument resulting from whitespace at
+            #  end of command)
+            parts = self.WHITESPACE_RE.split(line)
+            if not parts[-1]:
+                del parts[-1]
 
-        name = parts[0][1:]
-        arguments = [self._parse_arg(x) for x in parts[1:]]
+            name = parts[0][1:]
+            arguments = [self._parse_arg(x) for x in parts[1:]]
 
         # split out message id
         match = self.NAME_RE.match(name)
@@ -557,7 +633,8 @@ class MessageParser(object):
             raise KatcpSyntaxError("Bad message name (and possibly id) %r." %
                                    (name,))
 
-        return Message(mtype, name, arguments, mid)
+        # The name, id and arguments have all been checked above
+        return Message.trusted(mtype, name, arguments, mid)
 
 
 class ProtocolFlags(object):
@@ -572,6 +649,8 @@ class ProtocolFlags(object):
     * M - server supports multiple clients
     * I - server supports message identifiers
     * T - server provides request timeout hints via ?request-timeout-hint
+    * B - server supports setting the strategy of several sensors with a single
+      ?sensor-sampling request, given a comma-separated list of sensor names
 
     Parameters
     ----------
@@ -590,6 +669,9 @@ class ProtocolFlags(object):
     message_ids : bool
         Whether the server the version string came from supports
         message ids.
+    bulk_set_sensor_sampling : bool
+        Whether the server the version string came from supports bulk
+        ?sensor-sampling requests.
 
     """
     VERSION_RE = re.compile(r"^(?P<major>\d+)\.(?P<minor>\d+)"
@@ -602,6 +684,7 @@ class ProtocolFlags(object):
     # New proposal flag to indicate that a device supports ?request-timeout-hint
     # See CB-2051
     REQUEST_TIMEOUT_HINTS = 'T'
+    BULK_SET_SENSOR_SAMPLING = 'B'
 
     STRATEGIES_V4 = frozenset(['none', 'auto', 'period', 'event',
                                'differential'])
@@ -614,6 +697,7 @@ class ProtocolFlags(object):
         }
 
     REQUEST_TIMEOUT_HINTS_MIN_VERSION = (5, 1)
+    BULK_SET_SENSOR_SAMPLING_MIN_VERSION = (5, 1)
 
     def __init__(self, major, minor, flags):
         self.major = major
@@ -622,6 +706,8 @@ class ProtocolFlags(object):
         self.multi_client = self.MULTI_CLIENT in self.flags
         self.message_ids = self.MESSAGE_IDS in self.flags
         self.request_timeout_hints = self.REQUEST_TIMEOUT_HINTS in self.flags
+        self.bulk_set_sensor_sampling = (
+            self.BULK_SET_SENSOR_SAMPLING in self.flags)
         if self.message_ids and self.major < MID_KATCP_MAJOR:
             raise ValueError(
                 'MESSAGE_IDS is only supported in katcp v5 and newer')
@@ -631,6 +717,12 @@ class ProtocolFlags(object):
             raise ValueError(
                 'REQUEST_TIMEOUT_HINTS only suported in katcp v{}.{} and newer'
                 .format(*self.REQUEST_TIMEOUT_HINTS_MIN_VERSION))
+        version_supports_bulk = ((self.major, self.minor) >=
+                                 self.BULK_SET_SENSOR_SAMPLING_MIN_VERSION)
+        if self.bulk_set_sensor_sampling and not version_supports_bulk:
+            raise ValueError(
+                'BULK_SET_SENSOR_SAMPLING only suported in katcp v{}.{} and '
+                'newer'.format(*self.BULK_SET_SENSOR_SAMPLING_MIN_VERSION))
 
     def strategy_allowed(self, strategy):
         return strategy in self.STRATEGIES_ALLOWED_BY_MAJOR_VERSION[self.major]
@@ -815,6 +907,9 @@ class AsyncReply(Exception):
 # Only Imported here to prevent circular import issues.
 from .kattypes import Int, Float, Bool, Discrete, Lru, Str, Timestamp, Address
 
+# Shared by sensors without observers, so that only observed sensors have sets
+_NO_OBSERVERS = frozenset()
+
 class Sensor(object):
     """Instantiate a new sensor object.
 
@@ -864,6 +959,12 @@ class Sensor(object):
     # is an abstract class used only outside this module
     # pylint: disable-msg = R0902
 
+    # Large servers have many sensors, so keep their attributes out of a
+    # per-instance dict. The dict is only allocated if other attributes are set.
+    __slots__ = ('_sensor_type', '_observers', '_kattype', '_current_reading',
+                 'type', 'stype', 'name', 'description', 'units', 'params',
+                 'formatted_params', '__dict__', '__weakref__')
+
     # Type names and formatters
     #
     # Formatters take the sensor object and the value to
@@ -901,6 +1002,10 @@ class Sensor(object):
     # map type strings to types
     SENSOR_TYPE_LOOKUP = dict((v[0].name, k) for k, v in SENSOR_TYPES.items())
 
+    # kattypes without parameters are shared by all sensors of that type
+    SHARED_KATTYPES = dict((k, v[0]()) for k, v in SENSOR_TYPES.items()
+                           if v[0] is not Discrete)
+
     # Sensor status constants
     UNKNOWN, NOMINAL, WARN, ERROR, FAILURE, UNREACHABLE, INACTIVE = range(7)
 
@@ -962,7 +1067,7 @@ class Sensor(object):
         sensor_type = self.SENSOR_SHORTCUTS.get(sensor_type, sensor_type)
 
         self._sensor_type = sensor_type
-        self._observers = set()
+        self._observers = _NO_OBSERVERS
 
         typeclass, default_value = self.SENSOR_TYPES[sensor_type]
 
@@ -972,7 +1077,7 @@ class Sensor(object):
             if len(params) == 2:
                 if not params[0] <= default_value <= params[1]:
                     default_value = params[0]
-            self._kattype = typeclass()
+            self._kattype = self.SHARED_KATTYPES[sensor_type]
         elif self._sensor_type == Sensor.DISCRETE:
             default_value = params[0]
             self._kattype = typeclass(params)
@@ -982,7 +1087,7 @@ class Sensor(object):
                     'Units cannot be specified for TIMESTAMP sensors since '
                     'their units is defined by the KATCP spec as either '
                     'seconds or, for katcp versions 4 and below, milliseconds')
-            self._kattype = typeclass()
+            self._kattype = self.SHARED_KATTYPES[sensor_type]
 
         if default is not None:
             default_value = default
@@ -996,8 +1101,6 @@ class Sensor(object):
 
         self._current_reading = Reading(time.time(), initial_status,
                                         default_value)
-        self._formatter = self._kattype.pack
-        self._parser = self._kattype.unpack
         # Also Expose `type` attribute to be compatible with resource.KATCPSensor
         self.type = self.stype = self._kattype.name
 
@@ -1030,6 +1133,27 @@ class Sensor(object):
 
     del _reading_getter
 
+    # Formatter and parser set by subclasses. They are kept in the instance
+    # dict, which is only allocated for sensors that have them.
+    _formatter_override = None
+    _parser_override = None
+
+    @property
+    def _formatter(self):
+        return self._formatter_override or self._kattype.pack
+
+    @_formatter.setter
+    def _formatter(self, formatter):
+        self._formatter_override = formatter
+
+    @property
+    def _parser(self):
+        return self._parser_override or self._kattype.unpack
+
+    @_parser.setter
+    def _parser(self, parser):
+        self._parser_override = parser
+
     def __repr__(self):
         cls = self.__class__
         return "<%s.%s object name=%r at 0x%x>" % (
@@ -1260,7 +1384,10 @@ class Sensor(object):
             when the sensor value is set
 
         """
-        self._observers.add(observer)
+        observers = self._observers
+        if observers is _NO_OBSERVERS:
+            observers = self._observers = set()
+        observers.add(observer)
 
     def detach(self, observer):
         """Detach an observer from this sensor.
@@ -1272,7 +1399,8 @@ class Sensor(object):
             when the sensor value is set.
 
         """
-        self._observers.discard(observer)
+        if self._observers is not _NO_OBSERVERS:
+            self._observers.discard(observer)
 
     def notify(self, reading):
         """Notify all observers of changes to this sensor."""
@@ -1525,6 +1653,173 @@ class DefaultAttrDict(defaultdict):
     def __getattr__(self, name):
         return self[name]
 
+class LazyAttrDict(MutableMapping):
+    """
+    Similar to AttrDict but supports values that are created on first access
+
+    Keys added using :meth:`add_lazy` are reported as present, but their values
+    are only created by calling `factory(key, arg)` when first looked up, by
+    key or by attribute. Anything that needs the values (e.g. :meth:`items`,
+    `dict(d)`, comparison and repr) creates them as they are needed. If
+    `default_factory` is given, missing keys get a value created by calling it
+    without arguments, as for `collections.defaultdict`.
+
+    This is a mapping rather than a dict subclass, since dict(d) and
+    {}.update(d) read the contents of dict subclasses directly and would miss
+    the lazy keys. As with AttrDict, keys shadow methods when looked up as
+    attributes, so call methods through the class (e.g.
+    `LazyAttrDict.add_lazy(d, key)`) if arbitrary keys are used.
+
+    """
+    __slots__ = ('_factory', '_default_factory', '_values', '_lazy')
+
+    def __init__(self, factory, *args, **kwargs):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_default_factory',
+                           kwargs.pop('default_factory', None))
+        object.__setattr__(self, '_values', dict(*args, **kwargs))
+        object.__setattr__(self, '_lazy', {})
+
+    def add_lazy(self, key, arg=None):
+        """Add `key`, with its value to be created by `factory(key, arg)`"""
+        self._values.pop(key, None)
+        self._lazy[key] = arg
+
+    def discard(self, key):
+        """Remove `key` without creating its value, returning True if present"""
+        if key in self._lazy:
+            del self._lazy[key]
+            return True
+        return self._values.pop(key, self._lazy) is not self._lazy
+
+    def materialise(self):
+        """Create the values of all keys that have not been looked up yet"""
+        for key in list(self._lazy):
+            self[key]
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        if key in self._lazy:
+            value = self._factory(key, self._lazy.pop(key))
+        elif self._default_factory is not None:
+            value = self._default_factory()
+        else:
+            raise KeyError(key)
+        self._values[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._lazy.pop(key, None)
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        if not LazyAttrDict.discard(self, key):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._values or key in self._lazy
+
+    has_key = __contains__
+
+    def __iter__(self):
+        for key in self._values:
+            yield key
+        for key in list(self._lazy):
+            yield key
+
+    def __len__(self):
+        return len(self._values) + len(self._lazy)
+
+    def __getattr__(self, name):
+        # Only called for names that are not attributes, keys named like
+        # methods are handled by _KeyShadowedMethod
+        if name.startswith('__') or name in LazyAttrDict.__slots__:
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name in LazyAttrDict.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(LazyAttrDict.items(self)) == dict(other.items())
+
+    def __repr__(self):
+        return repr(dict(LazyAttrDict.items(self)))
+
+    def keys(self):
+        return list(self)
+
+    def iterkeys(self):
+        return iter(self)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self._values[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def clear(self):
+        self._values.clear()
+        self._lazy.clear()
+
+    def copy(self):
+        """Return a dict with all the values created, like AttrDict.copy()"""
+        return dict(LazyAttrDict.items(self))
+
+
+class _KeyShadowedMethod(object):
+    """Method of a LazyAttrDict that a key with the same name shadows.
+
+    Keys shadow methods when looked up as attributes, as they do in AttrDict.
+    Only the public methods pay for the check, unlike a __getattribute__
+    override that would slow down every attribute lookup.
+
+    """
+    def __init__(self, name, func):
+        self._name = name
+        self._func = func
+
+    def __get__(self, obj, cls=None):
+        if obj is not None and self._name in obj:
+            return obj[self._name]
+        return self._func.__get__(obj, cls)
+
+for _name in ('add_lazy', 'discard', 'materialise', 'keys', 'iterkeys', 'get',
+              'pop', 'setdefault', 'clear', 'copy', 'has_key', 'items',
+              'iteritems', 'values', 'itervalues', 'update', 'popitem'):
+    setattr(LazyAttrDict, _name, _KeyShadowedMethod(
+        _name, getattr(LazyAttrDict, _name).__func__))
+del _name
+
 class AsyncEvent(object):
     """tornado.concurrent.Future Event based on threading.Event API
 
@@ -1782,6 +2077,64 @@ class LatencyTimer(object):
             return True
         return False
 
+class RequestStats(object):
+    """Number, failures and latency histogram of the requests of one name.
+
+    Latencies are counted in logarithmically spaced histogram buckets, so
+    percentiles are estimated to within a factor of two.
+
+    """
+
+    LATENCY_BUCKETS = tuple(1e-5 * 2**i for i in range(24))
+    """Upper bounds in seconds of the latency histogram buckets"""
+
+    __slots__ = ('count', 'failures', 'total_latency', 'max_latency',
+                 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        # The last bucket counts latencies beyond the largest bound
+        self.histogram = [0] * (len(self.LATENCY_BUCKETS) + 1)
+
+    def add(self, latency, failed):
+        """Count a request that was replied to after latency seconds."""
+        self.count += 1
+        if failed:
+            self.failures += 1
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+        self.histogram[bisect.bisect_left(self.LATENCY_BUCKETS, latency)] += 1
+
+    def percentile(self, percent):
+        """Estimate the latency within which percent of requests were replied.
+
+        This is the upper bound of the histogram bucket containing the
+        percentile, limited to the largest latency seen. Returns 0.0 if no
+        requests have been counted.
+
+        """
+        target = self.count * percent / 100
+        seen = 0
+        for bound, count in zip(self.LATENCY_BUCKETS, self.histogram):
+            seen += count
+            if seen and seen >= target:
+                return min(bound, self.max_latency)
+        return self.max_latency
+
+    def summary(self):
+        """Dict of the count, failures and latency statistics in seconds."""
+        return dict(count=self.count, failures=self.failures,
+                    latency_mean=(self.total_latency / self.count
+                                  if self.count else 0.0),
+                    latency_p50=self.percentile(50),
+                    latency_p99=self.percentile(99),
+                    latency_max=self.max_latency)
+
+
 def hashable_identity(obj):
 
     """Generate a hashable ID that is stable for methods etc
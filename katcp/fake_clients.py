@@ -323,6 +323,9 @@ class FakeKATCPServer(object):
         f.set_result(None)
         return f
 
+    def set_send_hook(self, conn_id, hook):
+        pass
+
 class FakeClientRequestConnection(server.ClientRequestConnection):
     def __init__(self, *args, **kwargs):
         super(FakeClientRequestConnection, self).__init__(*args, **kwargs)
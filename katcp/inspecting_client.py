@@ -9,6 +9,11 @@ from __future__ import division, print_function, absolute_import
 import logging
 import random
 import copy
+import errno
+import hashlib
+import json
+import os
+import tempfile
 
 import tornado
 
@@ -125,6 +130,85 @@ class SyncError(Exception):
     """Raised if an error occurs during syncing with a device"""
 
 
+def _native_strings(obj):
+    """Convert the unicode strings in decoded JSON to str."""
+    if isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    elif isinstance(obj, list):
+        return [_native_strings(item) for item in obj]
+    elif isinstance(obj, dict):
+        return dict((_native_strings(key), _native_strings(value))
+                    for key, value in obj.items())
+    return obj
+
+
+class DeviceModelCache(object):
+    """On-disk cache of the request and sensor indexes of devices.
+
+    Each device model is stored in `directory` as a JSON file named after a
+    hash of its key. Several processes may share the same directory.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which the models are stored, created if needed.
+
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory,
+                            hashlib.sha1(key).hexdigest() + '.json')
+
+    def load(self, key):
+        """Load the model of a device.
+
+        Returns
+        -------
+        (requests_index, sensors_index) or None if the device is not cached
+
+        """
+        try:
+            with open(self._path(key)) as f:
+                model = _native_strings(json.load(f))
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        if model.get('key') != key:
+            return None
+        return model['requests'], model['sensors']
+
+    def save(self, key, requests_index, sensors_index):
+        """Store the model of a device, replacing any previous one."""
+        def strip(index):
+            # Drop request objects and change flags
+            return dict(
+                (name, dict((k, v) for k, v in data.items()
+                            if k != 'obj' and not k.startswith('_')))
+                for name, data in index.items())
+        model = {'key': key,
+                 'requests': strip(requests_index),
+                 'sensors': strip(sensors_index)}
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file first so that readers never see a
+        # partially written model
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(model, f)
+            os.rename(tmp_path, self._path(key))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+
 class _InformHookDeviceClient(katcp.AsyncClient):
     """DeviceClient that adds inform hooks."""
 
@@ -190,6 +274,17 @@ class InspectingClientAsync(object):
 
     Should be set before calling connect()/start().
 
+    """
+    model_cache = None
+    """Optional :class:`DeviceModelCache` used to sync without inspection.
+
+    If set, the device model is loaded from the cache when connecting to a
+    device that reported its katcp-device version and build state in a
+    #version-connect inform, and the device is only checked after reaching
+    the synced state. The cache is updated whenever the device is inspected.
+
+    Should be set before calling connect()/start().
+
     """
 
     # TODO (NM 2016-10-21) sync_timeout should be 5 seconds, but until we deal
@@ -198,6 +293,14 @@ class InspectingClientAsync(object):
     sync_timeout = 8
     initial_resync_timeout = 1
     max_resync_timeout = 90
+    full_resync_interval = None
+    """Seconds between checks, while synced, that the model still lists the
+    same sensors and requests as the device. If the check fails the device is
+    fully resynced, in case changes were missed. Each check requests the full
+    ?help and ?sensor-list of the device. If None (the default) no checks are
+    done. Checks only start once the device has been fully inspected (or its
+    model loaded from the cache), so not while `initial_inspection` is False
+    and only the announced interface changes have been inspected."""
 
     def __init__(self, host, port, ioloop=None, initial_inspection=None,
                  auto_reconnect=True, logger=ic_logger):
@@ -211,9 +314,24 @@ class InspectingClientAsync(object):
         self._requests_index = {}
         self._sensors_index = {}
         self._sensor_object_cache = {}
+        # KATCP major version of the server, cached for sensor updates
+        self._katcp_major = None
         self._connected = katcp.core.AsyncEvent()
         self._disconnected = katcp.core.AsyncEvent()
         self._interface_changed = katcp.core.AsyncEvent()
+        # Sensors and requests named by #interface-changed informs since the
+        # last resync, as {'sensor-list': {name: action}, 'request-list':
+        # {name: action}}, or None if everything needs to be inspected
+        self._interface_changes = None
+        # Time that the model was last fully inspected or checked
+        self._last_model_check_time = None
+        # Key of the device in the model cache, None if not yet known
+        self._model_cache_key = None
+        # Whether the model may still be loaded from the cache on this
+        # connection
+        self._model_cache_pending = False
+        # Whether the model was loaded from the cache and is not yet validated
+        self._model_from_cache = False
         # Set the default behaviour for update.
         self._update_on_lookup = True
         self._cb_register = {}  # Register to hold the possible callbacks.
@@ -229,6 +347,8 @@ class InspectingClientAsync(object):
                                       self._cb_inform_sensor_status)
         self.katcp_client.hook_inform('interface-changed',
                                       self._cb_inform_interface_change)
+        self.katcp_client.hook_inform('version-connect',
+                                      self._cb_inform_version_connect)
         self.katcp_client.hook_inform('device-changed',
                                       self._cb_inform_interface_change)
         # Hook a callback for/to deprecated informs.
@@ -406,7 +526,7 @@ class InspectingClientAsync(object):
                 if self.initial_inspection:
                     if not is_connected():
                         continue
-                    model_changes = yield self.inspect()
+                    model_changes = yield self._inspect_interface_changes()
                     model_changed = bool(model_changes)
                     self._logger.debug('{}: Sending data-synced state'
                                        .format(self.bind_address_string))
@@ -436,8 +556,28 @@ class InspectingClientAsync(object):
                         'Succesfully resynced with {} after failure'
                         .format(self.bind_address_string))
                     last_sync_failed = False
-                yield until_any(self._interface_changed.until_set(),
-                                self._disconnected.until_set())
+                if self._model_from_cache:
+                    # Check the cached model against the device while synced,
+                    # only changing state if the device has changed
+                    self._model_from_cache = False
+                    model_changes = yield self._validate_cached_model()
+                    if model_changes:
+                        yield self._send_state(
+                            connected=True, synced=False, model_changed=True,
+                            data_synced=True, model_changes=model_changes)
+                        yield self._send_state(
+                            connected=True, synced=True, model_changed=False,
+                            data_synced=True)
+                # Wait for an interface change, periodically checking that
+                # none were missed
+                while True:
+                    try:
+                        yield until_any(self._interface_changed.until_set(),
+                                        self._disconnected.until_set(),
+                                        timeout=self._model_check_delay())
+                        break
+                    except tornado.gen.TimeoutError:
+                        yield self._periodic_model_check()
                 self._logger.debug('in _state_loop: interface_changed=%s,'
                         ' is_connected=%s', self._interface_changed.is_set(),
                         self._disconnected.is_set())
@@ -589,6 +729,222 @@ class InspectingClientAsync(object):
         if model_changes:
             raise Return(model_changes)
 
+    @tornado.gen.coroutine
+    def _inspect_interface_changes(self):
+        """Inspect the changes announced since the last resync, update model
+
+        Only the sensors and requests named by #interface-changed informs are
+        inspected, unless a full inspection is needed because no names were
+        given, the client reconnected, the periodic model check failed or the
+        previous inspection found changes that did not match the announced
+        ones.
+
+        Returns
+        -------
+
+        Tornado future that resolves with model_changes as for :meth:`inspect`
+
+        """
+        changes = self._interface_changes
+        self._interface_changes = {'sensor-list': {}, 'request-list': {}}
+        now = self.ioloop.time()
+        # Changes may also have been flagged without naming any items
+        if changes is None or not any(changes.values()):
+            model_from_cache = False
+            try:
+                if self.model_cache is not None and self._model_cache_pending:
+                    self._model_cache_pending = False
+                    model_from_cache, model_changes = self._load_cached_model()
+                if not model_from_cache:
+                    model_changes = yield self.inspect()
+            except Exception:
+                self._interface_changes = None
+                raise
+            self._last_model_check_time = now
+            if model_from_cache:
+                self._model_from_cache = True
+            else:
+                self._save_cached_model()
+            raise Return(model_changes)
+
+        timeout_manager = future_timeout_manager(self.sync_timeout)
+        model_changes = AttrDict()
+        try:
+            for inform_type, names in sorted(changes.items()):
+                key, inspect_item, index = {
+                    'request-list': ('requests', self.inspect_requests,
+                                     self._requests_index),
+                    'sensor-list': ('sensors', self.inspect_sensors,
+                                    self._sensors_index)}[inform_type]
+                for name, action in sorted(names.items()):
+                    item_changes = yield inspect_item(
+                        name, timeout=timeout_manager.remaining())
+                    # Sanity check that the device changed as announced
+                    if (name in index) != (action != 'removed'):
+                        raise SyncError(
+                            'Device {} reported {} {} {} but inspection '
+                            'disagrees'.format(self.bind_address_string,
+                                               inform_type, name, action))
+                    if item_changes:
+                        changes_so_far = model_changes.setdefault(
+                            key, AttrDict(added=set(), removed=set()))
+                        changes_so_far.added |= item_changes.added
+                        changes_so_far.removed |= item_changes.removed
+        except Exception:
+            # The index may only be partly updated, so inspect everything
+            self._interface_changes = None
+            raise
+        if model_changes:
+            self._save_cached_model()
+            raise Return(model_changes)
+
+    def _model_check_delay(self):
+        """Seconds until the next periodic model check is due, or None.
+
+        None means that no check is due, because periodic checks are disabled
+        or the indexes were never fully populated.
+
+        """
+        if (self.full_resync_interval is None or
+                self._last_model_check_time is None):
+            return None
+        now = self.ioloop.time()
+        return max(self._last_model_check_time + self.full_resync_interval -
+                   now, 0.001)
+
+    @tornado.gen.coroutine
+    def _periodic_model_check(self):
+        """Check the model against the device while synced.
+
+        If the check fails a full resync is flagged, as if the device had sent
+        an #interface-changed inform without arguments.
+
+        """
+        try:
+            model_matches = yield self._check_model()
+        except Exception:
+            self._interface_changes = None
+            raise
+        self._last_model_check_time = self.ioloop.time()
+        if not model_matches:
+            self._logger.warn('{}: Model does not match the device, doing a '
+                              'full resync'.format(self.bind_address_string))
+            self._interface_changes = None
+            self._interface_changed.set()
+
+    @tornado.gen.coroutine
+    def _check_model(self):
+        """Check that the model lists the same requests and sensors as the device.
+
+        Only the names listed by ?help and ?sensor-list are compared with the
+        request and sensor indexes, which is much cheaper than :meth:`inspect`
+        since no timeout hints are requested and the indexes are not updated.
+
+        Returns
+        -------
+
+        Tornado future that resolves with True if the names match
+
+        """
+        timeout_manager = future_timeout_manager(self.sync_timeout)
+        for request, index in (('help', self._requests_index),
+                               ('sensor-list', self._sensors_index)):
+            reply, informs = yield self.katcp_client.future_request(
+                katcp.Message.request(request),
+                timeout=timeout_manager.remaining())
+            if not reply.reply_ok():
+                raise SyncError('Error reply while checking model of {}: {}'
+                                .format(self.bind_address_string, reply))
+            if len(informs) != len(index):
+                raise Return(False)
+            for inform in informs:
+                if inform.arguments[0] not in index:
+                    raise Return(False)
+        raise Return(True)
+
+    def _load_cached_model(self):
+        """Update the request and sensor indexes from the model cache.
+
+        Returns
+        -------
+        (loaded, model_changes)
+        loaded : bool
+            Whether the device was found in the model cache
+        model_changes : Nested AttrDict or None
+            As returned by :meth:`inspect`
+
+        """
+        cached = None
+        if self._model_cache_key:
+            try:
+                cached = self.model_cache.load(self._model_cache_key)
+            except Exception:
+                self._logger.warn('Could not load cached model of {}'
+                                  .format(self.bind_address_string),
+                                  exc_info=True)
+        if cached is None:
+            return False, None
+
+        requests_index, sensors_index = cached
+        model_changes = AttrDict()
+        for key, index, cached_index in (
+                ('requests', self._requests_index, requests_index),
+                ('sensors', self._sensors_index, sensors_index)):
+            index_keys = set(index.keys())
+            for name, data in cached_index.items():
+                self._update_index(index, name, data)
+            added, removed = self._difference(
+                index_keys, cached_index.keys(), None, index)
+            if added or removed:
+                model_changes[key] = AttrDict(added=added, removed=removed)
+        if 'sensors' in model_changes:
+            for sensor_name in model_changes.sensors.removed:
+                self._sensor_object_cache.pop(sensor_name, None)
+        self._logger.debug('{}: Loaded cached model'
+                           .format(self.bind_address_string))
+        return True, model_changes or None
+
+    def _save_cached_model(self):
+        """Store the request and sensor indexes in the model cache."""
+        if self.model_cache is None or not self._model_cache_key:
+            return
+        try:
+            self.model_cache.save(self._model_cache_key,
+                                  self._requests_index, self._sensors_index)
+        except Exception:
+            self._logger.warn('Could not save cached model of {}'
+                              .format(self.bind_address_string),
+                              exc_info=True)
+
+    @tornado.gen.coroutine
+    def _validate_cached_model(self):
+        """Check the device after syncing from the model cache.
+
+        The device is only inspected if :meth:`_check_model` finds that the
+        cached model does not list the same requests and sensors.
+
+        Returns
+        -------
+
+        Tornado future that resolves with the model_changes that were not in
+        the cached model, as for :meth:`inspect`
+
+        """
+        try:
+            model_matches = yield self._check_model()
+            model_changes = None
+            if not model_matches:
+                model_changes = yield self.inspect()
+        except Exception:
+            self._interface_changes = None
+            raise
+        self._last_model_check_time = self.ioloop.time()
+        if model_changes:
+            self._logger.info('{}: Cached model was out of date'
+                              .format(self.bind_address_string))
+            self._save_cached_model()
+        raise Return(model_changes)
+
     @tornado.gen.coroutine
     def inspect_requests(self, name=None, timeout=None):
         """Inspect all or one requests on the device. Update requests index.
@@ -641,7 +997,12 @@ class InspectingClientAsync(object):
         else:
             timeout_hints = {}
 
-        requests_old = set(self._requests_index.keys())
+        if name is None:
+            requests_old = set(self._requests_index.keys())
+        else:
+            # Only the named request can change, so don't copy the whole index
+            requests_old = (set([name]) if name in self._requests_index
+                            else set())
         requests_updated = set()
         for msg in informs:
             req_name = msg.arguments[0]
@@ -747,7 +1108,12 @@ class InspectingClientAsync(object):
                                 .format(reply))
 
 
-        sensors_old = set(self._sensors_index.keys())
+        if name is None or name.startswith('/'):
+            sensors_old = set(self._sensors_index.keys())
+        else:
+            # Only the named sensor can change, so don't copy the whole index
+            sensors_old = (set([name]) if name in self._sensors_index
+                           else set())
         sensors_updated = set()
         for msg in informs:
             sen_name = msg.arguments[0]
@@ -829,25 +1195,42 @@ class InspectingClientAsync(object):
         obj = None
         exist = yield self.future_check_sensor(name, update)
         if exist:
-            sensor_info = self._sensors_index[name]
-            obj = sensor_info.get('obj')
-            if obj is None:
-                sensor_type = katcp.Sensor.parse_type(
-                    sensor_info.get('sensor_type'))
-                sensor_params = katcp.Sensor.parse_params(
-                    sensor_type,
-                    sensor_info.get('params'))
-                obj = self.sensor_factory(
-                    name=name,
-                    sensor_type=sensor_type,
-                    description=sensor_info.get('description'),
-                    units=sensor_info.get('units'),
-                    params=sensor_params)
-                self._sensors_index[name]['obj'] = obj
-                self._sensor_object_cache[name] = obj
+            obj = self.get_sensor_object(name)
 
         raise tornado.gen.Return(obj)
 
+    def get_sensor_object(self, name):
+        """Get the sensor object for a sensor that is already known.
+
+        Unlike :meth:`future_get_sensor` this neither waits for
+        synchronisation nor inspects the server, so the object can be created
+        on demand from synchronous code.
+
+        Returns
+        -------
+        Sensor created by :meth:`sensor_factory` or None if sensor not known.
+
+        """
+        sensor_info = self._sensors_index.get(name)
+        if sensor_info is None:
+            return None
+        obj = sensor_info.get('obj')
+        if obj is None:
+            sensor_type = katcp.Sensor.parse_type(
+                sensor_info.get('sensor_type'))
+            sensor_params = katcp.Sensor.parse_params(
+                sensor_type,
+                sensor_info.get('params'))
+            obj = self.sensor_factory(
+                name=name,
+                sensor_type=sensor_type,
+                description=sensor_info.get('description'),
+                units=sensor_info.get('units'),
+                params=sensor_params)
+            sensor_info['obj'] = obj
+            self._sensor_object_cache[name] = obj
+        return obj
+
     @tornado.gen.coroutine
     def future_check_request(self, name, update=None):
         """Check if the request exists.
@@ -908,26 +1291,54 @@ class InspectingClientAsync(object):
         obj = None
         exist = yield self.future_check_request(name, update)
         if exist:
-            request_info = self._requests_index[name]
-            obj = request_info.get('obj')
-            if obj is None:
-                obj = self.request_factory(**request_info)
-                self._requests_index[name]['obj'] = obj
+            obj = self.get_request_object(name)
 
         raise tornado.gen.Return(obj)
 
-    @tornado.gen.coroutine
+    def get_request_object(self, name):
+        """Get the request object for a request that is already known.
+
+        Unlike :meth:`future_get_request` this neither waits for
+        synchronisation nor inspects the server.
+
+        Returns
+        -------
+        Request created by :meth:`request_factory` or None if request not
+        known.
+
+        """
+        request_info = self._requests_index.get(name)
+        if request_info is None:
+            return None
+        obj = request_info.get('obj')
+        if obj is None:
+            obj = self.request_factory(**request_info)
+            request_info['obj'] = obj
+        return obj
+
     def update_sensor(self, name, timestamp, status, value):
+        """Update a sensor object with a reading received from the server.
+
+        Readings of sensors with cached objects (the common case) are handled
+        synchronously, returning None. Otherwise the sensor object is first
+        created by :meth:`future_get_sensor`, and a future is returned that
+        resolves once the reading has been applied.
+
+        """
         sensor = self._sensor_object_cache.get(name)
-        # TODO (NM) Performance improvement idea: Make this a normal function
-        # that only handles the cached sensor object case (should be the common
-        # case). If cached sensor is not found, kick off a coroutine that
-        # handles the future_get_sensor case.
-        if not sensor:
-            sensor = yield self.future_get_sensor(name)
         if sensor:
-            # TODO (NM) Performance idea: prolly we can cache katcp_major at
-            # sync time?
+            katcp_major = self._katcp_major
+            if katcp_major is None:
+                katcp_major = self._katcp_major = (
+                    self.katcp_client.protocol_flags.major)
+            sensor.set_formatted(timestamp, status, value, katcp_major)
+        else:
+            return self._update_uncached_sensor(name, timestamp, status, value)
+
+    @tornado.gen.coroutine
+    def _update_uncached_sensor(self, name, timestamp, status, value):
+        sensor = yield self.future_get_sensor(name)
+        if sensor:
             katcp_major = self.katcp_client.protocol_flags.major
             sensor.set_formatted(timestamp, status, value, katcp_major)
         else:
@@ -935,6 +1346,14 @@ class InspectingClientAsync(object):
                                ' sensor object.' % name)
 
     def _cb_connection_state(self, connected):
+        # The protocol version is only known once #version-connect arrives
+        self._katcp_major = None
+        # Changes may have been missed while disconnected
+        self._interface_changes = None
+        # The device may have been replaced while disconnected
+        self._model_cache_key = None
+        self._model_cache_pending = connected
+        self._model_from_cache = False
         if connected:
             self._disconnected.clear()
             self._connected.set()
@@ -953,9 +1372,42 @@ class InspectingClientAsync(object):
             value = msg.arguments[4 + n * 3]
             self.update_sensor(name, timestamp, status, value)
 
+    def _cb_inform_version_connect(self, msg):
+        """Key the model cache on the katcp-device version and build state."""
+        if msg.arguments and msg.arguments[0] == 'katcp-device':
+            self._model_cache_key = ' '.join([self.bind_address_string] +
+                                             msg.arguments[1:])
+
+    _INTERFACE_CHANGE_TYPES = ('request-list', 'sensor-list')
+    _INTERFACE_CHANGE_ACTIONS = ('added', 'removed', 'modified')
+
     def _cb_inform_interface_change(self, msg):
-        """Update the sensors and requests available."""
+        """Update the sensors and requests available.
+
+        Informs with (type, name, action) arguments, e.g.
+        ``#interface-changed sensor-list a.sensor added``, only cause the
+        named sensors or requests to be inspected. Any other informs cause
+        everything to be inspected.
+
+        """
         self._logger.debug('cb_inform_interface_change(%s)', msg)
+        args = msg.arguments
+        changes = []
+        if args and len(args) % 3 == 0:
+            for i in range(0, len(args), 3):
+                inform_type, name, action = args[i:i + 3]
+                if (inform_type not in self._INTERFACE_CHANGE_TYPES or
+                        action not in self._INTERFACE_CHANGE_ACTIONS):
+                    changes = None
+                    break
+                changes.append((inform_type, name, action))
+        else:
+            changes = None
+        if changes is None:
+            self._interface_changes = None
+        elif self._interface_changes is not None:
+            for inform_type, name, action in changes:
+                self._interface_changes[inform_type][name] = action
         self._interface_changed.set()
 
     def _cb_inform_deprecated(self, msg):
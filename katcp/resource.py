@@ -4,10 +4,12 @@ from __future__ import division, print_function, absolute_import
 
 import abc
 import sys
+import time
 import collections
 import logging
 
 import tornado
+import tornado.ioloop
 
 from tornado.gen import Return, with_timeout
 from tornado.concurrent import Future
@@ -584,6 +586,151 @@ class KATCPSensorsManager(object):
         """
 
 
+def _call_listener(sensor, listener, use_reading, reading):
+    try:
+        if use_reading:
+            listener(sensor, reading)
+        else:
+            listener(reading.received_timestamp, reading.timestamp,
+                     reading.status, reading.value)
+    except Exception:
+        logger.exception(
+            'Unhandled exception calling KATCPSensor callback {0!r}'
+            .format(listener))
+
+
+def _listener_name(listener):
+    """Name of the code of a listener, used to gather its timing statistics"""
+    func = getattr(listener, '__func__', listener)
+    name = getattr(func, '__name__', None)
+    if name is None:
+        # Some other callable object, e.g. a functools.partial
+        func = type(listener)
+        name = func.__name__
+    owner = getattr(listener, '__self__', None)
+    if owner is not None:
+        name = type(owner).__name__ + '.' + name
+    module = getattr(func, '__module__', None)
+    return module + '.' + name if module else name
+
+
+class ListenerStats(collections.namedtuple(
+        'ListenerStats', 'calls total_time max_time')):
+    """Time spent in a listener called by a :class:`ListenerDispatcher`
+
+    Fields
+    ------
+    calls : int
+        Number of times the listener has been called.
+    total_time : float
+        Total time spent in the listener, in seconds.
+    max_time : float
+        Longest time spent in a single call of the listener, in seconds.
+    """
+
+
+class ListenerDispatcher(object):
+    """Coalesces calls of KATCPSensor listeners per ioloop iteration
+
+    Sensors created with a dispatcher hand their readings to it instead of
+    calling their listeners immediately. At the end of the ioloop iteration
+    in which readings arrive, the listeners of each updated sensor are called
+    once with its latest reading, so readings superseded within the same
+    iteration are not seen by listeners. Listeners registered with
+    `immediate=True` (e.g. those of :meth:`KATCPSensor.wait`) are still called
+    with every reading as it arrives. Batch listeners are called once per
+    iteration with all the updates.
+
+    The time spent in listeners is measured per listener function or method,
+    see :meth:`listener_stats`.
+
+    Parameters
+    ----------
+    ioloop : tornado.ioloop.IOLoop instance or None
+        IOLoop used to call the listeners. If None, the current ioloop of the
+        thread in which the first reading arrives is used.
+    """
+
+    def __init__(self, ioloop=None):
+        self.ioloop = ioloop
+        self._pending = {}
+        self._batch_listeners = {}
+        self._listener_stats = {}
+        self._scheduled = False
+
+    def register_batch_listener(self, listener):
+        """Add a callback that is called with all the updates of an iteration
+
+        Parameters
+        ----------
+        listener : function
+            Callback signature: listener(updates) where `updates` is a dict
+            mapping each updated :class:`KATCPSensor` to its latest
+            :class:`KATCPSensorReading`.
+        """
+        self._batch_listeners[hashable_identity(listener)] = listener
+
+    def unregister_batch_listener(self, listener):
+        """Remove a callback added with :meth:`register_batch_listener`"""
+        self._batch_listeners.pop(hashable_identity(listener), None)
+
+    def listener_stats(self):
+        """Time spent in the listeners called so far
+
+        Returns
+        -------
+        stats : dict
+            Maps the name of each listener function or method, e.g.
+            'mymodule.MyClass.on_update', to its :class:`ListenerStats`. All
+            the listeners created by the same code are counted together.
+        """
+        return dict((name, ListenerStats(*stats))
+                    for name, stats in self._listener_stats.items())
+
+    def defer(self, sensor, reading):
+        """Call the listeners of `sensor` with `reading` later, unless
+        superseded by a newer reading in the meantime"""
+        self._pending[sensor] = reading
+        if not self._scheduled:
+            self._scheduled = True
+            if self.ioloop is None:
+                self.ioloop = tornado.ioloop.IOLoop.current()
+            self.ioloop.add_callback(self._dispatch)
+
+    def _dispatch(self):
+        self._scheduled = False
+        pending, self._pending = self._pending, {}
+        for sensor, reading in pending.items():
+            if sensor._listeners:
+                for listener, use_reading, immediate in (
+                        sensor._listeners.values()):
+                    if immediate:
+                        continue
+                    start = time.time()
+                    _call_listener(sensor, listener, use_reading, reading)
+                    self._record_time(listener, time.time() - start)
+        for listener in self._batch_listeners.values():
+            start = time.time()
+            try:
+                listener(pending)
+            except Exception:
+                logger.exception(
+                    'Unhandled exception calling batch listener {0!r}'
+                    .format(listener))
+            self._record_time(listener, time.time() - start)
+
+    def _record_time(self, listener, elapsed):
+        name = _listener_name(listener)
+        stats = self._listener_stats.get(name)
+        if stats is None:
+            self._listener_stats[name] = [1, elapsed, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+            if elapsed > stats[2]:
+                stats[2] = elapsed
+
+
 class KATCPSensor(object):
     """Wrapper around a specific KATCP sensor on a given KATCP device.
 
@@ -595,7 +742,14 @@ class KATCPSensor(object):
     """
     __metaclass__ = abc.ABCMeta
 
-    def __init__(self, sensor_description, sensor_manager):
+    # Clients of large devices have many sensors, so keep their attributes out
+    # of a per-instance dict. The dict is only allocated if other attributes
+    # are set.
+    __slots__ = ('_manager', '_listeners', '_reading', '_sensor', '_name',
+                 '_dispatcher', '__dict__', '__weakref__')
+
+    def __init__(self, sensor_description, sensor_manager,
+                 listener_dispatcher=None):
         """Subclasses must arrange to call this in their __init__().
 
         Parameters
@@ -605,20 +759,18 @@ class KATCPSensor(object):
            :class:`katcp.Sensor`
         sensor_manager : :class:`KATCPSensorsManager` instance
            Manages sensor strategies, allows sensor polling, and provides time
+        listener_dispatcher : :class:`ListenerDispatcher` instance or None
+           If given, listeners are called by the dispatcher at the end of the
+           ioloop iteration in which readings arrive, instead of immediately
         """
         self._manager = sensor_manager
+        self._dispatcher = listener_dispatcher
         self.clear_listeners()
         self._reading = KATCPSensorReading(0, 0, Sensor.UNKNOWN, None)
         # We'll be abusing a katcp.Sensor object slightly to make use of its
         # parsing and formatting functionality
         self._sensor = Sensor(**sensor_description)
         self._name = self._sensor.name
-        # Overide the katpc.Sensor's set method with ours
-        self._sensor.set = self.set
-        # Steal the the katcp.Sensor's set_formatted method. Since we overrode
-        # its set() method with ours, calling set_formatted will result in this
-        # KATCPSensor object's value being set.
-        self.set_formatted = self._sensor.set_formatted
 
     @property
     def parent_name(self):
@@ -730,7 +882,7 @@ class KATCPSensor(object):
         """
         return self._manager.set_sampling_strategy(self.name, strategy)
 
-    def register_listener(self, listener, reading=False):
+    def register_listener(self, listener, reading=False, immediate=False):
         """Add a callback function that is called when sensor value is updated.
         The callback footprint is received_timestamp, timestamp, status, value.
 
@@ -743,9 +895,15 @@ class KATCPSensor(object):
                 `reading` is an instance of :class:`KATCPSensorReading`
             Callback signature: default, if not reading
                 listener(received_timestamp, timestamp, status, value)
+        immediate : bool, optional
+            Call the listener with every reading as it arrives, even if the
+            sensor has a :class:`ListenerDispatcher` that would only pass on
+            the latest reading of each ioloop iteration.
         """
         listener_id = hashable_identity(listener)
-        self._listeners[listener_id] = (listener, reading)
+        if self._listeners is None:
+            self._listeners = {}
+        self._listeners[listener_id] = (listener, reading, immediate)
         logger.debug(
                     'Register listener for {}'
                     .format(self.name))
@@ -759,32 +917,35 @@ class KATCPSensor(object):
             Reference to the callback function that should be removed
 
         """
-        listener_id = hashable_identity(listener)
-        self._listeners.pop(listener_id, None)
+        if self._listeners:
+            listener_id = hashable_identity(listener)
+            self._listeners.pop(listener_id, None)
 
     def is_listener(self, listener):
+        if not self._listeners:
+            return False
         listener_id = hashable_identity(listener)
         return listener_id in self._listeners
 
     def clear_listeners(self):
         """Clear any registered listeners to updates from this sensor."""
-        self._listeners = {}
+        # The listener dict is only allocated when a listener is registered
+        self._listeners = None
 
     def call_listeners(self, reading):
-        logger.debug(
-                    'Calling listeners {}'
-                    .format(self.name))
-        for listener, use_reading in self._listeners.values():
-            try:
-                if use_reading:
-                    listener(self, reading)
-                else:
-                    listener(reading.received_timestamp, reading.timestamp,
-                             reading.status, reading.value)
-            except Exception:
-                logger.exception(
-                    'Unhandled exception calling KATCPSensor callback {0!r}'
-                    .format(listener))
+        if self._dispatcher is not None:
+            if self._listeners:
+                for listener, use_reading, immediate in (
+                        self._listeners.values()):
+                    if immediate:
+                        _call_listener(self, listener, use_reading, reading)
+            self._dispatcher.defer(self, reading)
+            return
+        if not self._listeners:
+            return
+        logger.debug('Calling listeners %s', self._name)
+        for listener, use_reading, _immediate in self._listeners.values():
+            _call_listener(self, listener, use_reading, reading)
 
     def set(self, timestamp, status, value):
         """Set sensor with a given received value, matches :meth:`katcp.Sensor.set`"""
@@ -802,11 +963,14 @@ class KATCPSensor(object):
     def set_formatted(self, raw_timestamp, raw_status, raw_value, major):
         """Set sensor using KATCP string formatted inputs
 
-        Mirrors :meth:`katcp.Sensor.set_formatted`.
-
-        This implementation is empty. Will, during instantiation, be overridden by the
-        set_formatted() method of a katcp.Sensor object.
+        Mirrors :meth:`katcp.Sensor.set_formatted`, using the parsers of the
+        underlying katcp.Sensor object.
         """
+        sensor = self._sensor
+        timestamp = sensor.TIMESTAMP_TYPE.decode(raw_timestamp, major)
+        status = sensor.STATUS_NAMES[raw_status]
+        value = sensor.parse_value(raw_value, major)
+        self.set(timestamp, status, value)
 
     @tornado.gen.coroutine
     def get_reading(self):
@@ -920,7 +1084,8 @@ class KATCPSensor(object):
                 f.set_exc_info(sys.exc_info())
                 self.unregister_listener(handle_update)
 
-        self.register_listener(handle_update, reading=True)
+        # Check every reading, even if a listener dispatcher is coalescing them
+        self.register_listener(handle_update, reading=True, immediate=True)
         # Handle case where sensor is already at the desired value
         ioloop.add_callback(handle_update, self, self._reading)
 
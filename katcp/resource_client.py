@@ -25,10 +25,10 @@ from tornado.gen import Return, maybe_future, with_timeout
 
 from katcp import resource, inspecting_client, Message
 from katcp.resource import KATCPReply, KATCPSensorError
-from katcp.core import (AttrDict, DefaultAttrDict, AsyncCallbackEvent,
+from katcp.core import (AttrDict, DefaultAttrDict, LazyAttrDict, AsyncCallbackEvent,
                         steal_docstring_from,
                         AsyncState, AsyncEvent, LatencyTimer,
-                        until_any, until_some, log_future_exceptions)
+                        until_any, log_future_exceptions)
 
 # TODO NM 2017-04-13 Importing IOLoopThreadwrapper here for backwards
 # compatibility, user code should be changed to import it from the more logical
@@ -66,6 +66,10 @@ def transform_future(transformation, future):
     future.add_done_callback(_transform)
     return new_future
 
+def _get_child_item(full_item_name, child_item):
+    child_items, item_name = child_item
+    return child_items[item_name]
+
 @tornado.gen.coroutine
 def list_sensors(parent_class, sensor_items, filter, strategy, status,
                  use_python_identifiers, tuple, refresh):
@@ -74,9 +78,10 @@ def list_sensors(parent_class, sensor_items, filter, strategy, status,
     Parameters
     ----------
 
-    sensor_items : tuple of sensor-item tuples
-        As would be returned the items() method of a dict containing KATCPSensor objects
-        keyed by Python-identifiers.
+    sensor_items : mapping or tuple of sensor-item tuples
+        A mapping containing KATCPSensor objects keyed by Python-identifiers, or
+        the items of such a dict. Sensor objects in a :class:`LazyAttrDict` are
+        only created if their names match when `use_python_identifiers` is set.
     parent_class: KATCPClientResource or KATCPClientResourceContainer
         Is used for prefix calculation
     Rest of parameters as for :meth:`katcp.resource.KATCPResource.list_sensors`
@@ -84,8 +89,13 @@ def list_sensors(parent_class, sensor_items, filter, strategy, status,
     filter_re = re.compile(filter)
     found_sensors = []
     none_strat = resource.normalize_strategy_parameters('none')
-    sensor_dict = dict(sensor_items)
-    for sensor_identifier in sorted(sensor_dict.keys()):
+    if isinstance(sensor_items, collections.Mapping):
+        sensor_dict = sensor_items
+    else:
+        sensor_dict = dict(sensor_items)
+    for sensor_identifier in sorted(sensor_dict):
+        if use_python_identifiers and not filter_re.search(sensor_identifier):
+            continue
         sensor_obj = sensor_dict[sensor_identifier]
         search_name = (sensor_identifier if use_python_identifiers
                        else sensor_obj.name)
@@ -307,6 +317,17 @@ class KATCPClientResource(resource.KATCPResource):
           preset_protocol_flags : :class:`katcp.core.ProtocolFlags` instance
               Assume these protocol settings and ignore the server's
               #katcp-protocol informs.
+          model_cache : :class:`katcp.inspecting_client.DeviceModelCache`
+              Cache of device models that lets the resource become synced
+              without first inspecting a previously seen device.
+          listener_dispatch : bool, default: False
+              If True, sensor listeners are called at the end of each ioloop
+              iteration with the latest reading of each updated sensor, by the
+              :class:`katcp.resource.ListenerDispatcher` available as the
+              `listener_dispatcher` attribute. Listeners therefore miss readings
+              that are superseded within an iteration, except for those of
+              :meth:`KATCPSensor.wait` and the wait methods of resources and
+              client groups, which still see every reading.
           # TODO(NM) 'keep', ie. katcorelib behaviour where requests / sensors never
           # disappear even if the device looses them. Or was it only sensors? Should look
           # at katcorelib
@@ -342,7 +363,11 @@ class KATCPClientResource(resource.KATCPResource):
         self._logger = logger
         self._parent = parent
         self._ioloop_set_to = None
-        self._sensor = AttrDict()
+        self.listener_dispatcher = (
+            resource.ListenerDispatcher()
+            if resource_spec.get('listener_dispatch') else None)
+        # Sensor objects are only created when first looked up
+        self._sensor = LazyAttrDict(self._create_sensor_object)
         self._dummy_unknown_requests = bool(resource_spec.get('dummy_unknown_requests'))
         if self._dummy_unknown_requests:
             DummyRequest = partial(
@@ -356,6 +381,7 @@ class KATCPClientResource(resource.KATCPResource):
         # Save the pop() / items() methods in case a sensor/request with the same name is
         # added
         self._preset_protocol_flags = resource_spec.get('preset_protocol_flags')
+        self._model_cache = resource_spec.get('model_cache')
         self._state = AsyncState(("disconnected", "syncing", "synced"))
         self._connected = AsyncCallbackEvent(self._update_state)
         self._sensors_synced = AsyncCallbackEvent(self._update_state)
@@ -413,11 +439,14 @@ class KATCPClientResource(resource.KATCPResource):
         self.ioloop = ic.ioloop
         if self._preset_protocol_flags:
             ic.preset_protocol_flags(self._preset_protocol_flags)
+        if self._model_cache:
+            ic.model_cache = self._model_cache
         ic.katcp_client.auto_reconnect_delay = self.auto_reconnect_delay
         ic.set_state_callback(self._inspecting_client_state_callback)
         ic.request_factory = self._request_factory
         self._sensor_manager = KATCPClientResourceSensorsManager(
-            ic, self.name, logger=self._logger)
+            ic, self.name, logger=self._logger,
+            listener_dispatcher=self.listener_dispatcher)
         ic.handle_sensor_value()
         ic.sensor_factory = self._sensor_manager.sensor_factory
 
@@ -452,7 +481,51 @@ class KATCPClientResource(resource.KATCPResource):
     def list_sensors(self, filter="", strategy=False, status="",
                      use_python_identifiers=True, tuple=False, refresh=False):
         return list_sensors(self,
-            dict.items(self.sensor), filter, strategy, status, use_python_identifiers, tuple, refresh)
+            self.sensor, filter, strategy, status, use_python_identifiers, tuple, refresh)
+
+    def wait_all(self, conditions, timeout=5):
+        """Wait for sensors in this resource to all satisfy their conditions.
+
+        The conditions are evaluated as readings arrive, using a single
+        listener per sensor and a single timeout for the whole wait.
+
+        Parameters
+        ----------
+        conditions : dict
+            Maps sensor names to conditions or values. If a value, the sensor
+            value is compared with it. If callable, condition(reading) is
+            called, and must return True if the condition is satisfied.
+        timeout : float or None
+            The timeout in seconds (None means wait forever)
+
+        Returns
+        -------
+        This command returns a tornado Future that resolves with a
+        :class:`ConditionResults` mapping each sensor name to True if its
+        condition was satisfied. The result evaluates True if all the
+        conditions were satisfied before the timeout.
+
+        Raises
+        ------
+        :class:`KATCPSensorError`
+            If any of the sensors do not have a strategy set
+        KeyError
+            If any of the named sensors are not present
+
+        """
+        return _wait_sensor_conditions(self.sensor, conditions, timeout,
+                                       len(conditions))
+
+    def wait_any(self, conditions, timeout=5):
+        """Wait for any sensor in this resource to satisfy its condition.
+
+        As for :meth:`wait_all`, but the returned Future resolves as soon as
+        one condition is satisfied, and the result evaluates True if any of the
+        conditions were satisfied before the timeout.
+
+        """
+        return _wait_sensor_conditions(self.sensor, conditions, timeout,
+                                       min(1, len(conditions)))
 
     @tornado.gen.coroutine
     def set_sampling_strategies(self, filter, strategy_and_parms):
@@ -473,17 +546,24 @@ class KATCPClientResource(resource.KATCPResource):
         """
         sensor_list = yield self.list_sensors(filter=filter)
         sensor_dict = {}
+        sensor_strategies = {}
         for sens in sensor_list:
-            # Set the strategy on each sensor
-            try:
-                sensor_name = sens.object.normalised_name
-                yield self.set_sampling_strategy(sensor_name, strategy_and_parms)
-                sensor_dict[sensor_name] = strategy_and_parms
-            except Exception as exc:
-                self._logger.exception(
-                    'Unhandled exception trying to set sensor strategies {!r} for {} ({})'
-                    .format(strategy_and_parms, sens, exc))
-                sensor_dict[sensor_name] = None
+            sensor_name = sens.object.normalised_name
+            self._sensor_strategy_cache[sensor_name] = strategy_and_parms
+            sensor_strategies[sens.object.name] = strategy_and_parms
+        # Set the strategy on all the sensors concurrently
+        try:
+            results = yield self._sensor_manager.set_sampling_strategies(
+                sensor_strategies)
+        except Exception as exc:
+            self._logger.exception(
+                'Unhandled exception trying to set sensor strategies {!r} for {} ({})'
+                .format(strategy_and_parms, filter, exc))
+            results = {}
+        for sens in sensor_list:
+            success, info = results.get(sens.object.name, (False, None))
+            sensor_dict[sens.object.normalised_name] = (
+                strategy_and_parms if success else None)
         # Otherwise, depend on self._add_sensors() to handle it from the cache when the sensor appears\
         raise tornado.gen.Return(sensor_dict)
 
@@ -505,7 +585,7 @@ class KATCPClientResource(resource.KATCPResource):
             Resolves when done
         """
         sensor_name = resource.escape_name(sensor_name)
-        sensor_obj = dict.get(self._sensor, sensor_name)
+        sensor_obj = LazyAttrDict.get(self._sensor, sensor_name)
         self._sensor_strategy_cache[sensor_name] = strategy_and_parms
         sensor_dict = {}
         self._logger.debug(
@@ -539,7 +619,7 @@ class KATCPClientResource(resource.KATCPResource):
         """
 
         sensor_name = resource.escape_name(sensor_name)
-        sensor_obj = dict.get(self._sensor, sensor_name)
+        sensor_obj = LazyAttrDict.get(self._sensor, sensor_name)
         self._sensor_listener_cache[sensor_name].append(listener)
         sensor_dict = {}
         self._logger.debug(
@@ -617,6 +697,12 @@ class KATCPClientResource(resource.KATCPResource):
         self._logger.debug('Done with model')
 
 
+    def _create_sensor_object(self, s_name_escaped, s_name):
+        s_obj = self._inspecting_client.get_sensor_object(s_name)
+        if s_obj is None:
+            raise KeyError(s_name_escaped)
+        return s_obj
+
     @tornado.gen.coroutine
     def _add_requests(self, request_keys):
         # Instantiate KATCPRequest instances and store on self.req
@@ -662,23 +748,21 @@ class KATCPClientResource(resource.KATCPResource):
 
     @tornado.gen.coroutine
     def _add_sensors(self, sensor_keys):
-        # Use LatencyTimer to avoid starving the ioloop
-        latency_timer = LatencyTimer(self.MAX_LOOP_LATENCY)
-        sensor_instance_fut = {}
-        # Get KATCPSensor instance futures from inspecting client
-        for key in sensor_keys:
-            fut = sensor_instance_fut[key] = (
-                self._inspecting_client.future_get_sensor(key))
-            latency_timer.check_future(fut)
-            if latency_timer.time_to_yield():
-                yield tornado.gen.moment
-
-        sensor_instances = yield sensor_instance_fut
-        # Store KATCPSensor instances in self.sensor
+        # Add sensors to self.sensor, with their KATCPSensor instances only
+        # created when first looked up, unless a strategy or listener has
+        # been preset for them
         added_names = []
-        for s_name, s_obj in list(sensor_instances.items()):
+        preset_names = []
+        for s_name in sensor_keys:
             s_name_escaped = resource.escape_name(s_name)
-            self._sensor[s_name_escaped] = s_obj
+            LazyAttrDict.add_lazy(self._sensor, s_name_escaped, s_name)
+            added_names.append(s_name_escaped)
+            if (s_name_escaped in self._sensor_strategy_cache or
+                    s_name_escaped in self._sensor_listener_cache):
+                preset_names.append((s_name, s_name_escaped))
+
+        for s_name, s_name_escaped in preset_names:
+            s_obj = self._sensor[s_name_escaped]
             preset_strategy = self._sensor_strategy_cache.get(s_name_escaped)
             if preset_strategy:
                 self._logger.debug('Setting preset strategy for sensor {} to {!r}'
@@ -699,8 +783,6 @@ class KATCPClientResource(resource.KATCPResource):
                         'Exception trying to pre-set sensor listeners for sensor {}'
                         .format(s_name))
 
-            added_names.append(s_name_escaped)
-
         if self.parent:
             self.parent._child_add_sensors(self, added_names)
 
@@ -710,8 +792,7 @@ class KATCPClientResource(resource.KATCPResource):
         removed_names = []
         for s_name in sensor_keys:
             s_name_escaped = resource.escape_name(s_name)
-            if s_name_escaped in self.sensor:
-                dict.pop(self.sensor, s_name_escaped)
+            if LazyAttrDict.discard(self._sensor, s_name_escaped):
                 removed_names.append(s_name_escaped)
 
         if self.parent:
@@ -733,8 +814,16 @@ class KATCPClientResourceSensorsManager(object):
     Assumes that all methods are called from the same ioloop context
     """
 
-    def __init__(self, inspecting_client, resource_name, logger=log):
+    SAMPLING_REQUEST_WINDOW = 100
+    """Maximum number of ?sensor-sampling requests outstanding at a time"""
+
+    BULK_SAMPLING_MAX_SENSORS = 100
+    """Maximum number of sensors to set in a single bulk ?sensor-sampling"""
+
+    def __init__(self, inspecting_client, resource_name, logger=log,
+                 listener_dispatcher=None):
         self._inspecting_client = inspecting_client
+        self._listener_dispatcher = listener_dispatcher
         self.time = inspecting_client.ioloop.time
         self._strategy_cache = {}
         self._resource_name = resource_name
@@ -746,7 +835,8 @@ class KATCPClientResourceSensorsManager(object):
 
     def sensor_factory(self, **sensor_description):
         # kwargs as for inspecting_client.InspectingClientAsync.sensor_factory
-        sens = resource.KATCPSensor(sensor_description, self)
+        sens = resource.KATCPSensor(sensor_description, self,
+                                    self._listener_dispatcher)
         sensor_name = sensor_description['name']
         cached_strategy = self._strategy_cache.get(sensor_name)
         if cached_strategy:
@@ -817,25 +907,100 @@ class KATCPClientResourceSensorsManager(object):
             sensor_strategy = (False, str(e))
         raise tornado.gen.Return(sensor_strategy)
 
+    @tornado.gen.coroutine
+    def set_sampling_strategies(self, sensor_strategies):
+        """Set the sampling strategies of many sensors concurrently
+
+        Up to SAMPLING_REQUEST_WINDOW ?sensor-sampling requests are kept
+        outstanding at a time. If the server supports bulk sensor sampling,
+        sensors with the same strategy are set using a single request per
+        BULK_SAMPLING_MAX_SENSORS sensors.
+
+        Parameters
+        ----------
+
+        sensor_strategies : dict
+            Maps sensor names to strategies, with strategies as for
+            :meth:`set_sampling_strategy`.
+
+        Returns
+        -------
+        sensor_strategies : dict
+            Maps sensor names to (success, info) tuples, as returned by
+            :meth:`set_sampling_strategy` for each sensor.
+
+        """
+        results = {}
+        sensors_by_strategy = collections.OrderedDict()
+        for sensor_name, strategy_and_params in sensor_strategies.items():
+            try:
+                strategy_and_params = resource.normalize_strategy_parameters(
+                    strategy_and_params)
+            except Exception as e:
+                self._logger.exception('Exception found!')
+                results[sensor_name] = (False, str(e))
+                continue
+            self._strategy_cache[sensor_name] = strategy_and_params
+            sensors_by_strategy.setdefault(
+                strategy_and_params, []).append(sensor_name)
+
+        katcp_client = self._inspecting_client.katcp_client
+        protocol_flags = katcp_client.protocol_flags
+        if protocol_flags and protocol_flags.bulk_set_sensor_sampling:
+            chunk_size = self.BULK_SAMPLING_MAX_SENSORS
+        else:
+            chunk_size = 1
+        requests = []
+        for strategy_and_params, sensor_names in sensors_by_strategy.items():
+            for i in range(0, len(sensor_names), chunk_size):
+                requests.append((sensor_names[i:i + chunk_size],
+                                 strategy_and_params))
+        msgs = [Message.request('sensor-sampling', ','.join(sensor_names),
+                                *strategy_and_params)
+                for sensor_names, strategy_and_params in requests]
+        futures = katcp_client.future_requests(
+            msgs, window=self.SAMPLING_REQUEST_WINDOW)
+
+        for (sensor_names, strategy_and_params), f in zip(requests, futures):
+            try:
+                reply, informs = yield f
+                if not reply.reply_ok():
+                    raise KATCPSensorError(
+                        'Error setting strategy for sensor {0}: \n'
+                        '{1!s}'.format(','.join(sensor_names), reply))
+                sensor_strategy = (True, strategy_and_params)
+            except Exception as e:
+                self._logger.error(str(e))
+                sensor_strategy = (False, str(e))
+            for sensor_name in sensor_names:
+                results[sensor_name] = sensor_strategy
+        raise tornado.gen.Return(results)
+
     @tornado.gen.coroutine
     def reapply_sampling_strategies(self):
         """Reapply all sensor strategies using cached values"""
         check_sensor = self._inspecting_client.future_check_sensor
-        for sensor_name, strategy in list(self._strategy_cache.items()):
+        cached_strategies = list(self._strategy_cache.items())
+        # Check all the sensors at once, since most of them are already known
+        sensor_exists_futures = [check_sensor(sensor_name)
+                                 for sensor_name, strategy in cached_strategies]
+        sensor_strategies = {}
+        for (sensor_name, strategy), sensor_exists_future in zip(
+                cached_strategies, sensor_exists_futures):
             try:
-                sensor_exists = yield check_sensor(sensor_name)
-                if not sensor_exists:
-                    self._logger.warn('Did not set strategy for non-existing sensor {}'
-                             .format(sensor_name))
-                    continue
-
-                result = yield self.set_sampling_strategy(sensor_name, strategy)
-            except KATCPSensorError as e:
-                self._logger.error('Error reapplying strategy for sensor {0}: {1!s}'
-                                   .format(sensor_name, e))
+                sensor_exists = yield sensor_exists_future
             except Exception:
                 self._logger.exception('Unhandled exception reapplying strategy for '
                                        'sensor {}'.format(sensor_name), exc_info=True)
+                continue
+            if not sensor_exists:
+                self._logger.warn('Did not set strategy for non-existing sensor {}'
+                         .format(sensor_name))
+                continue
+            sensor_strategies[sensor_name] = strategy
+
+        # Errors are logged per request by set_sampling_strategies()
+        yield self.set_sampling_strategies(sensor_strategies)
 
     @tornado.gen.coroutine
     @steal_docstring_from(resource.KATCPSensorsManager.poll_sensor)
@@ -997,6 +1162,193 @@ class GroupResults(dict):
         return bool(self)
 
 
+def _condition_test(condition_or_value):
+    """Turn a condition or value, as for :meth:`KATCPSensor.wait`, into a test"""
+    if (isinstance(condition_or_value, collections.Sequence) and not
+            isinstance(condition_or_value, basestring)):
+        raise NotImplementedError(
+            'Currently only single conditions are supported')
+    if callable(condition_or_value):
+        return condition_or_value
+    return lambda reading: reading.value == condition_or_value
+
+
+class _SensorConditionWaiter(object):
+    """Wait for a number of sensors to satisfy their conditions.
+
+    Each sensor gets a single listener, which evaluates the sensor's condition
+    as readings arrive and is removed once the condition is satisfied. One
+    timer is used for both the initial timeout and the grace period.
+
+    Parameters
+    ----------
+    conditions : dict
+        Maps keys to (sensor, condition_test) tuples, where `sensor` is a
+        :class:`KATCPSensor` and condition_test(reading) returns True if the
+        reading satisfies the condition. Satisfied conditions stay satisfied.
+    quorum : int
+        Number of conditions that need to be satisfied.
+    timeout : float or None
+        Time to wait for a quorum in seconds (None means wait forever).
+    grace_period : float or None
+        Once a quorum is reached or the timeout expires, wait up to this long
+        for the remaining conditions (None means wait forever).
+    ioloop : tornado.ioloop.IOLoop instance or None
+        IOLoop on which the sensors are updated, defaults to the current one.
+
+    """
+    def __init__(self, conditions, quorum, timeout=None, grace_period=0,
+                 ioloop=None):
+        self._conditions = conditions
+        self._quorum = quorum
+        self._timeout = timeout
+        self._grace_period = grace_period
+        self._ioloop = ioloop or tornado.ioloop.IOLoop.current()
+        self._results = dict.fromkeys(conditions, False)
+        self._satisfied = 0
+        self._listeners = {}
+        self._timeout_handle = None
+        self._in_grace_period = False
+        self._done = False
+        self._future = tornado_Future()
+
+    def wait(self):
+        """Start waiting.
+
+        Returns
+        -------
+        This command returns a tornado Future that resolves with a dict
+        mapping each key of `conditions` to True if its condition was
+        satisfied, or False otherwise.
+
+        Raises
+        ------
+        :class:`KATCPSensorError`
+            If any of the sensors do not have a strategy set
+
+        """
+        for key, (sensor, condition_test) in self._conditions.items():
+            if sensor.sampling_strategy == ('none', ):
+                raise KATCPSensorError(
+                    'Cannot wait on sensor {} that does not have a strategy '
+                    'set'.format(sensor.name))
+        for key, (sensor, condition_test) in self._conditions.items():
+            listener = partial(self._handle_update, key)
+            self._listeners[key] = (sensor, listener)
+            sensor.register_listener(listener, reading=True, immediate=True)
+        if self._timeout:
+            self._set_timer(self._timeout, self._start_grace_period)
+        # Handle sensors that already satisfy their conditions
+        for key, (sensor, condition_test) in self._conditions.items():
+            self._handle_update(key, sensor, sensor.reading)
+        if not self._in_grace_period and self._satisfied >= self._quorum:
+            self._start_grace_period()
+        return self._future
+
+    def _handle_update(self, key, sensor, reading):
+        if self._done or self._results[key]:
+            return
+        try:
+            satisfied = self._conditions[key][1](reading)
+        except Exception:
+            self._finish(sys.exc_info())
+            return
+        if satisfied:
+            self._results[key] = True
+            self._satisfied += 1
+            self._unregister_listener(key)
+            if self._satisfied == len(self._results):
+                self._finish()
+            elif (not self._in_grace_period and
+                      self._satisfied >= self._quorum):
+                self._start_grace_period()
+
+    def _start_grace_period(self):
+        if self._done:
+            return
+        self._in_grace_period = True
+        if self._satisfied == len(self._results) or not (
+                self._grace_period is None or self._grace_period > 0):
+            self._finish()
+        elif self._grace_period is None:
+            self._set_timer(None, None)
+        else:
+            self._set_timer(self._grace_period, self._finish)
+
+    def _set_timer(self, delay, callback):
+        if self._timeout_handle is not None:
+            self._ioloop.remove_timeout(self._timeout_handle)
+            self._timeout_handle = None
+        if delay is not None:
+            self._timeout_handle = self._ioloop.call_later(delay, callback)
+
+    def _unregister_listener(self, key):
+        sensor, listener = self._listeners.pop(key)
+        sensor.unregister_listener(listener)
+
+    def _finish(self, exc_info=None):
+        if self._done:
+            return
+        self._done = True
+        self._set_timer(None, None)
+        for key in list(self._listeners):
+            self._unregister_listener(key)
+        # Resolve the future in a callback, since we may be in the middle of
+        # updating a sensor
+        if exc_info:
+            self._ioloop.add_callback(self._future.set_exc_info, exc_info)
+        else:
+            self._ioloop.add_callback(self._future.set_result,
+                                      dict(self._results))
+
+
+class ConditionResults(dict):
+    """The result of waiting for sensor conditions.
+
+    This has a dictionary interface, mapping the clients or sensors waited on
+    to True if their conditions were satisfied and False otherwise. The result
+    evaluates to a truthy value if a quorum of the conditions were satisfied.
+
+    """
+    def __init__(self, results, quorum):
+        super(ConditionResults, self).__init__(results)
+        self.quorum = quorum
+
+    def __bool__(self):
+        """True if a quorum of the conditions were satisfied."""
+        return sum(self.values()) >= self.quorum
+
+    # Was not handled automatrically by futurize, see
+    # https://github.com/PythonCharmers/python-future/issues/282
+    if sys.version_info[0] == 2:
+        __nonzero__ = __bool__
+
+
+@tornado.gen.coroutine
+def _wait_sensor_conditions(sensors, conditions, timeout, quorum):
+    """Helper for implementing :meth:`KATCPClientResource.wait_all` and friends
+
+    Parameters
+    ----------
+    sensors : dict
+        KATCPSensor objects keyed by Python identifiers.
+    conditions : dict
+        Maps sensor names to conditions or values, as for the `wait` method.
+    timeout : float or None
+        The timeout in seconds (None means wait forever).
+    quorum : int
+        The number of conditions that need to be satisfied.
+
+    """
+    sensor_conditions = dict(
+        (name, (sensors[resource.escape_name(name)],
+                _condition_test(condition_or_value)))
+        for name, condition_or_value in conditions.items())
+    results = yield _SensorConditionWaiter(
+        sensor_conditions, quorum, timeout).wait()
+    raise tornado.gen.Return(ConditionResults(results, quorum))
+
+
 class ClientGroup(object):
     """Create a group of similar clients.
 
@@ -1036,10 +1388,10 @@ class ClientGroup(object):
             else:
                 self._req = AttrDict()
             for client in self.clients:
-                for name, request in dict.iteritems(client.req):
+                for name in client.req:
                     if name not in self._req:
-                        self._req[name] = GroupRequest(self, name,
-                                                       request.description)
+                        self._req[name] = GroupRequest(
+                            self, name, client.req[name].description)
             self._clients_dirty = False
 
         return self._req
@@ -1124,7 +1476,8 @@ class ClientGroup(object):
         max_grace_period : float or None
             After a quorum or initial timeout is reached, wait up to this long
             in an attempt to get the rest of the clients to satisfy condition
-            as well (achieving effectively a full quorum if all clients behave)
+            as well (achieving effectively a full quorum if all clients behave).
+            If None or 0, wait for the rest of the clients indefinitely.
 
         Returns
         -------
@@ -1154,31 +1507,19 @@ class ClientGroup(object):
         else:
             grace_period = max_grace_period
             initial_timeout = timeout
-        # Build dict of futures instead of list as this will be easier to debug
-        futures = {}
-        for client in self.clients:
-            f = client.wait(sensor_name, condition_or_value, initial_timeout)
-            futures[client.name] = f
-        # No timeout required here as all futures will resolve after timeout
-        initial_results = yield until_some(done_at_least=quorum, **futures)
-        results = dict(initial_results)
-        # Identify stragglers and let them all respond within grace period
-        stragglers = {}
-        for client in self.clients:
-            if not results.get(client.name, False):
-                f = client.wait(sensor_name, condition_or_value, grace_period)
-                stragglers[client.name] = f
-        rest_of_results = yield until_some(**stragglers)
-        results.update(dict(rest_of_results))
-        class TestableDict(dict):
-            """Dictionary of results that can be tested for overall success."""
-            def __bool__(self):
-                return sum(self.values()) >= quorum
-            # Was not handled automatrically by futurize, see
-            # https://github.com/PythonCharmers/python-future/issues/282
-            if sys.version_info[0] == 2:
-                __nonzero__ = __bool__
-        raise tornado.gen.Return(TestableDict(results))
+        if not grace_period:
+            # No grace period means waiting for the stragglers forever
+            grace_period = None
+        # Listen to the sensor of each client once, evaluating the quorum as
+        # readings arrive, until the grace period after a quorum or timeout
+        sensor_name = resource.escape_name(sensor_name)
+        condition_test = _condition_test(condition_or_value)
+        conditions = dict(
+            (client.name, (client.sensor[sensor_name], condition_test))
+            for client in self.clients)
+        results = yield _SensorConditionWaiter(
+            conditions, quorum, initial_timeout, grace_period).wait()
+        raise tornado.gen.Return(ConditionResults(results, quorum))
 
 
 class KATCPClientResourceContainer(resource.KATCPResource):
@@ -1358,9 +1699,19 @@ class KATCPClientResourceContainer(resource.KATCPResource):
     def list_sensors(self, filter="", strategy=False, status="",
                      use_python_identifiers=True, tuple=False, refresh=False):
         return list_sensors(self,
-            dict.items(self.sensor), filter, strategy, status,
+            self.sensor, filter, strategy, status,
                             use_python_identifiers, tuple, refresh)
 
+    @steal_docstring_from(KATCPClientResource.wait_all)
+    def wait_all(self, conditions, timeout=5):
+        return _wait_sensor_conditions(self.sensor, conditions, timeout,
+                                       len(conditions))
+
+    @steal_docstring_from(KATCPClientResource.wait_any)
+    def wait_any(self, conditions, timeout=5):
+        return _wait_sensor_conditions(self.sensor, conditions, timeout,
+                                       min(1, len(conditions)))
+
     @tornado.gen.coroutine
     def _resource_set_sampling_strategies(
             self, resource_name, sensor_name, strategy_and_parms):
@@ -1458,16 +1809,20 @@ class KATCPClientResourceContainer(resource.KATCPResource):
         return res
 
     def _create_attrdict_from_children(self, attr):
-        attrdict = AttrDict()
+        # Items are looked up in the child when first accessed, so that lazily
+        # created child objects are not all created here
+        attrdict = LazyAttrDict(_get_child_item)
         for child_name, child_resource in dict.items(self.children):
             prefix = resource.escape_name(child_name) + '_'
-            for item_name, item in dict.items(getattr(child_resource, attr)):
+            child_items = getattr(child_resource, attr)
+            for item_name in child_items:
                 # Do not prefix aggregate sensors with "parent_name_"
                 if item_name.startswith("agg_"):
                     full_item_name = item_name
                 else:
                     full_item_name = prefix + item_name
-                attrdict[full_item_name] = item
+                LazyAttrDict.add_lazy(attrdict, full_item_name,
+                                      (child_items, item_name))
         return attrdict
 
     def stop(self):
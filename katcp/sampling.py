@@ -8,12 +8,15 @@
 
 from __future__ import division, print_function, absolute_import
 
+import heapq
 import logging
+import math
 import os
 
 import tornado.ioloop
 
 from thread import get_ident as get_thread_ident
+from collections import OrderedDict
 from functools import wraps
 
 from .core import Message, Sensor
@@ -99,8 +102,18 @@ class SampleStrategy(object):
     OBSERVE_UPDATES = False
     "True if a strategy must be attached to its sensor as an observer"
 
+    CHANGES_ONLY = False
+    """True if updates that do not change the sensor value or status are ignored
+
+    Lets sensors that are updated in bulk (see :mod:`katcp.sensor_bank`) skip
+    notifying the strategy about unchanged readings.
+
+    """
+
     def __init__(self, inform_callback, sensor, *params, **kwargs):
         self.ioloop = kwargs.get('ioloop') or tornado.ioloop.IOLoop.current()
+        # Used to schedule timeouts, either the ioloop or a SampleScheduler
+        self._scheduler = kwargs.get('scheduler') or self.ioloop
         self._inform_callback = inform_callback
         self._sensor = sensor
         self._params = params
@@ -125,6 +138,9 @@ class SampleStrategy(object):
         -----------------
         ioloop : tornado.ioloop.IOLoop instance, optional
             Tornado ioloop to use, otherwise tornado.ioloop.IOLoop.current()
+        scheduler : :class:`SampleScheduler` object, optional
+            Scheduler shared by many strategies to run their timeouts,
+            otherwise timeouts are added to the ioloop individually.
 
         Returns
         -------
@@ -301,6 +317,7 @@ class SampleDifferential(SampleStrategy):
     """
 
     OBSERVE_UPDATES = True
+    CHANGES_ONLY = True
 
     def __init__(self, inform_callback, sensor, *params, **kwargs):
         SampleStrategy.__init__(self, inform_callback, sensor, *params, **kwargs)
@@ -376,14 +393,14 @@ class SamplePeriod(SampleStrategy):
         if self.next_time < now:
             # Catch up if we have fallen far behind
             self.next_time = now + self._period
-        self.next_timeout_handle = self.ioloop.call_at(self.next_time,
-                                                       self._run_once)
+        self.next_timeout_handle = self._scheduler.call_at(self.next_time,
+                                                           self._run_once)
 
     def get_sampling(self):
         return SampleStrategy.PERIOD
 
     def cancel_timeouts(self):
-        self.ioloop.remove_timeout(self.next_timeout_handle)
+        self._scheduler.remove_timeout(self.next_timeout_handle)
 
 
 class SampleEventRate(SampleStrategy):
@@ -398,6 +415,7 @@ class SampleEventRate(SampleStrategy):
     """
 
     OBSERVE_UPDATES = True
+    CHANGES_ONLY = True
 
     def __init__(self, inform_callback, sensor, *params, **kwargs):
         SampleStrategy.__init__(self, inform_callback, sensor, *params, **kwargs)
@@ -436,7 +454,7 @@ class SampleEventRate(SampleStrategy):
         if self.ioloop.time() >= self._not_after:
             self.inform(self._sensor.read())
         # We depend on self.inform() having updated self._not_after
-        self._periodic_timeout_handle = self.ioloop.call_at(
+        self._periodic_timeout_handle = self._scheduler.call_at(
             self._not_after, self._periodic_sampling)
 
     def _short_timeout_handler(self):
@@ -461,7 +479,7 @@ class SampleEventRate(SampleStrategy):
             if not self._short_timeout_handle:
                 # Make sure we schedule a callback to send the sensor value as
                 # soon as the minimum period since the last update has expired
-                self._short_timeout_handle = self.ioloop.call_at(
+                self._short_timeout_handle = self._scheduler.call_at(
                     self._not_before, self._short_timeout_handler)
         else:
             # Send the sensor value, updating self._not_before and
@@ -473,9 +491,9 @@ class SampleEventRate(SampleStrategy):
 
     def cancel_timeouts(self):
         if self._periodic_timeout_handle:
-            self.ioloop.remove_timeout(self._periodic_timeout_handle)
+            self._scheduler.remove_timeout(self._periodic_timeout_handle)
         if self._short_timeout_handle:
-            self.ioloop.remove_timeout(self._short_timeout_handle)
+            self._scheduler.remove_timeout(self._short_timeout_handle)
 
 
 class SampleEvent(SampleEventRate):
@@ -533,3 +551,377 @@ class SampleDifferentialRate(SampleEventRate):
         _, status, value = reading
         _, last_s, last_v = self._last_reading_sent
         return (abs(value - last_v) > self.difference or status != last_s)
+
+
+class SharedSampleStrategy(object):
+    """A sampling strategy shared by several subscribers.
+
+    Subscribers that want the same strategy with the same parameters on the
+    same sensor can share a single strategy instance. Each inform generated by
+    the strategy is formatted once into a #sensor-status message that is
+    passed to every subscriber, so that the wire representation of the
+    message only needs to be serialised once (see :meth:`Message.to_wire`).
+
+    A subscriber that joins a strategy that is already running is immediately
+    sent the current sensor reading, just as a newly started strategy would,
+    and from then on follows the timing of the shared strategy. The same
+    happens when a paused subscriber is resumed.
+
+    Must only be used from the ioloop thread.
+
+    Parameters
+    ----------
+    format_inform : callable, signature format_inform(sensor, *reading)
+        Returns the inform Message for a sensor reading, e.g.
+        :func:`format_inform_v5`.
+    strategy_name : str
+        Name of the sampling strategy.
+    sensor : Sensor object
+        Sensor to sample.
+    params : list of objects
+        Custom sampling parameters for the strategy.
+
+    Keyword Arguments
+    -----------------
+    ioloop : tornado.ioloop.IOLoop instance, optional
+        Tornado ioloop to use, otherwise tornado.ioloop.IOLoop.current()
+    on_empty : callable, no arguments, optional
+        Called after the last subscriber unsubscribed and the strategy was
+        cancelled.
+
+    """
+
+    def __init__(self, format_inform, strategy_name, sensor, *params, **kwargs):
+        self._format_inform = format_inform
+        self._on_empty = kwargs.pop('on_empty', None)
+        self._sensor = sensor
+        self._subscribers = OrderedDict()
+        # Paused subscribers, not sent any informs until resumed
+        self._paused = {}
+        self._started = False
+        self.strategy = SampleStrategy.get_strategy(
+            strategy_name, self._fan_out, sensor, *params, **kwargs)
+
+    def _fan_out(self, sensor, reading):
+        if not self._subscribers:
+            # All the subscribers are paused
+            return
+        msg = self._format_inform(sensor, *reading)
+        for send_inform in self._subscribers.values():
+            try:
+                send_inform(msg)
+            except Exception:
+                log.exception('Unhandled exception trying to send {!r} '
+                              'for sensor {!r}'.format(msg, sensor.name))
+
+    def subscribe(self, key, send_inform):
+        """Add a subscriber, starting the strategy if needed.
+
+        Parameters
+        ----------
+        key : hashable
+            Identifies the subscriber, e.g. its client connection.
+        send_inform : callable, signature send_inform(msg)
+            Called with each inform Message generated by the strategy.
+
+        Returns
+        -------
+        subscription : :class:`SharedSampleSubscription` object
+            Call its cancel() method to unsubscribe.
+
+        """
+        self._paused.pop(key, None)
+        self._subscribers[key] = send_inform
+        if not self._started:
+            self._started = True
+            self.strategy.start()
+        else:
+            send_inform(self._format_inform(self._sensor, *self._sensor.read()))
+        return SharedSampleSubscription(self, key)
+
+    def unsubscribe(self, key):
+        """Remove a subscriber, cancelling the strategy if it was the last."""
+        self._subscribers.pop(key, None)
+        self._paused.pop(key, None)
+        if not self._subscribers and not self._paused:
+            self.strategy.cancel()
+            if self._on_empty:
+                self._on_empty()
+
+    def pause(self, key):
+        """Stop sending informs to a subscriber until it is resumed."""
+        send_inform = self._subscribers.pop(key, None)
+        if send_inform is not None:
+            self._paused[key] = send_inform
+
+    def resume(self, key):
+        """Resume a paused subscriber, sending it the current reading."""
+        send_inform = self._paused.pop(key, None)
+        if send_inform is not None:
+            self._subscribers[key] = send_inform
+            send_inform(self._format_inform(self._sensor, *self._sensor.read()))
+
+    def subscriber_count(self):
+        """The number of subscribers currently sharing the strategy."""
+        return len(self._subscribers) + len(self._paused)
+
+
+class SharedSampleSubscription(object):
+    """A single subscriber's handle on a :class:`SharedSampleStrategy`.
+
+    Attribute access is passed on to the underlying :class:`SampleStrategy`
+    so that the subscription can be used in its stead, except that
+    :meth:`cancel` only unsubscribes this subscriber.
+
+    """
+
+    def __init__(self, shared_strategy, key):
+        self.shared_strategy = shared_strategy
+        self._key = key
+
+    def __getattr__(self, name):
+        return getattr(self.shared_strategy.strategy, name)
+
+    def cancel(self):
+        """Unsubscribe from the shared strategy."""
+        self.shared_strategy.unsubscribe(self._key)
+
+    def pause(self):
+        """Stop receiving informs until :meth:`resume` is called."""
+        self.shared_strategy.pause(self._key)
+
+    def resume(self):
+        """Resume receiving informs, starting with the current reading."""
+        self.shared_strategy.resume(self._key)
+
+
+class SensorStatusBatcher(object):
+    """Coalesce single-sensor #sensor-status informs for one connection.
+
+    Informs passed to :meth:`inform` are buffered and sent on as multi-sensor
+    #sensor-status informs, one per timestamp, once the current ioloop
+    iteration completes (or after `window` seconds). Updates of the same
+    sensor are never reordered and none are dropped.
+
+    Must only be used from the ioloop thread.
+
+    Parameters
+    ----------
+    send_inform : callable, signature send_inform(msg)
+        Called with each combined inform Message.
+    window : float, optional
+        Seconds to wait for more updates before sending the buffered
+        informs. The default of 0 sends them on the next ioloop iteration.
+    ioloop : tornado.ioloop.IOLoop instance, optional
+        Tornado ioloop to use, otherwise tornado.ioloop.IOLoop.current()
+
+    """
+
+    def __init__(self, send_inform, window=0, ioloop=None):
+        self._send_inform = send_inform
+        self._window = window
+        self.ioloop = ioloop or tornado.ioloop.IOLoop.current()
+        self._flush_handle = None
+        self._reset()
+
+    def _reset(self):
+        # List of (timestamp, [name, status, value, name, ...]) groups
+        self._groups = []
+        # Map timestamp to index of the most recent group with that timestamp
+        self._group_by_timestamp = {}
+        # Map sensor name to index of the group holding its latest update
+        self._group_by_sensor = {}
+
+    def inform(self, msg):
+        """Buffer a single-sensor #sensor-status inform Message."""
+        timestamp, _num, name, status, value = msg.arguments
+        index = self._group_by_timestamp.get(timestamp)
+        if index is None or index < self._group_by_sensor.get(name, -1):
+            # Start a new group, so that this update is sent after any
+            # earlier update of the same sensor
+            index = len(self._groups)
+            self._groups.append((timestamp, []))
+            self._group_by_timestamp[timestamp] = index
+        self._groups[index][1].extend((name, status, value))
+        self._group_by_sensor[name] = index
+        if self._flush_handle is None:
+            if self._window:
+                self._flush_handle = self.ioloop.call_later(
+                    self._window, self.flush)
+            else:
+                self._flush_handle = True
+                self.ioloop.add_callback(self.flush)
+
+    def flush(self):
+        """Send all buffered updates now."""
+        if not self._groups:
+            return
+        if self._flush_handle not in (None, True):
+            self.ioloop.remove_timeout(self._flush_handle)
+        self._flush_handle = None
+        groups = self._groups
+        self._reset()
+        for timestamp, readings in groups:
+            msg = Message.trusted(
+                Message.INFORM, "sensor-status",
+                [timestamp, str(len(readings) // 3)] + readings)
+            try:
+                self._send_inform(msg)
+            except Exception:
+                log.exception('Unhandled exception trying to send {!r}'
+                              .format(msg))
+
+    def cancel(self):
+        """Discard all buffered updates."""
+        if self._flush_handle not in (None, True):
+            self.ioloop.remove_timeout(self._flush_handle)
+        self._flush_handle = None
+        self._reset()
+
+
+class SampleScheduler(object):
+    """Run the timeouts of many sampling strategies from one ioloop timeout.
+
+    Provides the call_at() and remove_timeout() methods of the ioloop, and
+    can be passed to strategies using the `scheduler` keyword argument.
+    Timeouts are kept in buckets keyed by their deadline, with only the
+    earliest bucket added to the ioloop, so all the strategies that are due
+    at the same time are run in a single pass. Deadlines are rounded up to a
+    multiple of `resolution` seconds so that timeouts that are due at nearly
+    the same time share a bucket. Removing a timeout is amortised O(1): each
+    bucket counts its live timeouts, is compacted once most of them have been
+    removed and is dropped, together with its deadline, when none are left.
+
+    Must only be used from the ioloop thread.
+
+    Parameters
+    ----------
+    ioloop : tornado.ioloop.IOLoop instance, optional
+        Tornado ioloop to use, otherwise tornado.ioloop.IOLoop.current()
+    resolution : float, optional
+        Granularity of deadlines in seconds, 0 to use exact deadlines.
+
+    """
+
+    def __init__(self, ioloop=None, resolution=0):
+        self.ioloop = ioloop or tornado.ioloop.IOLoop.current()
+        self.resolution = resolution
+        # Map deadline to _TimeoutBucket of the timeouts due at that time
+        self._buckets = {}
+        # Heap of the deadlines in self._buckets, which may also contain
+        # deadlines of buckets that have since been dropped
+        self._deadlines = []
+        # The ioloop timeout for the earliest bucket and its deadline
+        self._ioloop_timeout = None
+        self._ioloop_deadline = None
+        self._running = False
+
+    def call_at(self, deadline, callback):
+        """Run `callback` at the ioloop time `deadline`, returns a handle."""
+        if self.resolution:
+            deadline = math.ceil(deadline / self.resolution) * self.resolution
+        bucket = self._buckets.get(deadline)
+        if bucket is None:
+            bucket = self._buckets[deadline] = _TimeoutBucket(deadline)
+            heapq.heappush(self._deadlines, deadline)
+            if not self._running:
+                self._schedule()
+        timeout = _ScheduledTimeout(callback, bucket)
+        bucket.append(timeout)
+        bucket.live += 1
+        return timeout
+
+    def remove_timeout(self, timeout):
+        """Cancel a pending timeout returned by call_at()."""
+        if timeout.callback is None:
+            return
+        timeout.callback = None
+        bucket = timeout.bucket
+        timeout.bucket = None
+        if self._buckets.get(bucket.deadline) is not bucket:
+            # The bucket is being run
+            return
+        bucket.live -= 1
+        if not bucket.live:
+            del self._buckets[bucket.deadline]
+            if len(self._deadlines) > 2 * len(self._buckets) + 64:
+                # Mostly deadlines of buckets that have been dropped
+                self._deadlines = list(self._buckets)
+                heapq.heapify(self._deadlines)
+            if not self._running:
+                self._schedule()
+        elif len(bucket) > 2 * bucket.live + 16:
+            bucket[:] = [t for t in bucket if t.callback is not None]
+
+    def timeout_count(self):
+        """Number of pending timeouts."""
+        return sum(bucket.live for bucket in self._buckets.values())
+
+    def _schedule(self):
+        deadlines = self._deadlines
+        while deadlines and deadlines[0] not in self._buckets:
+            heapq.heappop(deadlines)
+        if not deadlines:
+            if self._ioloop_timeout is not None:
+                self.ioloop.remove_timeout(self._ioloop_timeout)
+                self._ioloop_timeout = None
+                self._ioloop_deadline = None
+            return
+        deadline = deadlines[0]
+        if self._ioloop_timeout is not None:
+            if self._ioloop_deadline == deadline:
+                return
+            self.ioloop.remove_timeout(self._ioloop_timeout)
+        self._ioloop_deadline = deadline
+        self._ioloop_timeout = self.ioloop.call_at(deadline, self._run_due)
+
+    def _run_due(self):
+        self._ioloop_timeout = None
+        self._ioloop_deadline = None
+        now = self.ioloop.time()
+        due = []
+        while self._deadlines and self._deadlines[0] <= now:
+            bucket = self._buckets.pop(heapq.heappop(self._deadlines), None)
+            if bucket is not None:
+                due.append(bucket)
+        # Timeouts added by the callbacks are scheduled once all the due
+        # buckets have been run
+        self._running = True
+        try:
+            for bucket in due:
+                for timeout in bucket:
+                    callback = timeout.callback
+                    if callback is None:
+                        continue
+                    timeout.callback = None
+                    timeout.bucket = None
+                    try:
+                        callback()
+                    except Exception:
+                        log.exception('Unhandled exception in sampling '
+                                      'timeout callback {!r}'.format(callback))
+        finally:
+            self._running = False
+            self._schedule()
+
+
+class _TimeoutBucket(list):
+    """The timeouts of a SampleScheduler that are due at one deadline."""
+
+    __slots__ = ['deadline', 'live']
+
+    def __init__(self, deadline):
+        super(_TimeoutBucket, self).__init__()
+        self.deadline = deadline
+        # Number of timeouts in the bucket that have not been removed
+        self.live = 0
+
+
+class _ScheduledTimeout(object):
+    """Handle for a timeout added to a SampleScheduler."""
+
+    __slots__ = ['callback', 'bucket']
+
+    def __init__(self, callback, bucket):
+        self.callback = callback
+        self.bucket = bucket
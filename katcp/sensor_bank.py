@@ -0,0 +1,266 @@
+# sensor_bank.py
+# -*- coding: utf8 -*-
+# vim:fileencoding=utf8 ai ts=4 sts=4 et sw=4
+# Copyright 2009 SKA South Africa (http://ska.ac.za/)
+# BSD license - see COPYING for details
+
+"""Banks of homogeneous sensors with readings held in NumPy arrays.
+
+This module requires NumPy, which is an optional dependency of katcp.
+
+"""
+
+from __future__ import division, print_function, absolute_import
+
+import time
+
+import numpy as np
+
+from .core import Sensor, Reading
+from .sampling import SampleDifferential
+
+
+class SensorBank(object):
+    """Many sensors of the same numeric type, updated together.
+
+    The timestamps, statuses and values of all the sensors in the bank are
+    held in contiguous NumPy arrays, and can be updated in bulk using
+    :meth:`set_many`. Each element of the bank is presented as a normal
+    :class:`Sensor` object (see :attr:`sensors`) that can be added to a
+    device server and sampled as usual.
+
+    Bulk updates only notify the sensors that have observers, and observers
+    that are only interested in changes (i.e. have a true `CHANGES_ONLY`
+    attribute, such as event sampling strategies) are only notified if the
+    status or value of their sensor changed, as determined by vectorised
+    comparisons. For sensors with a single differential sampling strategy,
+    the bank also keeps the last reading the strategy was notified of, so
+    that the strategy is only notified if the status changed or the value
+    moved by more than its threshold since then, which is likewise tested
+    for all the sensors at once.
+
+    Parameters
+    ----------
+    sensor_type : Sensor type constant
+        One of Sensor.INTEGER, Sensor.FLOAT, Sensor.BOOLEAN or
+        Sensor.TIMESTAMP.
+    names : list of str
+        The names of the sensors in the bank.
+    description : str or list of str, optional
+        Description shared by all the sensors, or one description per sensor.
+    units : str, optional
+        The units of the sensor values.
+    params : list, optional
+        Additional sensor parameters, as for :class:`Sensor`.
+    default : object, optional
+        Initial value of all the sensors. By default this is determined by the
+        sensor type.
+    initial_status : int enum or None, optional
+        Initial status of all the sensors. If None, defaults to
+        Sensor.UNKNOWN.
+
+    Notes
+    -----
+    Unlike :meth:`Sensor.set`, updating a bank is not atomic with respect to
+    readers in other threads. Bank sensors should be set and read from a
+    single thread, typically the device server's ioloop.
+
+    """
+
+    DTYPES = {
+        Sensor.INTEGER: np.int64,
+        Sensor.FLOAT: np.float64,
+        Sensor.BOOLEAN: np.bool_,
+        Sensor.TIMESTAMP: np.float64,
+    }
+    """NumPy dtypes used to hold the values of the supported sensor types"""
+
+    def __init__(self, sensor_type, names, description=None, units='',
+                 params=None, default=None, initial_status=None):
+        sensor_type = Sensor.SENSOR_SHORTCUTS.get(sensor_type, sensor_type)
+        if sensor_type not in self.DTYPES:
+            raise ValueError('Sensor banks only support integer, float, '
+                             'boolean and timestamp sensors')
+        if initial_status is None:
+            initial_status = Sensor.UNKNOWN
+        if description is None or isinstance(description, basestring):
+            descriptions = [description] * len(names)
+        else:
+            descriptions = description
+        size = len(names)
+        self.timestamps = np.zeros(size, dtype=np.float64)
+        self.statuses = np.zeros(size, dtype=np.int8)
+        self.values = np.zeros(size, dtype=self.DTYPES[sensor_type])
+        # Number of observers per sensor that want all updates, and that only
+        # want updates that change the status or value
+        self._all_observers = np.zeros(size, dtype=np.int32)
+        self._change_observers = np.zeros(size, dtype=np.int32)
+        # Number of SampleDifferential observers per sensor, and for sensors
+        # with exactly one of them, its threshold and the status and value
+        # that it was last notified of. A status of -1 means that the
+        # strategy has not been notified yet and will report any change.
+        self._diff_observers = np.zeros(size, dtype=np.int32)
+        self._diff_thresholds = np.zeros(size, dtype=np.float64)
+        self._diff_statuses = np.zeros(size, dtype=np.int8)
+        self._diff_values = np.zeros(size, dtype=self.values.dtype)
+        self.sensors = [
+            BankSensor(self, index, sensor_type, name, desc, units, params,
+                       default, initial_status)
+            for index, (name, desc) in enumerate(zip(names, descriptions))]
+        # BankSensor.__init__ stored the initial readings in the arrays
+
+    def __len__(self):
+        return len(self.sensors)
+
+    def __iter__(self):
+        return iter(self.sensors)
+
+    def __getitem__(self, index):
+        return self.sensors[index]
+
+    def set_many(self, indices, values, statuses=Sensor.NOMINAL,
+                 timestamp=None):
+        """Set the readings of many sensors at once.
+
+        Parameters
+        ----------
+        indices : array of int, slice or None
+            Indices of the sensors to set, or None for all of them.
+        values : array
+            New values, one per index.
+        statuses : Sensor status constant or array of them, optional
+            New statuses, either shared by all the sensors or one per index.
+        timestamp : float or None, optional
+            The time at which the values were determined. Uses the current
+            time if None.
+
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if indices is None:
+            indices = slice(None)
+        if isinstance(indices, slice):
+            indices = np.arange(len(self.sensors))[indices]
+        else:
+            indices = np.asarray(indices, dtype=np.intp)
+        values = np.asarray(values, dtype=self.values.dtype)
+        statuses = np.broadcast_to(
+            np.asarray(statuses, dtype=self.statuses.dtype), indices.shape)
+
+        changed = ((self.values[indices] != values) |
+                   (self.statuses[indices] != statuses))
+        self.timestamps[indices] = timestamp
+        self.statuses[indices] = statuses
+        self.values[indices] = values
+
+        notify = ((self._all_observers[indices] > 0) |
+                  ((self._change_observers[indices] > 0) & changed))
+        if self._diff_observers.any():
+            diff_observers = self._diff_observers[indices]
+            if self.values.dtype == np.bool_:
+                # NumPy cannot subtract booleans, any change is a difference
+                # of one
+                moved = values != self._diff_values[indices]
+            else:
+                moved = np.abs(values - self._diff_values[indices])
+            # Only notify a single differential strategy of changes that it
+            # would report, several of them of any change
+            diff_due = changed & (
+                (self._diff_statuses[indices] != statuses) |
+                (moved > self._diff_thresholds[indices]))
+            notify |= (((diff_observers == 1) & diff_due) |
+                       ((diff_observers > 1) & changed))
+        sensors = self.sensors
+        for index, index_changed in zip(indices[notify], changed[notify]):
+            sensor = sensors[index]
+            if index_changed:
+                sensor.notify(sensor.read())
+            else:
+                sensor._notify_unchanged(sensor.read())
+
+    def _observer_added(self, index, observer, increment=1):
+        if isinstance(observer, SampleDifferential):
+            self._diff_observers[index] += increment
+        elif getattr(observer, 'CHANGES_ONLY', False):
+            self._change_observers[index] += increment
+        else:
+            self._all_observers[index] += increment
+
+    def _track_differential(self, index, strategy):
+        """Start tracking the last reading reported by a differential
+        strategy, which is now the only one observing its sensor."""
+        self._diff_thresholds[index] = strategy._threshold
+        if strategy._lastStatus is None:
+            self._diff_statuses[index] = -1
+        else:
+            self._diff_statuses[index] = strategy._lastStatus
+            self._diff_values[index] = strategy._lastValue
+
+
+class BankSensor(Sensor):
+    """A single sensor whose reading is stored in a :class:`SensorBank`.
+
+    Behaves like a normal :class:`Sensor`, but is created by the bank.
+
+    """
+
+    def __init__(self, bank, index, sensor_type, name, description=None,
+                 units='', params=None, default=None, initial_status=None):
+        self._bank = bank
+        self._index = index
+        super(BankSensor, self).__init__(sensor_type, name, description, units,
+                                         params, default, initial_status)
+
+    @property
+    def _current_reading(self):
+        bank = self._bank
+        index = self._index
+        return Reading(float(bank.timestamps[index]),
+                       int(bank.statuses[index]),
+                       bank.values[index].item())
+
+    @_current_reading.setter
+    def _current_reading(self, reading):
+        bank = self._bank
+        index = self._index
+        timestamp, status, value = reading
+        bank.timestamps[index] = timestamp
+        bank.statuses[index] = status
+        bank.values[index] = value
+
+    def notify(self, reading):
+        bank = self._bank
+        index = self._index
+        if bank._diff_observers[index] == 1:
+            # Track the reading as the differential strategy will
+            _timestamp, status, value = reading
+            if (status != bank._diff_statuses[index] or
+                    abs(value - bank._diff_values[index].item()) >
+                    bank._diff_thresholds[index]):
+                bank._diff_statuses[index] = status
+                bank._diff_values[index] = value
+        super(BankSensor, self).notify(reading)
+
+    def _notify_unchanged(self, reading):
+        """Notify only the observers that want unchanged readings too."""
+        for o in list(self._observers):
+            if not getattr(o, 'CHANGES_ONLY', False):
+                o.update(self, reading)
+
+    def attach(self, observer):
+        if observer not in self._observers:
+            self._bank._observer_added(self._index, observer)
+        super(BankSensor, self).attach(observer)
+        self._track_differential()
+
+    def detach(self, observer):
+        if observer in self._observers:
+            self._bank._observer_added(self._index, observer, -1)
+        super(BankSensor, self).detach(observer)
+        self._track_differential()
+
+    def _track_differential(self):
+        if self._bank._diff_observers[self._index] == 1:
+            for observer in self._observers:
+                if isinstance(observer, SampleDifferential):
+                    self._bank._track_differential(self._index, observer)
@@ -8,6 +8,7 @@
 
 from __future__ import division, print_function, absolute_import
 
+import bisect
 import socket
 import threading
 import traceback
@@ -20,7 +21,8 @@ import tornado.ioloop
 import tornado.tcpserver
 
 from functools import partial, wraps
-from collections import deque
+from collections import deque, defaultdict, OrderedDict
+from itertools import islice
 from thread import get_ident as get_thread_ident
 
 from tornado import gen, iostream
@@ -30,12 +32,15 @@ from tornado.util import ObjectDict
 from concurrent.futures import Future
 
 from .ioloop_manager import IOLoopManager, with_relative_timeout
-from .core import (DeviceServerMetaclass, Message, MessageParser,
-                   FailReply, AsyncReply, ProtocolFlags)
-from .sampling import SampleStrategy, SampleNone
+from .core import (DeviceServerMetaclass, Message, MessageParser, Sensor,
+                   FailReply, AsyncReply, ProtocolFlags, LatencyTimer,
+                   RequestStats)
+from .sampling import (SampleStrategy, SampleNone, SampleScheduler,
+                       SharedSampleStrategy, SensorStatusBatcher)
 from .sampling import format_inform_v5, format_inform_v4
 from .core import (SEC_TO_MS_FAC, MS_TO_SEC_FAC, SEC_TS_KATCP_MAJOR,
-                   VERSION_CONNECT_KATCP_MAJOR, DEFAULT_KATCP_MAJOR)
+                   VERSION_CONNECT_KATCP_MAJOR, INTERFACE_CHANGED_KATCP_MAJOR,
+                   DEFAULT_KATCP_MAJOR)
 from .kattypes import (request, return_reply,
                        minimum_katcp_version,
                        has_katcp_protocol_flags,
@@ -79,6 +84,20 @@ def return_future(fn):
     return decorated
 
 
+def stream_write_buffer_size(stream):
+    """Number of bytes buffered for writing by a tornado IOStream.
+
+    IOStream does not expose the size of its write buffer publicly. Tornado 4
+    keeps a running byte count, while later versions keep a buffer object
+    whose length is the number of bytes buffered.
+
+    """
+    size = getattr(stream, '_write_buffer_size', None)
+    if size is None:
+        size = len(stream._write_buffer)
+    return size
+
+
 def construct_name_filter(pattern):
     """Return a function for filtering sensor names based on a pattern.
 
@@ -107,6 +126,291 @@ def construct_name_filter(pattern):
     return True, lambda name: name == pattern
 
 
+class SensorNameIndex(object):
+    """Sorted index of sensor names for pattern lookups.
+
+    Names are kept in sorted order as they are added and removed, so that
+    listing all sensors does not require sorting. Regular expressions that
+    are anchored to a literal prefix (e.g. '/^psu\\./') only need to be
+    searched for in the range of names sharing the prefix. The name filters
+    constructed for recent patterns, together with the names they match, are
+    kept in a least-recently-used cache that is invalidated whenever a name is
+    added or removed.
+
+    Parameters
+    ----------
+    cache_size : int, optional
+        Maximum number of patterns to cache.
+
+    """
+
+    REGEX_SPECIAL = frozenset('.^$*+?{}[]\\|()')
+    """Characters that end the literal prefix of an anchored regex"""
+
+    REGEX_QUANTIFIERS = frozenset('*+?{')
+    """Characters that make the preceding literal character optional"""
+
+    def __init__(self, cache_size=64):
+        self.cache_size = cache_size
+        self._names = []
+        # map pattern to [exact, name_filter, prefix, matching names or None]
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        index = bisect.bisect_left(self._names, name)
+        return index < len(self._names) and self._names[index] == name
+
+    def add(self, name):
+        """Add a name to the index (does nothing if it is already present)."""
+        with self._lock:
+            names = self._names
+            index = bisect.bisect_left(names, name)
+            if index < len(names) and names[index] == name:
+                return
+            names.insert(index, name)
+            self._invalidate()
+
+    def remove(self, name):
+        """Remove a name from the index (does nothing if it is not present)."""
+        with self._lock:
+            names = self._names
+            index = bisect.bisect_left(names, name)
+            if index < len(names) and names[index] == name:
+                del names[index]
+                self._invalidate()
+
+    def _invalidate(self):
+        # Keep the compiled filters, but forget the names they matched
+        for entry in self._cache.itervalues():
+            entry[3] = None
+
+    def match(self, pattern):
+        """Find the sorted names matching a pattern.
+
+        Parameters
+        ----------
+        pattern : None or str
+            Pattern as for :func:`construct_name_filter`.
+
+        Returns
+        -------
+        exact : bool
+            True if the pattern is expected to match exactly, as for
+            :func:`construct_name_filter`.
+        names : list of str
+            Sorted list of matching names. The list must not be modified.
+
+        """
+        with self._lock:
+            entry = self._cache.pop(pattern, None)
+            if entry is None:
+                exact, name_filter = construct_name_filter(pattern)
+                entry = [exact, name_filter, self._literal_prefix(pattern),
+                         None]
+            exact, name_filter, prefix, names = entry
+            if names is None:
+                names = entry[3] = self._find(pattern, exact, name_filter,
+                                              prefix)
+            self._cache[pattern] = entry
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return exact, names
+
+    def _find(self, pattern, exact, name_filter, prefix):
+        names = self._names
+        if pattern is None:
+            return list(names)
+        if exact:
+            return [pattern] if pattern in self else []
+        start = bisect.bisect_left(names, prefix)
+        matches = []
+        for name in islice(names, start, None):
+            if not name.startswith(prefix):
+                break
+            if name_filter(name):
+                matches.append(name)
+        return matches
+
+    @classmethod
+    def _literal_prefix(cls, pattern):
+        """Literal prefix of all names matched by an anchored regex pattern."""
+        if not (pattern and pattern.startswith('/^') and pattern.endswith('/')
+                and len(pattern) > 2):
+            return ''
+        regex = pattern[2:-1]
+        if '|' in regex or '(?' in regex:
+            # Alternatives and inline flags (e.g. '(?i)') could match names
+            # without the prefix
+            return ''
+        prefix = []
+        for char in regex:
+            if char in cls.REGEX_SPECIAL:
+                if char in cls.REGEX_QUANTIFIERS and prefix:
+                    prefix.pop()
+                break
+            prefix.append(char)
+        return ''.join(prefix)
+
+
+class RequestMetrics(object):
+    """Counts and latencies of the requests handled by a device server.
+
+    Used by a DeviceServer if its REQUEST_METRICS attribute is set. The
+    latency of a request is the time from its dispatch by handle_request()
+    until its reply is sent, which includes the time that asynchronous
+    handlers take to reply. When the first request with a given name is
+    replied to, sensors named katcp.request.<name>.count, .failures,
+    .latency-p50 and .latency-p99 are added to the device, announced with
+    #interface-changed informs, and are updated with every subsequent reply.
+    The katcp.request.in-flight sensor counts requests awaiting a reply,
+    excluding those of clients that have disconnected. Requests for unknown
+    names are only counted by the katcp.request.invalid sensor so that
+    clients cannot add sensors at will. The methods may be called from any
+    thread.
+
+    Parameters
+    ----------
+    device : DeviceServer object
+        The device server to add the sensors to.
+
+    """
+
+    SENSOR_PREFIX = 'katcp.request.'
+
+    def __init__(self, device):
+        self._device = device
+        self._lock = threading.Lock()
+        # map request names to RequestStats objects
+        self._stats = {}
+        # map request names to (count, failures, p50, p99) sensor tuples
+        self._request_sensors = {}
+        # map id() of requests awaiting a reply to
+        # (request, start time, client connection)
+        self._pending = {}
+        # map client connections to the id()s of their pending requests
+        self._pending_by_client = defaultdict(set)
+        self._invalid = 0
+        self._in_flight_sensor = self._add_sensor(
+            Sensor.integer, 'in-flight', 'Number of requests awaiting a reply')
+        self._invalid_sensor = self._add_sensor(
+            Sensor.integer, 'invalid', 'Number of requests with unknown names')
+
+    def _add_sensor(self, sensor_type, name, description, units=''):
+        sensor = sensor_type(self.SENSOR_PREFIX + name, description, units,
+                             default=0, initial_status=Sensor.NOMINAL)
+        self._device.add_sensor(sensor)
+        return sensor
+
+    def _add_request_sensors(self, name):
+        prefix = name + '.'
+        sensors = (
+            self._add_sensor(Sensor.integer, prefix + 'count',
+                             'Number of ?%s requests replied to' % name),
+            self._add_sensor(Sensor.integer, prefix + 'failures',
+                             'Number of ?%s requests that did not '
+                             'reply ok' % name),
+            self._add_sensor(Sensor.float, prefix + 'latency-p50',
+                             'Median ?%s request latency' % name, 's'),
+            self._add_sensor(Sensor.float, prefix + 'latency-p99',
+                             '99th percentile ?%s request latency' % name,
+                             's'))
+        if self._device.PROTOCOL_INFO.major >= INTERFACE_CHANGED_KATCP_MAJOR:
+            # Announce all the sensors in one inform, sent from the ioloop
+            # rather than the replying thread
+            args = []
+            for sensor in sensors:
+                args.extend(('sensor-list', sensor.name, 'added'))
+            self._device.ioloop.add_callback(
+                self._device.mass_inform,
+                Message.inform('interface-changed', *args))
+        return sensors
+
+    def request_started(self, msg, client_conn):
+        """Start timing a request that is being dispatched to its handler."""
+        with self._lock:
+            self._pending[id(msg)] = (msg, time.time(), client_conn)
+            self._pending_by_client[client_conn].add(id(msg))
+            in_flight = len(self._pending)
+        self._in_flight_sensor.set_value(in_flight)
+
+    def client_disconnected(self, client_conn):
+        """Stop timing the requests of a client that has disconnected.
+
+        Their handlers may never reply, and replies that are still sent are
+        ignored.
+
+        """
+        with self._lock:
+            pending_ids = self._pending_by_client.pop(client_conn, ())
+            for msg_id in pending_ids:
+                del self._pending[msg_id]
+            in_flight = len(self._pending)
+        if pending_ids:
+            self._in_flight_sensor.set_value(in_flight)
+
+    def request_invalid(self, msg):
+        """Count a request for an unknown name."""
+        with self._lock:
+            self._invalid += 1
+            invalid = self._invalid
+        self._invalid_sensor.set_value(invalid)
+
+    def request_done(self, orig_req, reply):
+        """Record the latency of a request that is being replied to.
+
+        Replies to requests that are not being timed are ignored.
+
+        """
+        now = time.time()
+        name = orig_req.name
+        with self._lock:
+            pending = self._pending.pop(id(orig_req), None)
+            if pending is None:
+                return
+            client_ids = self._pending_by_client[pending[2]]
+            client_ids.discard(id(orig_req))
+            if not client_ids:
+                del self._pending_by_client[pending[2]]
+            stats = self._stats.get(name)
+            new_name = stats is None
+            if new_name:
+                stats = self._stats[name] = RequestStats()
+            stats.add(now - pending[1], reply.arguments[:1] != ['ok'])
+            values = (stats.count, stats.failures,
+                      stats.percentile(50), stats.percentile(99))
+            in_flight = len(self._pending)
+        if new_name:
+            # Add the sensors without holding the lock, then pick up any
+            # replies recorded meanwhile (their sensor updates were skipped)
+            sensors = self._add_request_sensors(name)
+            with self._lock:
+                self._request_sensors[name] = sensors
+                values = (stats.count, stats.failures,
+                          stats.percentile(50), stats.percentile(99))
+        else:
+            sensors = self._request_sensors.get(name, ())
+        for sensor, value in zip(sensors, values):
+            sensor.set_value(value, timestamp=now)
+        self._in_flight_sensor.set_value(in_flight, timestamp=now)
+
+    def snapshot(self):
+        """Statistics of the requests replied to so far.
+
+        Returns
+        -------
+        stats : dict
+            Maps request names to dicts as returned by RequestStats.summary().
+
+        """
+        with self._lock:
+            return dict((name, stats.summary())
+                        for name, stats in self._stats.items())
+
+
 class ClientConnection(object):
     """Encapsulates the connection between a single client and the server."""
 
@@ -118,6 +422,7 @@ class ClientConnection(object):
         self._send_message = partial(server.send_message, conn_id)
         self._mass_send_message = server.mass_send_message
         self.flush_on_close = partial(server.flush_on_close, conn_id)
+        self.set_send_hook = partial(server.set_send_hook, conn_id)
 
     @property
     def address(self):
@@ -195,8 +500,46 @@ class ClientConnection(object):
         assert (reply.mtype == Message.REPLY)
         assert reply.name == orig_req.name
         reply.mid = orig_req.mid
+        metrics = self._server.request_metrics
+        if metrics is not None:
+            metrics.request_done(orig_req, reply)
         return self._send_message(reply)
 
+    def write_buffer_size(self):
+        """Number of bytes waiting to be written to the client.
+
+        Returns None if the connection is closed. Can only be called in the
+        IOLoop thread.
+
+        """
+        return self._server.get_write_buffer_size(self._conn_key)
+
+    def write_stats(self):
+        """Statistics about the messages written to the client.
+
+        See :meth:`KATCPServer.get_write_stats`. Can only be called in the
+        IOLoop thread.
+
+        """
+        return self._server.get_write_stats(self._conn_key)
+
+    def traffic_stats(self):
+        """Number of bytes exchanged with the client.
+
+        See :meth:`KATCPServer.get_traffic_stats`.
+
+        """
+        return self._server.get_traffic_stats(self._conn_key)
+
+    def flush(self):
+        """Wait for all messages sent so far to be written to the client.
+
+        Returns a future that resolves once the server write buffer for this
+        client has been emptied. Can only be called in the IOLoop thread.
+
+        """
+        return self._server.flush(self._conn_key)
+
     def on_client_disconnect_was_called(self):
         """Prevent multiple calls to on_client_disconnect handler.
 
@@ -242,6 +585,29 @@ class KATCPServer(object):
     so more than MAX_WRITE_BUFFER_SIZE bytes may be untransmitted in total.
 
     """
+    SLOW_CLIENT_POLICY = 'disconnect'
+    """What to do with #sensor-status informs for clients that fall behind.
+
+    A client falls behind when more than SLOW_CLIENT_BUFFER_SIZE bytes are
+    buffered for sending to it. Policies are:
+
+    'disconnect'
+        Keep writing, closing the connection if more than
+        MAX_WRITE_BUFFER_SIZE bytes are buffered.
+    'drop-sensor-status'
+        Hold back #sensor-status informs until the buffer has been flushed,
+        keeping only the latest inform for each sensor.
+    'pause-sampling'
+        Pause the client's sampling strategies (see the device's
+        on_client_falling_behind() method) until the buffer has been flushed,
+        dropping any #sensor-status informs sent in the meantime.
+
+    Other messages are always written, subject to MAX_WRITE_BUFFER_SIZE.
+
+    """
+    SLOW_CLIENT_BUFFER_SIZE = MAX_WRITE_BUFFER_SIZE // 4
+    """Buffered bytes above which a client is considered to be falling behind
+    if SLOW_CLIENT_POLICY is not 'disconnect'"""
     DISCONNECT_TIMEOUT = 1
     """How long to wait for the device on_client_disconnect() to complete.
 
@@ -250,6 +616,43 @@ class KATCPServer(object):
     will be blocked and unable to apply the timeout.
 
     """
+    BULK_READ = False
+    """Use bulk line framing when reading messages from clients.
+
+    If True, all bytes available on a client stream (up to READ_CHUNK_SIZE) are
+    read at once and every complete line is split out in a single pass. Control
+    is only yielded to the ioloop once the read loop has avoided it for longer
+    than MAX_LOOP_LATENCY, rather than after every message. This greatly
+    improves throughput for clients that pipeline many requests.
+
+    If False, one read_until_regex() call is made per message, followed by a
+    trip through the ioloop.
+
+    """
+    MAX_IN_FLIGHT_REQUESTS = 1
+    """Maximum number of requests with message ids handled at once per client.
+
+    By default each message from a client is only handled once the device has
+    finished handling the previous one. If greater than 1, requests carrying
+    a KATCP v5 message id are pipelined: they are handed to the device without
+    waiting for the earlier requests with message ids to be replied to, up to
+    this many at a time. Messages without ids are only handled once all the
+    client's in-flight requests are done, and a request reusing the id of an
+    in-flight request waits for it to be done.
+
+    Only requests with async handlers (returning futures) overlap. Note that
+    the device's handler thread or pool (see
+    DeviceServer.set_concurrency_options()) still handles the synchronous
+    parts of the requests one at a time per client. The handler thread fails
+    requests once more than MessageHandlerThread.MAX_QUEUE_SIZE messages are
+    waiting for it, so raise that too when using a larger window.
+
+    """
+    READ_CHUNK_SIZE = 64*1024
+    """Maximum number of bytes read from a client stream at once if BULK_READ"""
+    MAX_LOOP_LATENCY = 0.03
+    """Do not spend more than this many seconds reading from a client stream
+    without yielding to the ioloop if BULK_READ"""
 
     client_connection_factory = ClientConnection
     """Factory that produces a ClientConnection compatible instance.
@@ -335,6 +738,8 @@ class KATCPServer(object):
         # ID of Thread that hosts the IOLoop.
         # Used to check that we are running in the ioloop.
         self.ioloop_thread_id = None
+        self.request_metrics = None
+        "RequestMetrics object told about replies sent to requests, or None"
         # Map from tornado IOStreams to ClientConnection objects
         self._connections = {}
         self._ioloop_manager = IOLoopManager(managed_default=True)
@@ -488,6 +893,16 @@ class KATCPServer(object):
             # Flag to indicate that no more write should be accepted so that
             # we can flush the write buffer when closing a connection
             stream.KATCPServer_closing = False
+            # #sensor-status informs held back while the client is falling
+            # behind (see SLOW_CLIENT_POLICY), or None if it is keeping up
+            stream.KATCPServer_held = None
+            stream.KATCPServer_max_buffered = 0
+            stream.KATCPServer_dropped = 0
+            stream.KATCPServer_bytes_in = 0
+            stream.KATCPServer_bytes_out = 0
+            # Called before every message sent to the client, see
+            # set_send_hook()
+            stream.KATCPServer_send_hook = None
 
             client_conn = self.client_connection_factory(self, stream)
             self._connections[stream] = client_conn
@@ -505,15 +920,90 @@ class KATCPServer(object):
                 stream.write(str(Message.inform('log', log_msg)))
                 stream.close(exc_info=True)
             else:
-                self._line_read_loop(stream, client_conn)
+                if self.BULK_READ:
+                    self._bulk_line_read_loop(stream, client_conn)
+                else:
+                    self._line_read_loop(stream, client_conn)
         except Exception:
             self._logger.error('Unhandled exception trying '
                                'to handle new connection', exc_info=True)
 
+    def _parse_line(self, stream, line):
+        """Parse a line received from a client.
+
+        Returns None if the line could not be parsed, in which case the error
+        is logged and also reported to the client using a #log inform.
+
+        """
+        try:
+            return self._parser.parse(line)
+        except Exception:
+            e_type, e_value, trace = sys.exc_info()
+            reason = "\n".join(traceback.format_exception(
+                e_type, e_value, trace, self._tb_limit))
+            self._logger.error("BAD COMMAND: %s in line %r" % (reason, line))
+            self.send_message(
+                stream, self._device.create_log_inform("error", reason, "root"))
+
+    def _dispatch_message(self, client_conn, msg, in_flight):
+        """Hand a message to the device.
+
+        Returns a future that must be resolved before the next message from
+        the same client may be dispatched.
+
+        Parameters
+        ----------
+        client_conn : ClientConnection object
+            The client connection the message was from.
+        msg : Message object
+            The message to handle.
+        in_flight : OrderedDict
+            Per-connection map of the message ids of in-flight pipelined
+            requests to futures resolving when they are done (see
+            MAX_IN_FLIGHT_REQUESTS).
+
+        """
+        if self.MAX_IN_FLIGHT_REQUESTS <= 1:
+            return gen.maybe_future(self._device.on_message(client_conn, msg))
+        return self._dispatch_pipelined(client_conn, msg, in_flight)
+
+    @gen.coroutine
+    def _dispatch_pipelined(self, client_conn, msg, in_flight):
+        mid = msg.mid
+        pipelined = mid is not None and msg.mtype == Message.REQUEST
+        if pipelined:
+            while mid in in_flight:
+                yield in_flight[mid]
+        elif in_flight:
+            yield in_flight.values()
+        ready = gen.maybe_future(self._device.on_message(client_conn, msg))
+        if not pipelined or ready.done():
+            yield ready
+            return
+
+        done = tornado_Future()
+
+        def request_done(ready):
+            if in_flight.get(mid) is done:
+                del in_flight[mid]
+            try:
+                ready.result()
+            except Exception:
+                self._logger.error('Error handling message {0!s}'
+                                   .format(msg), exc_info=True)
+            done.set_result(None)
+
+        in_flight[mid] = done
+        self.ioloop.add_future(ready, request_done)
+        if len(in_flight) >= self.MAX_IN_FLIGHT_REQUESTS:
+            # Wait for any of the requests to make room in the window
+            yield gen.WaitIterator(*in_flight.values()).next()
+
     @gen.coroutine
     def _line_read_loop(self, stream, client_conn):
         assert get_thread_ident() == self.ioloop_thread_id
         client_address = self.get_address(stream)
+        in_flight = OrderedDict()
         try:
             while True:
                 try:
@@ -531,22 +1021,13 @@ class KATCPServer(object):
                         self._logger.warn('Unhandled Exception '
                                           'while reading from client {0}:'
                                           .format(client_address), exc_info=True)
-                try:
-                    line = line.replace("\r", "\n").split("\n")[0]
-                    msg = self._parser.parse(line) if line else None
-                except Exception:
-                    msg = None
-                    e_type, e_value, trace = sys.exc_info()
-                    reason = "\n".join(traceback.format_exception(
-                        e_type, e_value, trace, self._tb_limit))
-                    self._logger.error("BAD COMMAND: %s in line %r"
-                                       % (reason, line))
-                    self.send_message(
-                        stream, self._device.create_log_inform("error", reason, "root"))
-                    continue  # Wait for the next message and hope it is better
+                stream.KATCPServer_bytes_in += len(line)
+                line = line.replace("\r", "\n").split("\n")[0]
+                msg = self._parse_line(stream, line) if line else None
                 try:
                     if msg:  # Ignore empty messages (i.e empty lines)
-                        yield self._device.on_message(client_conn, msg)
+                        yield self._dispatch_message(client_conn, msg,
+                                                     in_flight)
                 except Exception:
                     self._logger.error('Error handling message {0!s}'
                                        .format(msg), exc_info=True)
@@ -562,6 +1043,75 @@ class KATCPServer(object):
             self._logger.info('Reading loop for client {0} completed'
                               .format(client_address))
 
+    @gen.coroutine
+    def _bulk_line_read_loop(self, stream, client_conn):
+        """Read loop used if BULK_READ is set.
+
+        Reads whatever data is available on the stream, splits out all the
+        complete lines in one pass and hands the messages to the device in
+        order. Incomplete trailing data is kept until the rest of the line
+        arrives. A LatencyTimer is used to decide when to yield to the ioloop.
+
+        """
+        assert get_thread_ident() == self.ioloop_thread_id
+        client_address = self.get_address(stream)
+        latency_timer = LatencyTimer(self.MAX_LOOP_LATENCY, self.ioloop)
+        in_flight = OrderedDict()
+        partial_line = ''
+        try:
+            while not stream.closed():
+                try:
+                    data_fut = stream.read_bytes(self.READ_CHUNK_SIZE,
+                                                 partial=True)
+                    latency_timer.check_future(data_fut)
+                    if latency_timer.time_to_yield():
+                        yield gen.moment
+                    data = yield data_fut
+                except iostream.StreamClosedError:
+                    # Assume that _stream_closed_callback() will handle this
+                    break
+                stream.KATCPServer_bytes_in += len(data)
+                lines = (partial_line + data).replace("\r", "\n").split("\n")
+                # The last element is the start of a line that has not been
+                # completely received yet, or '' if data ended in a newline
+                partial_line = lines.pop()
+                for line in lines:
+                    if stream.closed():
+                        # Don't call message handlers with a closed connection
+                        break
+                    if not line:
+                        continue  # Ignore empty messages (i.e empty lines)
+                    if len(line) > self.MAX_MSG_SIZE:
+                        self._close_oversized_stream(stream, client_address)
+                        break
+                    msg = self._parse_line(stream, line)
+                    if not msg:
+                        continue
+                    try:
+                        ready = self._dispatch_message(client_conn, msg,
+                                                       in_flight)
+                        latency_timer.check_future(ready)
+                        if latency_timer.time_to_yield():
+                            yield gen.moment
+                        yield ready
+                    except Exception:
+                        self._logger.error('Error handling message {0!s}'
+                                           .format(msg), exc_info=True)
+                if len(partial_line) > self.MAX_MSG_SIZE:
+                    self._close_oversized_stream(stream, client_address)
+        except Exception:
+            self._logger.error('Unexpected exception in read-loop for client {0}:'
+                               .format(client_address), exc_info=True)
+        finally:
+            self._logger.info('Reading loop for client {0} completed'
+                              .format(client_address))
+
+    def _close_oversized_stream(self, stream, client_address):
+        """Close a stream that sent a line longer than MAX_MSG_SIZE."""
+        self._logger.warn('Closing connection to client {0}: message exceeds '
+                          '{1} bytes'.format(client_address, self.MAX_MSG_SIZE))
+        stream.close()
+
     def _stream_closed_callback(self, stream):
         assert get_thread_ident() == self.ioloop_thread_id
         # Remove ClientConnection object for the current stream from our state
@@ -631,20 +1181,190 @@ class KATCPServer(object):
         on_client_disconnect() method. They do not raise exceptions, but they
         are logged. Sends also fail if more than self.MAX_WRITE_BUFFER_SIZE
         bytes are queued for sending, implying that client is falling behind.
+        See SLOW_CLIENT_POLICY for ways of handling such clients more
+        gracefully.
 
         """
         assert get_thread_ident() == self.ioloop_thread_id
+        send_hook = stream.KATCPServer_send_hook
+        if send_hook is not None:
+            send_hook()
+        if (msg.name == 'sensor-status' and
+                self.SLOW_CLIENT_POLICY != 'disconnect' and
+                msg.mtype == Message.INFORM):
+            return self._send_sensor_status(stream, msg)
+        return self._send_wire(stream, msg.to_wire())
+
+    def set_send_hook(self, stream, hook):
+        """Call hook() before every message sent to a particular client.
+
+        Used to send messages that are buffered for the client first, so that
+        they are not overtaken by other messages. A hook of None removes it.
+
+        Notes
+        -----
+        This method can only be called in the IOLoop thread.
+
+        """
+        assert get_thread_ident() == self.ioloop_thread_id
+        stream.KATCPServer_send_hook = hook
+
+    def _send_sensor_status(self, stream, msg):
+        """Send a #sensor-status inform, applying the SLOW_CLIENT_POLICY."""
+        held = stream.KATCPServer_held
+        if held is None:
+            if (stream.closed() or stream.KATCPServer_closing or
+                    stream_write_buffer_size(stream) <=
+                    self.SLOW_CLIENT_BUFFER_SIZE):
+                return self._send_wire(stream, msg.to_wire())
+            held = self._client_falling_behind(stream)
+        if self.SLOW_CLIENT_POLICY == 'drop-sensor-status':
+            # Names of the sensors in the (possibly multi-sensor) inform
+            key = tuple(msg.arguments[2::3])
+            if held.pop(key, None) is not None:
+                stream.KATCPServer_dropped += 1
+            held[key] = msg
+        else:
+            stream.KATCPServer_dropped += 1
+
+    def _client_falling_behind(self, stream):
+        held = stream.KATCPServer_held = OrderedDict()
+        self._logger.warn('Client {0} is falling behind, applying slow client '
+                          'policy {1!r}'.format(self.get_address(stream),
+                                                self.SLOW_CLIENT_POLICY))
+        # The future of an empty write resolves once everything written
+        # before it has been flushed (needs tornado >= 4.5, where later writes
+        # do not replace earlier write futures)
+        self.ioloop.add_future(stream.write(''),
+                               partial(self._client_caught_up, stream))
+        if self.SLOW_CLIENT_POLICY == 'pause-sampling':
+            client_conn = self._connections.get(stream)
+            if client_conn is not None:
+                self._device.on_client_falling_behind(client_conn)
+        return held
+
+    def _client_caught_up(self, stream, flushed):
+        held = stream.KATCPServer_held
+        stream.KATCPServer_held = None
+        client_conn = self._connections.get(stream)
+        if stream.closed() or client_conn is None:
+            return
+        self._logger.info('Client {0} caught up, {1} #sensor-status informs '
+                          'dropped so far'.format(self.get_address(stream),
+                                                  stream.KATCPServer_dropped))
+        for msg in held.values():
+            self._send_wire(stream, msg.to_wire())
+        if self.SLOW_CLIENT_POLICY == 'pause-sampling':
+            self._device.on_client_caught_up(client_conn)
+
+    def _send_wire(self, stream, wire):
+        """Write an already serialized message to a client stream.
+
+        See send_message() for error handling.
+
+        """
         try:
             if stream.KATCPServer_closing:
                 raise RuntimeError('Stream is closing so we cannot '
                                    'accept any more writes')
-            return stream.write(str(msg) + '\n')
+            f = stream.write(wire)
+            stream.KATCPServer_bytes_out += len(wire)
+            buffered = stream_write_buffer_size(stream)
+            if buffered > stream.KATCPServer_max_buffered:
+                stream.KATCPServer_max_buffered = buffered
+            return f
         except Exception:
             addr = self.get_address(stream)
             self._logger.warn('Could not send message {0!r} to {1}'
-                              .format(str(msg), addr), exc_info=True)
+                              .format(wire[:-1], addr), exc_info=True)
             stream.close(exc_info=True)
 
+    def get_write_buffer_size(self, stream):
+        """Number of bytes buffered for sending to a particular client.
+
+        Returns None if the stream is closed.
+
+        Notes
+        -----
+        This method can only be called in the IOLoop thread.
+
+        """
+        assert get_thread_ident() == self.ioloop_thread_id
+        if stream.closed():
+            return None
+        return stream_write_buffer_size(stream)
+
+    def get_write_stats(self, stream):
+        """Statistics about the messages written to a particular client.
+
+        Returns
+        -------
+        stats : dict
+            With keys:
+
+            buffered : int or None
+                Bytes currently buffered, or None if the stream is closed.
+            max_buffered : int
+                Most bytes ever buffered for the client.
+            falling_behind : bool
+                True while the client is falling behind (see
+                SLOW_CLIENT_POLICY).
+            held : int
+                Number of #sensor-status informs currently held back.
+            dropped : int
+                Number of #sensor-status informs dropped so far.
+
+        Notes
+        -----
+        This method can only be called in the IOLoop thread.
+
+        """
+        held = stream.KATCPServer_held
+        return dict(buffered=self.get_write_buffer_size(stream),
+                    max_buffered=stream.KATCPServer_max_buffered,
+                    falling_behind=held is not None,
+                    held=len(held) if held else 0,
+                    dropped=stream.KATCPServer_dropped)
+
+    def get_traffic_stats(self, stream):
+        """Number of bytes exchanged with a particular client.
+
+        Returns
+        -------
+        stats : dict
+            With keys:
+
+            bytes_in : int
+                Bytes received from the client.
+            bytes_out : int
+                Bytes of messages written to the client.
+            max_buffered : int
+                Most bytes ever buffered for the client.
+
+        Notes
+        -----
+        This method is thread-safe
+
+        """
+        return dict(bytes_in=stream.KATCPServer_bytes_in,
+                    bytes_out=stream.KATCPServer_bytes_out,
+                    max_buffered=stream.KATCPServer_max_buffered)
+
+    def flush(self, stream):
+        """Wait for the messages sent to a particular client to be written.
+
+        Returns a future that resolves when the stream write buffer has been
+        flushed, or fails if the stream is closed.
+
+        Notes
+        -----
+        This method can only be called in the IOLoop thread.
+
+        """
+        assert get_thread_ident() == self.ioloop_thread_id
+        # An empty write resolves once all previous writes have completed
+        return stream.write('')
+
     def flush_on_close(self, stream):
         """Flush tornado iostream write buffer and prevent further writes.
 
@@ -724,6 +1444,9 @@ class KATCPServer(object):
         This method can only be called in the IOLoop thread.
 
         """
+        assert get_thread_ident() == self.ioloop_thread_id
+        # The message caches its serialized form, so it is only serialized
+        # once however many clients it is sent to
         for stream in self._connections.keys():
             if not stream.closed():
                 # Don't cause noise by trying to write to already closed streams
@@ -788,6 +1511,17 @@ class ClientRequestConnection(object):
 
 class MessageHandlerThread(object):
     """Provides backwards compatibility for server expecting its own thread."""
+
+    MAX_QUEUE_SIZE = 30
+    """Maximum number of messages waiting to be handled.
+
+    Requests arriving while the queue is full are failed and other messages
+    are dropped. Each client normally has at most one message queued, but a
+    client pipelining requests can have up to
+    KATCPServer.MAX_IN_FLIGHT_REQUESTS queued.
+
+    """
+
     def __init__(self, handler, log_inform_formatter, logger=log):
         self.handler = handler
         try:
@@ -820,14 +1554,19 @@ class MessageHandlerThread(object):
         *on_message* should not be called again until *ready* has resolved.
 
         """
-        MAX_QUEUE_SIZE = 30
-        if len(self._msg_queue) >= MAX_QUEUE_SIZE:
+        ready_future = Future()
+        if len(self._msg_queue) >= self.MAX_QUEUE_SIZE:
             # This should never happen if callers to handle_message wait
             # for its futures to resolve before sending another message.
             # NM 2014-10-06: Except when there are multiple clients. Oops.
-            raise RuntimeError('MessageHandlerThread unhandled '
-                               'message queue full, not handling message')
-        ready_future = Future()
+            # Also when clients pipeline requests.
+            reason = 'Message handler queue full, not handling message'
+            self._logger.error('{0}: {1!s}'.format(reason, msg))
+            if msg.mtype == Message.REQUEST:
+                client_conn.reply(
+                    Message.reply_to_request(msg, 'fail', reason), msg)
+            ready_future.set_result(None)
+            return ready_future
         self._msg_queue.append((ready_future, client_conn, msg))
         self._wake.set()
         return ready_future
@@ -912,6 +1651,183 @@ class MessageHandlerThread(object):
         return self._running.wait(timeout)
 
 
+class MessageHandlerPool(object):
+    """Handle messages on a pool of threads, in order for each client.
+
+    A drop-in replacement for :class:`MessageHandlerThread` that lets a
+    handler blocking on one client connection proceed without holding up the
+    messages from other clients. Messages from the same client connection are
+    handled one at a time in the order they were received, and an async
+    handler's future must resolve before the next message from its client is
+    handled.
+
+    There is no limit on the number of messages queued. The ready future
+    returned by :meth:`on_message` resolves only once the message has been
+    handled, so each client's reads are paused while its messages wait for a
+    free worker.
+
+    Parameters
+    ----------
+    handler : callable, signature handler(client_conn, msg)
+        The message handler, e.g. :meth:`DeviceServerBase.handle_message`.
+    log_inform_formatter : callable
+        Creates #log informs, e.g. :meth:`DeviceServerBase.create_log_inform`.
+    logger : logging.Logger object, optional
+        Logger to log errors to.
+    pool_size : int, optional
+        Number of handler threads.
+
+    """
+    def __init__(self, handler, log_inform_formatter, logger=log, pool_size=4):
+        self.handler = handler
+        try:
+            owner = handler.im_self.name
+        except AttributeError:
+            owner = handler.im_self.__class__.__name__
+        self.name = "{}.message_handler".format(owner)
+        self.log_inform_formatter = log_inform_formatter
+        self.pool_size = pool_size
+        self._logger = logger
+        self._lock = threading.Condition()
+        # map client connections to deques of (ready_future, msg) tuples
+        self._queues = {}
+        # client connections with a message being handled
+        self._busy = set()
+        # client connections with messages that can be handled now
+        self._runnable = deque()
+        self._running = threading.Event()
+        self._threads = []
+        self.ioloop = None
+
+    def set_ioloop(self, ioloop):
+        self.ioloop = ioloop
+
+    def on_message(self, client_conn, msg):
+        """Handle message.
+
+        Returns
+        -------
+        ready : Future
+            A future that will resolve once the message has been handled.
+
+        """
+        ready_future = Future()
+        with self._lock:
+            queue = self._queues.get(client_conn)
+            if queue is None:
+                queue = self._queues[client_conn] = deque()
+            queue.append((ready_future, msg))
+            if client_conn not in self._busy and len(queue) == 1:
+                self._runnable.append(client_conn)
+                self._lock.notify()
+        return ready_future
+
+    def _next_message(self):
+        """Wait for a message that can be handled, or None if stopping."""
+        with self._lock:
+            while self._running.isSet() and not self._runnable:
+                self._lock.wait()
+            if not self._running.isSet():
+                return None
+            client_conn = self._runnable.popleft()
+            self._busy.add(client_conn)
+            ready_future, msg = self._queues[client_conn].popleft()
+            return ready_future, client_conn, msg
+
+    def _handled(self, client_conn, ready_future=None):
+        """Let the next message of a client connection be handled."""
+        with self._lock:
+            self._busy.discard(client_conn)
+            if self._queues.get(client_conn):
+                self._runnable.append(client_conn)
+                self._lock.notify()
+            else:
+                self._queues.pop(client_conn, None)
+
+    def run(self):
+        # Set the default ioloop for anything using IOLoop.current()
+        # in this thread gets self.ioloop
+        self.ioloop.make_current()
+        try:
+            while True:
+                next_message = self._next_message()
+                if next_message is None:
+                    break
+                ready_future, client_conn, msg = next_message
+                try:
+                    res = self.handler(client_conn, msg)
+                    if gen.is_future(res):
+                        ready_future.add_done_callback(
+                            partial(self._handled, client_conn))
+                        self.ioloop.add_callback(chain_future, res,
+                                                 ready_future)
+                        continue
+                    ready_future.set_result(res)
+                except Exception, e:
+                    err_msg = ('Error calling message '
+                               'handler for msg:\n {0!s}'.format(msg))
+                    self._logger.error(err_msg, exc_info=True)
+                    client_conn.inform(self.log_inform_formatter(
+                        'error', 'See device logs:\n' + err_msg, 'root'))
+                    ready_future.set_exception(e)
+                self._handled(client_conn)
+        except Exception:
+            self._logger.error(
+                'Unhandled exception in message handler thread: ', exc_info=True)
+
+    def start(self, timeout=None):
+        if self.isAlive():
+            raise RuntimeError('Cannot start since threads are already running')
+        self._running.set()
+        self._threads = [
+            threading.Thread(target=self.run, name='{0}.{1}'.format(self.name, i))
+            for i in range(self.pool_size)]
+        for thread in self._threads:
+            thread.start()
+        if timeout:
+            return self.wait_running(timeout)
+
+    def stop(self, timeout=1.0):
+        """Stop the handler threads (from another thread).
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait for server to have *started*.
+
+        """
+        if timeout:
+            self._running.wait(timeout)
+        with self._lock:
+            self._running.clear()
+            # Make sure to wake all the threads
+            self._lock.notify_all()
+        self._logger.info('Message handler threads stopping.')
+
+    def join(self, timeout=None):
+        """Rejoin the handler threads.
+
+        Parameters
+        ----------
+        timeout : float or None, optional
+            Time in seconds to wait for each thread to finish.
+
+        """
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def isAlive(self):
+        return any(thread.isAlive() for thread in self._threads)
+
+    def running(self):
+        """Whether the handler threads are running."""
+        return self._running.isSet()
+
+    def wait_running(self, timeout=None):
+        """Wait until the handler threads are running."""
+        return self._running.wait(timeout)
+
+
 class DeviceServerBase(object):
     """Base class for device servers.
 
@@ -958,6 +1874,8 @@ class DeviceServerBase(object):
         self._tb_limit = tb_limit
         # Thread that will optionally be used to handle requests
         self._handler_thread = None
+        # RequestMetrics object if requests are timed, see DeviceServer
+        self._request_metrics = None
         # Set default concurrency options
         self.set_concurrency_options()
 
@@ -1047,7 +1965,10 @@ class DeviceServerBase(object):
         send_reply = True
         # TODO Should check presence of Message-ids against protocol flags and
         # raise an error as needed.
+        metrics = self._request_metrics
         if msg.name in self._request_handlers:
+            if metrics is not None:
+                metrics.request_started(msg, connection)
             req_conn = ClientRequestConnection(connection, msg)
             handler = self._request_handlers[msg.name]
             try:
@@ -1113,6 +2034,8 @@ class DeviceServerBase(object):
                 reply = self.create_exception_reply_and_log(msg, sys.exc_info())
         else:
             self._logger.error("%s INVALID: Unknown request." % (msg.name,))
+            if metrics is not None:
+                metrics.request_invalid(msg)
             reply = Message.reply(msg.name, "invalid", "Unknown request.")
 
         if send_reply:
@@ -1272,7 +2195,8 @@ class DeviceServerBase(object):
         self._server.set_ioloop(ioloop)
         self.ioloop = self._server.ioloop
 
-    def set_concurrency_options(self, thread_safe=True, handler_thread=True):
+    def set_concurrency_options(self, thread_safe=True, handler_thread=True,
+                                handler_pool_size=None):
         """Set concurrency options for this device server.
         Must be called before :meth:`start`.
 
@@ -1289,13 +2213,28 @@ class DeviceServerBase(object):
             handling new requests from any client, but sensor strategies should
             still function. This more or less mimics the behaviour of a server
             in library versions before 0.6.0.
+        handler_pool_size : int or None
+            Can only be set if `handler_thread` is True. Handle requests on a
+            pool of this many threads instead of a single thread (see
+            :class:`MessageHandlerPool`). Requests from the same client are
+            still handled one at a time and in order, but a blocking request
+            handler only holds up the requests of its own client. Clients
+            waiting for a free thread are not read from in the meantime.
 
         """
         if handler_thread:
             assert thread_safe, "handler_thread=True requires thread_safe=True"
+        if handler_pool_size is not None:
+            assert handler_thread, ("handler_pool_size requires "
+                                    "handler_thread=True")
         self._server.client_connection_factory = (
             ThreadsafeClientConnection if thread_safe else ClientConnection)
-        if handler_thread:
+        if handler_thread and handler_pool_size is not None:
+            self._handler_thread = MessageHandlerPool(
+                self.handle_message, self.create_log_inform, self._logger,
+                pool_size=handler_pool_size)
+            self.on_message = self._handler_thread.on_message
+        elif handler_thread:
             self._handler_thread = MessageHandlerThread(
                 self.handle_message, self.create_log_inform, self._logger)
             self.on_message = self._handler_thread.on_message
@@ -1304,7 +2243,8 @@ class DeviceServerBase(object):
             self._handler_thread = None
 
         self._concurrency_options = ObjectDict(
-            thread_safe=thread_safe, handler_thread=handler_thread)
+            thread_safe=thread_safe, handler_thread=handler_thread,
+            handler_pool_size=handler_pool_size)
 
     def start(self, timeout=None):
         """Start the server in a new thread.
@@ -1410,6 +2350,35 @@ class DeviceServerBase(object):
         """
         return None
 
+    def on_client_falling_behind(self, conn):
+        """Called when a client starts falling behind on the messages sent.
+
+        Only called if the server's SLOW_CLIENT_POLICY is 'pause-sampling'.
+        Subclasses should override to stop generating asynchronous informs
+        for the client until :meth:`on_client_caught_up` is called. Called in
+        the IOLoop thread.
+
+        Parameters
+        ----------
+        conn : ClientConnection object
+            The client connection that is falling behind.
+
+        """
+        pass
+
+    def on_client_caught_up(self, conn):
+        """Called when a client that fell behind has caught up again.
+
+        See :meth:`on_client_falling_behind`.
+
+        Parameters
+        ----------
+        conn : ClientConnection object
+            The client connection that caught up.
+
+        """
+        pass
+
     def sync_with_ioloop(self, timeout=None):
         """Block for ioloop to complete a loop if called from another thread.
 
@@ -1461,6 +2430,7 @@ class DeviceServer(DeviceServerBase):
       * request-timeout-hint (pre-standard only if protocol flags indicates
                               timeout hints, supported for KATCP v5.1 or later)
       * sensor-sampling-clear (non-standard)
+      * perf-stats (non-standard)
 
     .. [#restartf1] Restart relies on .set_restart_queue() being used to
       register a restart queue with the device. When the device needs to be
@@ -1504,6 +2474,73 @@ class DeviceServer(DeviceServerBase):
 
     SUPPORTED_PROTOCOL_MAJOR_VERSIONS = (4, 5)
 
+    SAMPLE_SCHEDULER_RESOLUTION = None
+    """Granularity in seconds of the timeouts of sampling strategies.
+
+    If None (the default), each sampling strategy adds its own timeouts to
+    the ioloop. Otherwise the timeouts of all the sampling strategies of the
+    device are run by a single SampleScheduler, which is much cheaper with
+    many periodic strategies. Deadlines are then rounded up to a multiple of
+    this many seconds, so updates may be sent up to this much later, and
+    timeouts that are due within the same interval are run together in one
+    pass. Should be set before clients set sampling strategies.
+
+    """
+
+    SENSOR_STATUS_BATCH_WINDOW = None
+    """Coalesce the #sensor-status informs sent to each client.
+
+    If None (the default), every sensor update is sent as a separate inform.
+    Otherwise the updates due for a client connection are buffered for this
+    many seconds and sent as multi-sensor #sensor-status informs, one per
+    distinct timestamp. A window of 0 buffers updates until the current ioloop
+    iteration completes. Should be set before clients connect.
+
+    """
+
+    SENSOR_INFORM_CHUNK_SIZE = 1000
+    """Number of #sensor-list or #sensor-value informs to send in one go.
+
+    Replies to ?sensor-list and ?sensor-value requests for up to this many
+    sensors are sent directly by the request handler. Larger replies are
+    streamed from the IOLoop in chunks of this many informs. Between chunks
+    the IOLoop is given a chance to run if more than MAX_LOOP_LATENCY seconds
+    have passed since it last ran, and sending waits for the client to catch
+    up if more than half of the server's MAX_WRITE_BUFFER_SIZE is buffered.
+    Requests from the same client are still handled in order, and the reply
+    is only sent after all the informs.
+
+    """
+    MAX_LOOP_LATENCY = 0.03
+    """Do not stream sensor informs for longer than this many seconds without
+    yielding to the ioloop"""
+
+    SENSOR_NAME_CACHE_SIZE = 64
+    """Number of recent ?sensor-list / ?sensor-value patterns to cache.
+
+    The sensor names matching each of the most recently used name patterns are
+    cached until a sensor is added or removed. Must be set before the device
+    server is constructed.
+
+    """
+
+    REQUEST_METRICS = False
+    """Record the number, failures and latency of requests by name.
+
+    If True, the requests handled are timed by a RequestMetrics object that
+    publishes the statistics as katcp.request.* sensors, and they are also
+    reported by ?perf-stats. If False (the default) the only overhead is a
+    check per request and reply. Must be set before the device server is
+    constructed.
+
+    Note that the sensors of each request name are added when it is first
+    replied to, and announced to all clients with an #interface-changed
+    inform. Every connected InspectingClient (and hence KATCPClientResource)
+    inspects the new sensors in response, so expect a burst of ?sensor-list
+    requests while the distinct requests are first being used.
+
+    """
+
     ## @var log
     # @brief DeviceLogger instance for sending log messages to the client.
 
@@ -1523,10 +2560,26 @@ class DeviceServer(DeviceServerBase):
         self.extra_versions = {}
         self._restart_queue = None
         self._sensors = {}  # map names to sensor objects
+        # sorted sensor names for ?sensor-list and ?sensor-value
+        self._sensor_names = SensorNameIndex(self.SENSOR_NAME_CACHE_SIZE)
         # map client sockets to map of sensors -> sampling strategies
         self._strategies = {}
+        # map (sensor, strategy name, params) to SharedSampleStrategy objects
+        # so that clients with identical strategies can share them
+        self._shared_strategies = {}
+        # map client connections to SensorStatusBatcher objects if
+        # SENSOR_STATUS_BATCH_WINDOW is set
+        self._sensor_status_batchers = {}
+        # SampleScheduler used by all sampling strategies, created on demand
+        self._sample_scheduler = None
+        # client connections whose sampling is paused because they are
+        # falling behind (see KATCPServer.SLOW_CLIENT_POLICY)
+        self._paused_clients = set()
         # For holding ClientConnection* instances of active connections
         self._client_conns = set()
+        if self.REQUEST_METRICS:
+            self._request_metrics = RequestMetrics(self)
+            self._server.request_metrics = self._request_metrics
 
         self.setup_sensors()
 
@@ -1582,9 +2635,44 @@ class DeviceServer(DeviceServerBase):
                   else self._strategies.get)
         strategies = getter(client_conn, None)
         if strategies is not None:
+            self._flush_sensor_status(client_conn)
             for sensor, strategy in list(strategies.items()):
                 strategy.cancel()
                 del strategies[sensor]
+        if remove_client:
+            self._paused_clients.discard(client_conn)
+            batcher = self._sensor_status_batchers.pop(client_conn, None)
+            if batcher is not None:
+                batcher.cancel()
+
+    def _get_sample_scheduler(self):
+        """Get the SampleScheduler for the current ioloop, if enabled."""
+        if self.SAMPLE_SCHEDULER_RESOLUTION is None:
+            return None
+        scheduler = self._sample_scheduler
+        if scheduler is None or scheduler.ioloop is not self.ioloop:
+            scheduler = self._sample_scheduler = SampleScheduler(
+                self.ioloop, self.SAMPLE_SCHEDULER_RESOLUTION)
+        return scheduler
+
+    def _get_sensor_status_batcher(self, client_conn):
+        """Get the SensorStatusBatcher of a client, creating it if needed."""
+        batcher = self._sensor_status_batchers.get(client_conn)
+        if batcher is None:
+            batcher = self._sensor_status_batchers[client_conn] = (
+                SensorStatusBatcher(client_conn.inform,
+                                    self.SENSOR_STATUS_BATCH_WINDOW,
+                                    self.ioloop))
+            # Send the buffered informs before any other message to the
+            # client, so that they are not overtaken
+            client_conn.set_send_hook(batcher.flush)
+        return batcher
+
+    def _flush_sensor_status(self, client_conn):
+        """Send the #sensor-status informs buffered for a client, if any."""
+        batcher = self._sensor_status_batchers.get(client_conn)
+        if batcher is not None:
+            batcher.flush()
 
     def on_client_disconnect(self, client_conn, msg, connection_valid):
         """Inform client it is about to be disconnected.
@@ -1614,11 +2702,25 @@ class DeviceServer(DeviceServerBase):
 
         try:
             self._client_conns.remove(client_conn)
+            if self._request_metrics is not None:
+                self._request_metrics.client_disconnected(client_conn)
             self.ioloop.add_callback(lambda: chain_future(remove_strategies(), f))
         except Exception:
             f.set_exc_info(sys.exc_info())
         return f
 
+    def on_client_falling_behind(self, client_conn):
+        """Pause the sampling strategies of a client that is falling behind."""
+        self._paused_clients.add(client_conn)
+        for strategy in self._strategies.get(client_conn, {}).values():
+            strategy.pause()
+
+    def on_client_caught_up(self, client_conn):
+        """Resume the sampling strategies of a client that caught up."""
+        self._paused_clients.discard(client_conn)
+        for strategy in self._strategies.get(client_conn, {}).values():
+            strategy.resume()
+
     def build_state(self):
         """Return build state string of the form name-major.minor[(a|b|rc)n]."""
         return "%s-%s.%s%s" % self.BUILD_INFO
@@ -1640,6 +2742,7 @@ class DeviceServer(DeviceServerBase):
 
         """
         self._sensors[sensor.name] = sensor
+        self._sensor_names.add(sensor.name)
 
     def has_sensor(self, sensor_name):
         """Whether the sensor with specified name is known."""
@@ -1661,11 +2764,13 @@ class DeviceServer(DeviceServerBase):
         else:
             sensor_name = sensor.name
         sensor = self._sensors.pop(sensor_name)
+        self._sensor_names.remove(sensor_name)
 
         def cancel_sensor_strategies():
-            for conn_strategies in self._strategies.values():
+            for client_conn, conn_strategies in self._strategies.items():
                 strategy = conn_strategies.pop(sensor, None)
                 if strategy:
+                    self._flush_sensor_status(client_conn)
                     strategy.cancel()
         self.ioloop.add_callback(cancel_sensor_strategies)
 
@@ -2001,6 +3106,59 @@ class DeviceServer(DeviceServerBase):
         return req.make_reply('ok', str(num_clients))
 
 
+    def request_perf_stats(self, req, msg):
+        """Request performance statistics of requests and clients.
+
+        Request statistics are only available if REQUEST_METRICS is set on
+        the device server, in which case they are sent first, ordered by
+        request name. Latencies are in seconds and percentiles are estimated
+        to within a factor of two.
+
+        Informs
+        -------
+        request : str
+            'request', followed by the request name, the number of requests
+            replied to, the number that did not reply ok, and the median,
+            99th percentile and maximum latencies.
+        client : str
+            'client', followed by the client address, the number of bytes
+            received from and sent to the client, and the most bytes ever
+            buffered for sending to the client.
+
+        Returns
+        -------
+        success : {'ok', 'fail'}
+            Whether sending the statistics succeeded.
+        informs : int
+            Number of #perf-stats inform messages sent.
+
+        Examples
+        --------
+        ::
+
+            ?perf-stats
+            #perf-stats request sensor-value 12 1 0.000160 0.000640 0.000712
+            #perf-stats client 127.0.0.1:53600 320 5478 1024
+            !perf-stats ok 2
+
+        """
+        num_informs = 0
+        if self._request_metrics is not None:
+            snapshot = self._request_metrics.snapshot()
+            for name in sorted(snapshot):
+                stats = snapshot[name]
+                req.inform('request', name, stats['count'], stats['failures'],
+                           '%.6f' % stats['latency_p50'],
+                           '%.6f' % stats['latency_p99'],
+                           '%.6f' % stats['latency_max'])
+                num_informs += 1
+        for conn in list(self._client_conns):
+            stats = conn.traffic_stats()
+            req.inform('client', conn.address, stats['bytes_in'],
+                       stats['bytes_out'], stats['max_buffered'])
+            num_informs += 1
+        return req.make_reply('ok', str(num_informs))
+
     @minimum_katcp_version(5, 0)
     def request_version_list(self, req, msg):
         """Request the list of versions of roles and subcomponents.
@@ -2110,21 +3268,104 @@ class DeviceServer(DeviceServerBase):
             !sensor-list ok 2
 
         """
-        exact, name_filter = construct_name_filter(msg.arguments[0]
-                                                   if msg.arguments else None)
-        sensors = [(name, sensor) for name, sensor in
-                   sorted(self._sensors.iteritems()) if name_filter(name)]
+        exact, sensors = self._match_sensors(msg.arguments[0]
+                                             if msg.arguments else None)
 
         if exact and not sensors:
             return req.make_reply("fail", "Unknown sensor name.")
 
-        self._send_sensor_value_informs(req, sensors)
-        return req.make_reply("ok", str(len(sensors)))
+        return self._reply_with_sensor_informs(
+            req, sensors, self._sensor_list_inform_args)
+
+    def _match_sensors(self, pattern):
+        """Find the sensors whose names match a ?sensor-list style pattern.
 
-    def _send_sensor_value_informs(self, req, sensors):
-        for name, sensor in sensors:
-            req.inform(name, sensor.description, sensor.units, sensor.stype,
-                       *sensor.formatted_params)
+        Parameters
+        ----------
+        pattern : None or str
+            Pattern as for :func:`construct_name_filter`.
+
+        Returns
+        -------
+        exact : bool
+            True if the pattern is expected to match exactly.
+        sensors : list of (name, Sensor object) tuples
+            The matching sensors, sorted by name.
+
+        """
+        exact, names = self._sensor_names.match(pattern)
+        sensors = []
+        for name in names:
+            sensor = self._sensors.get(name)
+            # The sensor may have been removed by another thread
+            if sensor is not None:
+                sensors.append((name, sensor))
+        return exact, sensors
+
+    def _sensor_list_inform_args(self, name, sensor):
+        return ((name, sensor.description, sensor.units, sensor.stype) +
+                tuple(sensor.formatted_params))
+
+    def _sensor_value_inform_args(self, name, sensor):
+        timestamp, status, value = sensor.read_formatted(
+            self.PROTOCOL_INFO.major)
+        return timestamp, "1", name, status, value
+
+    def _reply_with_sensor_informs(self, req, sensors, inform_args):
+        """Send an inform per sensor followed by an 'ok' reply.
+
+        Parameters
+        ----------
+        req : ClientRequestConnection object
+            The request being replied to.
+        sensors : list of (name, Sensor object) tuples
+            The sensors to send informs for.
+        inform_args : callable, signature inform_args(name, sensor)
+            Returns the arguments of the inform for a sensor.
+
+        Returns
+        -------
+        reply : Message object or Future
+            The reply message if the informs have been sent, or a future
+            resolving with the reply message once the informs have been
+            streamed from the IOLoop (see SENSOR_INFORM_CHUNK_SIZE).
+
+        """
+        reply = req.make_reply("ok", str(len(sensors)))
+        if len(sensors) <= self.SENSOR_INFORM_CHUNK_SIZE:
+            for name, sensor in sensors:
+                req.inform(*inform_args(name, sensor))
+            return reply
+        f = Future()
+        self.ioloop.add_callback(lambda: chain_future(
+            self._stream_sensor_informs(req, sensors, inform_args, reply), f))
+        return f
+
+    @gen.coroutine
+    def _stream_sensor_informs(self, req, sensors, inform_args, reply):
+        client = req.client_connection
+        chunk_size = self.SENSOR_INFORM_CHUNK_SIZE
+        high_water = self._server.MAX_WRITE_BUFFER_SIZE // 2
+        yielded_at = self.ioloop.time()
+        for start in range(0, len(sensors), chunk_size):
+            if start:
+                buffered = client.write_buffer_size()
+                if buffered is None:
+                    # Client disconnected, don't bother with the rest
+                    raise AsyncReply()
+                if buffered > high_water:
+                    # Wait for the client to catch up
+                    try:
+                        yield client.flush()
+                    except iostream.StreamClosedError:
+                        raise AsyncReply()
+                    yielded_at = self.ioloop.time()
+                elif self.ioloop.time() - yielded_at > self.MAX_LOOP_LATENCY:
+                    yield gen.moment
+                    yielded_at = self.ioloop.time()
+            for name, sensor in sensors[start:start + chunk_size]:
+                req.inform(*inform_args(name, sensor))
+        raise gen.Return(reply)
 
     def request_sensor_value(self, req, msg):
         """Request the value of a sensor or sensors.
@@ -2175,19 +3416,14 @@ class DeviceServer(DeviceServerBase):
             !sensor-value ok 1
 
         """
-        exact, name_filter = construct_name_filter(msg.arguments[0]
-                                                   if msg.arguments else None)
-        sensors = [(name, sensor) for name, sensor in
-                   sorted(self._sensors.iteritems()) if name_filter(name)]
+        exact, sensors = self._match_sensors(msg.arguments[0]
+                                             if msg.arguments else None)
 
         if exact and not sensors:
             return req.make_reply("fail", "Unknown sensor name.")
 
-        katcp_version = self.PROTOCOL_INFO.major
-        for name, sensor in sensors:
-            timestamp, status, value = sensor.read_formatted(katcp_version)
-            req.inform(timestamp, "1", name, status, value)
-        return req.make_reply("ok", str(len(sensors)))
+        return self._reply_with_sensor_informs(
+            req, sensors, self._sensor_value_inform_args)
 
     def request_sensor_sampling(self, req, msg):
         """Configure or query the way a sensor is sampled.
@@ -2199,6 +3435,9 @@ class DeviceServer(DeviceServerBase):
         ----------
         name : str
             Name of the sensor whose sampling strategy to query or configure.
+            If the protocol flags include BULK_SET_SENSOR_SAMPLING, a
+            comma-separated list of sensor names may be given to configure
+            all of them with the same strategy.
         strategy : {'none', 'auto', 'event', 'differential', \
                     'period', 'event-rate'}, optional
             Type of strategy to use to report the sensor value. The
@@ -2241,6 +3480,9 @@ class DeviceServer(DeviceServerBase):
             ?sensor-sampling cpu.power.on period 500
             !sensor-sampling ok cpu.power.on period 500
 
+            ?sensor-sampling cpu.power.on,fan.speed event
+            !sensor-sampling ok cpu.power.on,fan.speed event
+
         """
         f = Future()
         self.ioloop.add_callback(lambda: chain_future(
@@ -2253,11 +3495,18 @@ class DeviceServer(DeviceServerBase):
             raise FailReply("No sensor name given.")
 
         name = msg.arguments[0]
+        if (len(msg.arguments) > 1 and
+                self.PROTOCOL_INFO.bulk_set_sensor_sampling):
+            # Set the same strategy on a comma-separated list of sensors
+            names = name.split(',')
+        else:
+            names = [name]
 
-        if name not in self._sensors:
-            raise FailReply("Unknown sensor name: %s." % name)
+        for sensor_name in names:
+            if sensor_name not in self._sensors:
+                raise FailReply("Unknown sensor name: %s." % sensor_name)
 
-        sensor = self._sensors[name]
+        sensors = [self._sensors[sensor_name] for sensor_name in names]
         # The client connection that is not specific to this request context
         client = req.client_connection
         katcp_version = self.PROTOCOL_INFO.major
@@ -2278,33 +3527,57 @@ class DeviceServer(DeviceServerBase):
                              if katcp_version >= SEC_TS_KATCP_MAJOR
                              else format_inform_v4)
 
-            def inform_callback(sensor, reading):
-                """Inform callback for sensor strategy."""
-                timestamp, status, value = reading
-                cb_msg = format_inform(sensor, timestamp, status, value)
-                client.inform(cb_msg)
-
             if katcp_version < SEC_TS_KATCP_MAJOR and strategy == 'period':
                 # Slightly nasty hack, but since period is the only v4 strategy
                 # involving timestamps it's not _too_ nasty :)
                 params = [float(params[0]) * MS_TO_SEC_FAC] + params[1:]
-            new_strategy = SampleStrategy.get_strategy(
-                strategy, inform_callback, sensor, *params, ioloop=self.ioloop)
-
-            # Remove and cancel old strategy
-            old_strategy = self._strategies[client].pop(sensor, None)
-            if old_strategy:
-                old_strategy.cancel()
 
-            # todo: replace isinstance check with something better
-            if not isinstance(new_strategy, SampleNone):
-                self._strategies[client][sensor] = new_strategy
-                new_strategy.start()
-
-        current_strategy = self._strategies[client].get(sensor, None)
+            # Clients asking for the same strategy on the same sensor share a
+            # single strategy instance and formatted inform message. Create
+            # them all before subscribing, so that a bulk request with invalid
+            # parameters changes none of the strategies.
+            shared_strategies = []
+            for sensor in sensors:
+                key = (sensor, strategy, tuple(params))
+                shared_strategy = self._shared_strategies.get(key)
+                if shared_strategy is None:
+                    shared_strategy = SharedSampleStrategy(
+                        format_inform, strategy, sensor, *params,
+                        ioloop=self.ioloop,
+                        scheduler=self._get_sample_scheduler(),
+                        on_empty=partial(self._shared_strategies.pop, key,
+                                         None))
+                shared_strategies.append((sensor, key, shared_strategy))
+
+            for sensor, key, shared_strategy in shared_strategies:
+                # Remove and cancel old strategy, unless it is the one we are
+                # about to subscribe to again (which would stop it if it was
+                # the last)
+                old_strategy = self._strategies[client].pop(sensor, None)
+                if (old_strategy and
+                        old_strategy.shared_strategy is not shared_strategy):
+                    self._flush_sensor_status(client)
+                    old_strategy.cancel()
+
+                # todo: replace isinstance check with something better
+                if not isinstance(shared_strategy.strategy, SampleNone):
+                    if self.SENSOR_STATUS_BATCH_WINDOW is None:
+                        send_inform = client.inform
+                    else:
+                        send_inform = self._get_sensor_status_batcher(
+                            client).inform
+                    self._shared_strategies[key] = shared_strategy
+                    subscription = shared_strategy.subscribe(
+                        client, send_inform)
+                    if client in self._paused_clients:
+                        subscription.pause()
+                    self._strategies[client][sensor] = subscription
+
+        # All the sensors of a bulk request now have the same strategy
+        current_strategy = self._strategies[client].get(sensors[0], None)
         if not current_strategy:
             current_strategy = SampleStrategy.get_strategy(
-                "none", lambda *args: None, sensor)
+                "none", lambda *args: None, sensors[0])
 
         strategy, params = current_strategy.get_sampling_formatted()
         if katcp_version < SEC_TS_KATCP_MAJOR and strategy == 'period':
@@ -1034,3 +1034,140 @@ class test_AsyncClientTimeoutsIntegrated(test_AsyncClientIntegratedBase):
         self.assertRegexpMatches(
             reply.arguments[1],
             r"Request slow-command timed out after .* seconds.")
+
+    @tornado.testing.gen_test()
+    def test_shared_timeout_sweep(self):
+        def request_hang(server, req, msg):
+            raise katcp.AsyncReply()
+        self.server._request_handlers = dict(
+            self.server._request_handlers, hang=request_hang)
+        yield self.client.until_connected()
+        t0 = self.io_loop.time()
+        futures = [self.client.future_request(Message.request('hang'),
+                                              timeout=timeout)
+                   for timeout in (3, 1, 2, 1)]
+        # Requests with the same name are tracked in the order they were sent
+        self.assertEqual(len(self.client._async_id_stack['hang']), 4)
+        # A single ioloop timeout for the earliest deadline
+        self.assertEqual(self.client._timeout_sweep_time, t0 + 1)
+        self.set_ioloop_time(t0 + 1.0001)
+        yield self.wake_ioloop()
+        self.assertEqual([f.done() for f in futures],
+                         [False, True, False, True])
+        self.assertEqual(self.client._timeout_sweep_time, t0 + 2)
+        self.set_ioloop_time(t0 + 3.0001)
+        yield self.wake_ioloop()
+        self.assertTrue(all(f.done() for f in futures))
+        for f in futures:
+            reply, informs = f.result()
+            self.assertRegexpMatches(reply.arguments[1],
+                                     r"Request hang timed out after .* seconds.")
+        self.assertEqual(self.client._async_queue, {})
+        self.assertEqual(self.client._async_id_stack, {})
+        self.assertEqual(self.client._timeout_heap, [])
+        self.assertIsNone(self.client._timeout_sweep_handle)
+
+
+class test_AsyncClientFutureRequests(test_AsyncClientIntegratedBase):
+    def setUp(self):
+        super(test_AsyncClientFutureRequests, self).setUp()
+        self.requests = []
+        def request_hang(server, req, msg):
+            self.requests.append((req, msg))
+            raise katcp.AsyncReply()
+        self.server._request_handlers = dict(
+            self.server._request_handlers, hang=request_hang)
+        self.client.start()
+
+    @tornado.testing.gen_test()
+    def test_future_requests(self):
+        yield self.client.until_protocol()
+        self.client.send_messages = mock.Mock(
+            wraps=self.client.send_messages)
+        msgs = [Message.request('hang', i) for i in range(5)]
+        futures = self.client.future_requests(msgs, window=2)
+        yield self.server.until_messages(2)
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(self.client.send_messages.call_count, 1)
+        # Replies free up space in the window, in a single batch
+        for req, msg in self.requests:
+            req.reply('ok', *msg.arguments)
+        yield self.server.until_messages(4)
+        self.assertEqual(len(self.requests), 4)
+        self.assertEqual(self.client.send_messages.call_count, 2)
+        for req, msg in self.requests[2:]:
+            req.reply('ok', *msg.arguments)
+        yield self.server.until_messages(5)
+        req, msg = self.requests[4]
+        req.inform('progress')
+        req.reply('fail', 'oops')
+        results = yield futures
+        self.assertEqual([reply.arguments for reply, informs in results],
+                         [['ok', '0'], ['ok', '1'], ['ok', '2'], ['ok', '3'],
+                          ['fail', 'oops']])
+        self.assertEqual([len(informs) for reply, informs in results],
+                         [0, 0, 0, 0, 1])
+        self.assertEqual(self.client._async_queue, {})
+
+    @tornado.testing.gen_test()
+    def test_future_requests_disconnected(self):
+        yield self.client.until_protocol()
+        self.server.stop()
+        yield self.client._disconnected.until_set()
+        futures = self.client.future_requests(
+            [Message.request('hang') for i in range(3)], window=1)
+        results = yield futures
+        for reply, informs in results:
+            self.assertFalse(reply.reply_ok())
+
+
+class test_AsyncClientRequestTelemetry(test_AsyncClientIntegratedBase):
+    def setUp(self):
+        super(test_AsyncClientRequestTelemetry, self).setUp()
+        def request_hang(server, req, msg):
+            raise katcp.AsyncReply()
+        self.server._request_handlers = dict(
+            self.server._request_handlers, hang=request_hang)
+        self.client.start()
+
+    @tornado.testing.gen_test()
+    def test_request_telemetry(self):
+        self.assertEqual(self.client.request_stats(), {})
+        records = []
+        self.client.enable_request_telemetry(records.append)
+        no_help_messages = len(self.server._request_handlers)
+        yield self.client.until_protocol()
+        t0 = self.io_loop.time()
+        help_future = self.client.future_request(Message.request('help'))
+        self.set_ioloop_time(t0 + 0.5)
+        yield help_future
+        yield self.client.future_request(Message.request('raise-fail'))
+        hang_future = self.client.future_request(Message.request('hang'),
+                                                 timeout=1)
+        self.set_ioloop_time(t0 + 1.5001)
+        yield hang_future
+        hang_future = self.client.future_request(Message.request('hang'))
+        self.client._disconnect()
+        yield hang_future
+
+        self.assertEqual([(r.name, r.outcome, r.latency, r.informs)
+                          for r in records],
+                         [('help', 'ok', 0.5, no_help_messages),
+                          ('raise-fail', 'fail', 0.0, 0),
+                          ('hang', 'timeout', None, 0),
+                          ('hang', 'abandoned', None, 0)])
+        stats = self.client.request_stats()
+        self.assertEqual(sorted(stats), ['hang', 'help', 'raise-fail'])
+        help_stats = stats['help']
+        self.assertEqual((help_stats['sent'], help_stats['count'],
+                          help_stats['failures'], help_stats['informs']),
+                         (1, 1, 0, no_help_messages))
+        self.assertEqual(help_stats['latency_max'], 0.5)
+        self.assertEqual(help_stats['bytes_out'], len('?help[1]\n'))
+        self.assertEqual(help_stats['bytes_in'], records[0].bytes_in)
+        self.assertGreater(help_stats['bytes_in'], help_stats['bytes_out'])
+        self.assertEqual(stats['raise-fail']['failures'], 1)
+        hang_stats = stats['hang']
+        self.assertEqual((hang_stats['sent'], hang_stats['count'],
+                          hang_stats['timeouts'], hang_stats['abandoned']),
+                         (2, 0, 1, 1))
@@ -15,10 +15,12 @@ import logging
 import unittest
 #
 
+import mock
 import tornado
 
 import katcp
-from katcp.core import Sensor, AsyncState, AsyncEvent, until_some
+from katcp.core import (Sensor, AsyncState, AsyncEvent, LazyAttrDict,
+                        RequestStats, until_some)
 from katcp.testutils import TestLogHandler, DeviceTestSensor
 
 log_handler = TestLogHandler()
@@ -58,6 +60,33 @@ class TestMessage(unittest.TestCase):
         self.assertEqual(str(katcp.Message.inform("foo", "a", "b", mid=123)),
                          "#foo[123] a b")
 
+    def test_trusted(self):
+        args = ["a", "b"]
+        m = katcp.Message.trusted(katcp.Message.REPLY, "foo", args, "12")
+        self.assertEqual(m, katcp.Message.reply("foo", "a", "b", mid=12))
+        self.assertIs(m.arguments, args)
+        m = katcp.Message.trusted(katcp.Message.INFORM, "foo")
+        self.assertEqual(m.arguments, [])
+        self.assertEqual(m.mid, None)
+
+    def test_to_wire(self):
+        m = katcp.Message.request("foo", "a b", 1)
+        self.assertEqual(m.to_wire(), "?foo a\\_b 1\n")
+        self.assertIs(m.to_wire(), m.to_wire())
+        self.assertEqual(str(m), "?foo a\\_b 1")
+        # Changes to the message must invalidate the cached serialization
+        m.mid = "5"
+        self.assertEqual(m.to_wire(), "?foo[5] a\\_b 1\n")
+        m.arguments = ["a b", "2"]
+        self.assertEqual(m.to_wire(), "?foo[5] a\\_b 2\n")
+        m.arguments = []
+        self.assertEqual(m.to_wire(), "?foo[5]\n")
+        m.name = "bar"
+        m.mtype = katcp.Message.REPLY
+        self.assertEqual(m.to_wire(), "!bar[5]\n")
+        # The cache does not affect message equality
+        self.assertEqual(m, katcp.Message.reply("bar", mid=5))
+
     def test_equality(self):
         class AlwaysEqual(object):
             def __eq__(self, other):
@@ -162,6 +191,20 @@ class TestMessageParser(unittest.TestCase):
         self.assertEqual(m.arguments, ["a", "b", "c"])
         self.assertEqual(m.mid, "1234")
 
+    def test_fast_and_slow_paths(self):
+        """Test that lines with and without escapes parse consistently."""
+        m_fast = self.p.parse("#sensor-status 1234.5  1\tfoo.bar nominal 5 ")
+        m_slow = self.p.parse("#sensor-status 1234.5  1\tfoo.bar nominal 5 \\\\")
+        self.assertEqual(m_fast.arguments,
+                         ["1234.5", "1", "foo.bar", "nominal", "5"])
+        self.assertEqual(m_slow.arguments, m_fast.arguments + ["\\"])
+        self.assertEqual(m_fast, katcp.Message.inform(
+            "sensor-status", "1234.5", "1", "foo.bar", "nominal", "5"))
+        # Unescaped specials are still rejected
+        self.assertRaises(katcp.KatcpSyntaxError, self.p.parse, "?foo a\x1b")
+        self.assertRaises(katcp.KatcpSyntaxError, self.p.parse, "?foo a\rb")
+        self.assertRaises(katcp.KatcpSyntaxError, self.p.parse, "?foo-[12")
+
     def test_message_argument_formatting(self):
         float_val = 2.35532342334233294e17
         m = katcp.Message.request(
@@ -183,6 +226,11 @@ class TestProtocolFlags(unittest.TestCase):
         self.assertEqual(PF.parse_version("5.1-MTI"),
                          PF(5, 1, set([PF.MULTI_CLIENT, PF.MESSAGE_IDS,
                                        PF.REQUEST_TIMEOUT_HINTS])))
+        # Check bulk sensor sampling flag
+        pf = PF.parse_version("5.1-BMI")
+        self.assertEqual(pf, PF(5, 1, set([PF.MULTI_CLIENT, PF.MESSAGE_IDS,
+                                           PF.BULK_SET_SENSOR_SAMPLING])))
+        self.assertTrue(pf.bulk_set_sensor_sampling)
 
     def test_str(self):
         PF = katcp.ProtocolFlags
@@ -207,6 +255,10 @@ class TestProtocolFlags(unittest.TestCase):
         with self.assertRaises(ValueError):
             PF(5, 0, [PF.REQUEST_TIMEOUT_HINTS])
 
+        # Katcp v5.0 and below don't support bulk sensor sampling
+        with self.assertRaises(ValueError):
+            PF(5, 0, [PF.BULK_SET_SENSOR_SAMPLING])
+
 
 class TestSensor(unittest.TestCase):
 
@@ -440,6 +492,148 @@ class TestSensor(unittest.TestCase):
         self.assertEqual(len(Sensor.STATUSES), len(valid_statuses))
         self.assertEqual(len(Sensor.STATUS_NAMES), len(valid_statuses))
 
+    def test_compact(self):
+        """Test that sensors keep their attributes out of instance dicts."""
+        s1 = Sensor.integer('int.sensor', params=[0, 10])
+        s2 = Sensor.integer('int.sensor2')
+        d1 = Sensor.discrete('discrete.sensor', params=['on', 'off'])
+        self.assertEqual(s1.__dict__, {})
+        # Parameterless kattypes are shared, discrete ones are not
+        self.assertIs(s1._kattype, s2._kattype)
+        self.assertEqual(d1._kattype._values, ['on', 'off'])
+        # Observer sets are only allocated when an observer is attached
+        self.assertIs(s1._observers, s2._observers)
+        observer = mock.Mock()
+        s1.attach(observer)
+        s1.set_value(3)
+        observer.update.assert_called_once_with(s1, s1.read())
+        self.assertEqual(s2._observers, set())
+        s2.detach(observer)
+        s1.detach(observer)
+        self.assertEqual(s1._observers, set())
+        # Other attributes can still be set
+        s2.custom = 'value'
+        self.assertEqual(s2.custom, 'value')
+
+    def test_formatter_parser_override(self):
+        """Test that subclasses can replace the formatter and parser."""
+        class HexSensor(Sensor):
+            def __init__(self, *args, **kwargs):
+                self._formatter = lambda value, errors, major=None: hex(value)
+                self._parser = lambda s_value, major: int(s_value, 16)
+                super(HexSensor, self).__init__(*args, **kwargs)
+
+        s = HexSensor(Sensor.INTEGER, 'hex.sensor', params=[0, 255])
+        self.assertEqual(s.formatted_params, ['0x0', '0xff'])
+        self.assertEqual(s.parse_value('0x1f'), 31)
+        s.set(1.0, Sensor.NOMINAL, 31)
+        self.assertEqual(s.format_reading(s.read())[2], '0x1f')
+        # Other sensors are not affected
+        s2 = Sensor.integer('int.sensor', params=[0, 255])
+        self.assertEqual(s2.formatted_params, ['0', '255'])
+        self.assertEqual(s2.__dict__, {})
+
+
+class TestLazyAttrDict(unittest.TestCase):
+
+    def test_lazy_values(self):
+        created = []
+        def factory(key, arg):
+            created.append(key)
+            return (key, arg)
+        d = LazyAttrDict(factory)
+        LazyAttrDict.add_lazy(d, 'a', 1)
+        LazyAttrDict.add_lazy(d, 'items', 2)
+        d['b'] = 3
+        # Lazy keys are present, but their values are not created yet
+        self.assertEqual(sorted(d), ['a', 'b', 'items'])
+        self.assertEqual(len(d), 3)
+        self.assertIn('a', d)
+        self.assertEqual(created, [])
+        # Values are created once, on first access by attribute or key
+        self.assertEqual(d.a, ('a', 1))
+        self.assertEqual(d['a'], ('a', 1))
+        self.assertEqual(created, ['a'])
+        self.assertEqual(LazyAttrDict.get(d, 'items'), ('items', 2))
+        self.assertEqual(LazyAttrDict.get(d, 'c', 4), 4)
+        with self.assertRaises(AttributeError):
+            d.c
+        with self.assertRaises(KeyError):
+            d['c']
+        # Removing a key does not create its value
+        LazyAttrDict.add_lazy(d, 'd')
+        self.assertTrue(LazyAttrDict.discard(d, 'd'))
+        self.assertFalse(LazyAttrDict.discard(d, 'd'))
+        self.assertEqual(created, ['a', 'items'])
+        LazyAttrDict.add_lazy(d, 'e', 5)
+        self.assertEqual(sorted(LazyAttrDict.items(d)),
+                         [('a', ('a', 1)), ('b', 3), ('e', ('e', 5)),
+                          ('items', ('items', 2))])
+
+    def test_dict_semantics(self):
+        d = LazyAttrDict(lambda key, arg: arg)
+        LazyAttrDict.add_lazy(d, 'a', 1)
+        LazyAttrDict.add_lazy(d, 'b', 2)
+        # Lazy values are created wherever the values are needed
+        self.assertEqual(dict(d), {'a': 1, 'b': 2})
+        LazyAttrDict.add_lazy(d, 'c', 3)
+        updated = {}
+        updated.update(d)
+        self.assertEqual(updated, {'a': 1, 'b': 2, 'c': 3})
+        LazyAttrDict.add_lazy(d, 'd', 4)
+        self.assertEqual(d.copy(), {'a': 1, 'b': 2, 'c': 3, 'd': 4})
+        self.assertIs(type(d.copy()), dict)
+        LazyAttrDict.add_lazy(d, 'e', 5)
+        self.assertEqual(d, {'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5})
+        self.assertEqual({'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5}, d)
+        self.assertNotEqual(d, {'a': 1})
+        LazyAttrDict.add_lazy(d, 'f', 6)
+        self.assertIn("'f': 6", repr(d))
+        LazyAttrDict.add_lazy(d, 'g', 7)
+        self.assertEqual(d.setdefault('g', 0), 7)
+        self.assertEqual(d.setdefault('h', 8), 8)
+        self.assertEqual(d.h, 8)
+        d.clear()
+        LazyAttrDict.add_lazy(d, 'i', 9)
+        self.assertEqual(d.popitem(), ('i', 9))
+        self.assertEqual(len(d), 0)
+        # Keys shadow methods as attributes, like AttrDict
+        d.keys = 10
+        self.assertEqual(d.keys, 10)
+        self.assertEqual(LazyAttrDict.keys(d), ['keys'])
+        del d.keys
+        self.assertNotIn('keys', d)
+        LazyAttrDict.add_lazy(d, 'has_key', 11)
+        self.assertEqual(d.has_key, 11)
+        self.assertTrue(LazyAttrDict.has_key(d, 'has_key'))
+        self.assertFalse(callable(d.has_key))
+        self.assertTrue(callable(d.items))
+
+    def test_default_factory(self):
+        d = LazyAttrDict(lambda key, arg: arg, default_factory=list)
+        LazyAttrDict.add_lazy(d, 'a', 1)
+        self.assertEqual(d.a, 1)
+        self.assertEqual(d.b, [])
+        self.assertEqual(sorted(d), ['a', 'b'])
+
+
+class TestRequestStats(unittest.TestCase):
+    def test_percentile(self):
+        stats = RequestStats()
+        self.assertEqual(stats.percentile(99), 0.0)
+        for i in range(99):
+            stats.add(1e-4, False)
+        stats.add(1.0, True)
+        self.assertEqual(stats.count, 100)
+        self.assertEqual(stats.failures, 1)
+        # 1e-4 falls in the bucket with upper bound 1.6e-4
+        self.assertAlmostEqual(stats.percentile(50), 1.6e-4)
+        self.assertAlmostEqual(stats.percentile(99), 1.6e-4)
+        self.assertEqual(stats.percentile(100), 1.0)
+        summary = stats.summary()
+        self.assertAlmostEqual(summary['latency_mean'], 0.010099)
+        self.assertEqual(summary['latency_max'], 1.0)
+
 
 class TestAsyncState(tornado.testing.AsyncTestCase):
 
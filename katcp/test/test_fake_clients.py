@@ -113,7 +113,8 @@ class test_FakeKATCPClientResource(tornado.testing.AsyncTestCase):
         yield DUT.until_state('syncing')
         yield DUT.until_synced()
         self.assertEqual(len(DUT.sensor), 2)
-        self.assertEqual(sorted(dict.keys(DUT.sensor)), ['a_string', 'an_int'])
+        self.assertEqual(sorted(dict(DUT.sensor).keys()),
+                         ['a_string', 'an_int'])
 
 class test_FakeKATCPClientResourceContainer(tornado.testing.AsyncTestCase):
     def setUp(self):
@@ -138,7 +139,7 @@ class test_FakeKATCPClientResourceContainer(tornado.testing.AsyncTestCase):
         DUT_manager.add_sensors('client_2', sensor_info)
         yield DUT.until_any_child_in_state('syncing')
         yield DUT.until_synced()
-        self.assertEqual(sorted(dict.keys(DUT.sensor)),
+        self.assertEqual(sorted(dict(DUT.sensor).keys()),
                          ['client_2_a_string', 'client_2_an_int'])
         client1_sensor_info = dict(sensor_info)
         client1_sensor_info['uniquely-1'] = ('Unique client2 sensor', '', 'boolean')
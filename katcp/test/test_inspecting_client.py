@@ -3,6 +3,8 @@ from __future__ import division
 import logging
 import time
 import collections
+import shutil
+import tempfile
 import unittest2 as unittest
 
 import tornado
@@ -322,6 +324,84 @@ class TestInspectingClientAsync(tornado.testing.AsyncTestCase):
         self.assertNotIn('another.int', self.client.sensors)
 
 
+    @tornado.testing.gen_test
+    def test_incremental_resync(self):
+        """Test that only sensors named by #interface-changed are inspected."""
+        yield self.client.until_synced()
+        self.client.inspect = mock.Mock(wraps=self.client.inspect)
+        self.client.inspect_sensors = mock.Mock(
+            wraps=self.client.inspect_sensors)
+
+        sensor = DeviceTestSensor(Sensor.INTEGER, "another.int",
+                                  "An Integer.",
+                                  "count", [-5, 5], timestamp=time.time(),
+                                  status=Sensor.NOMINAL, value=3)
+        self.server.add_sensor(sensor)
+        self.server.mass_inform(Message.inform(
+            'interface-changed', 'sensor-list', 'another.int', 'added'))
+        # Do a blocking request to ensure #interface-changed has been received
+        yield self.client.simple_request('watchdog')
+        yield self.client.until_synced()
+        self.assertIn('another.int', self.client.sensors)
+        self.client.inspect_sensors.assert_called_once_with(
+            'another.int', timeout=mock.ANY)
+        self.assertFalse(self.client.inspect.called)
+
+        # A change that does not match the inspection causes a full resync
+        self.server.mass_inform(Message.inform(
+            'interface-changed', 'sensor-list', 'an.int', 'removed'))
+        yield self.client.simple_request('watchdog')
+        yield self.client.until_synced()
+        self.assertEqual(self.client.inspect.call_count, 1)
+        self.assertIn('an.int', self.client.sensors)
+
+        # Informs without arguments also cause a full resync
+        self.server.remove_sensor(sensor)
+        self.server.mass_inform(Message.inform('interface-changed'))
+        yield self.client.simple_request('watchdog')
+        yield self.client.until_synced()
+        self.assertEqual(self.client.inspect.call_count, 2)
+        self.assertNotIn('another.int', self.client.sensors)
+
+    @tornado.testing.gen_test
+    def test_periodic_model_check(self):
+        """Test that missed interface changes are found by the model check."""
+        self.client.full_resync_interval = 0.05
+        yield self.client.until_synced()
+        self.client.inspect = mock.Mock(wraps=self.client.inspect)
+        self.client._check_model = mock.Mock(wraps=self.client._check_model)
+        # A passing check does not cause a resync
+        yield katcp.core.until_later(0.2)
+        self.assertTrue(self.client._check_model.called)
+        self.assertFalse(self.client.inspect.called)
+        self.assertTrue(self.client.synced)
+
+        # Add a sensor without announcing it
+        sensor = DeviceTestSensor(Sensor.INTEGER, "another.int",
+                                  "An Integer.",
+                                  "count", [-5, 5], timestamp=time.time(),
+                                  status=Sensor.NOMINAL, value=3)
+        self.server.add_sensor(sensor)
+        while 'another.int' not in self.client.sensors:
+            yield katcp.core.until_later(0.01)
+        self.assertEqual(self.client.inspect.call_count, 1)
+
+    @tornado.testing.gen_test
+    def test_no_model_check_before_inspection(self):
+        """Test that a model that was never inspected is not checked."""
+        client = InspectingClientAsync(self.host, self.port,
+                                       ioloop=self.io_loop,
+                                       initial_inspection=False)
+        client.full_resync_interval = 0.05
+        client._check_model = mock.Mock(wraps=client._check_model)
+        client.inspect = mock.Mock(wraps=client.inspect)
+        yield client.connect()
+        yield client.until_synced()
+        yield katcp.core.until_later(0.2)
+        self.assertFalse(client._check_model.called)
+        self.assertFalse(client.inspect.called)
+        self.assertTrue(client.synced)
+
     @tornado.testing.gen_test
     def test_request_add_remove(self):
         """Test a request being added and then remove it."""
@@ -412,6 +492,21 @@ class TestInspectingClientAsync(tornado.testing.AsyncTestCase):
         yield self.client.simple_request('sensor-value', 'an.int')
         self.assertEqual(sens.read().value, test_val)
 
+    @tornado.testing.gen_test
+    def test_update_sensor(self):
+        yield self.client.until_synced()
+        # Readings of sensors without cached objects create the object first
+        f = self.client.update_sensor('an.int', '1234.5', 'warn', '3')
+        yield f
+        sens = yield self.client.future_get_sensor('an.int')
+        self.assertEqual(sens.read().value, 3)
+        # Readings of cached sensors are applied synchronously
+        self.assertIsNone(
+            self.client.update_sensor('an.int', '1235.5', 'nominal', '4'))
+        reading = sens.read()
+        self.assertEqual(reading.value, 4)
+        self.assertEqual(reading.timestamp, 1235.5)
+
     @tornado.testing.gen_test
     def test_factories(self):
         yield self.client.until_connected()
@@ -571,6 +666,114 @@ class TestInspectingClientAsyncStateCallback(tornado.testing.AsyncTestCase):
         yield self._test_inspection_error(
             'break_sensor_list', 'Sensor-list is broken')
 
+class TestDeviceModelCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.DUT = inspecting_client.DeviceModelCache(self.directory)
+
+    def test_save_load(self):
+        self.assertIsNone(self.DUT.load('host:1234 device-1.0 build-1'))
+        requests_index = {'watchdog': {'name': 'watchdog',
+                                       'description': 'Check alive.',
+                                       'timeout_hint': None,
+                                       'obj': object()}}
+        sensors_index = {'an.int': {'description': 'An Integer.',
+                                    'units': 'count',
+                                    'sensor_type': 'integer',
+                                    'params': ['-5', '5'],
+                                    '_changed': True}}
+        self.DUT.save('host:1234 device-1.0 build-1',
+                      requests_index, sensors_index)
+        requests, sensors = self.DUT.load('host:1234 device-1.0 build-1')
+        self.assertEqual(requests, {'watchdog': {'name': 'watchdog',
+                                                 'description': 'Check alive.',
+                                                 'timeout_hint': None}})
+        self.assertEqual(sensors, {'an.int': {'description': 'An Integer.',
+                                              'units': 'count',
+                                              'sensor_type': 'integer',
+                                              'params': ['-5', '5']}})
+        self.assertIsInstance(sensors.keys()[0], str)
+        # Other builds of the device are not cached
+        self.assertIsNone(self.DUT.load('host:1234 device-1.0 build-2'))
+
+
+class TestInspectingClientAsyncModelCache(tornado.testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TestInspectingClientAsyncModelCache, self).setUp()
+        self.server = DeviceTestServer('', 0)
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+        self.host, self.port = self.server.bind_address
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.model_cache = inspecting_client.DeviceModelCache(self.directory)
+
+    @tornado.gen.coroutine
+    def _get_synced_client(self):
+        client = InspectingClientAsync(self.host, self.port,
+                                       ioloop=self.io_loop)
+        client.model_cache = self.model_cache
+        client.inspect = mock.Mock(wraps=client.inspect)
+        client._check_model = mock.Mock(wraps=client._check_model)
+        client.model_changes = []
+        client.model_changed = katcp.core.AsyncEvent()
+        def state_cb(state, model_changes):
+            if model_changes:
+                client.model_changes.append(model_changes)
+                client.model_changed.set()
+        client.set_state_callback(state_cb)
+        client.validated = katcp.core.AsyncEvent()
+        validate = client._validate_cached_model
+        def validate_and_notify():
+            f = validate()
+            f.add_done_callback(lambda f: client.validated.set())
+            return f
+        client._validate_cached_model = validate_and_notify
+        yield client.connect()
+        yield client.until_synced()
+        client.model_changed.clear()
+        raise tornado.gen.Return(client)
+
+    @tornado.testing.gen_test
+    def test_sync_from_cache(self):
+        client1 = yield self._get_synced_client()
+        self.assertEqual(client1.inspect.call_count, 1)
+        self.assertFalse(client1.validated.is_set())
+
+        # A new client is synced from the cache before inspecting the device
+        client2 = yield self._get_synced_client()
+        self.assertEqual(client2.inspect.call_count, 0)
+        self.assertEqual(client2._model_cache_key, client1._model_cache_key)
+        self.assertEqual(set(client2.sensors), set(client1.sensors))
+        self.assertEqual(set(client2.requests), set(client1.requests))
+        # The cached model is validated without inspecting the device
+        yield client2.validated.until_set()
+        self.assertEqual(client2._check_model.call_count, 1)
+        self.assertEqual(client2.inspect.call_count, 0)
+
+    @tornado.testing.gen_test
+    def test_sync_from_outdated_cache(self):
+        yield self._get_synced_client()
+        sensor = DeviceTestSensor(Sensor.INTEGER, "another.int",
+                                  "An Integer.",
+                                  "count", [-5, 5], timestamp=time.time(),
+                                  status=Sensor.NOMINAL, value=3)
+        self.server.add_sensor(sensor)
+
+        client = yield self._get_synced_client()
+        self.assertNotIn('another.int', client.sensors)
+        # Validation reports the sensor that was not in the cache
+        yield client.model_changed.until_set()
+        self.assertEqual(client.inspect.call_count, 1)
+        self.assertIn('another.int', client.sensors)
+        self.assertEqual(client.model_changes[-1].sensors.added,
+                         set(['another.int']))
+        # The cache is updated with the new sensor
+        requests, sensors = self.model_cache.load(client._model_cache_key)
+        self.assertIn('another.int', sensors)
+
+
 class Test_InformHookDeviceClient(tornado.testing.AsyncTestCase):
     def setUp(self):
         super(Test_InformHookDeviceClient, self).setUp()
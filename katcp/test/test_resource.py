@@ -104,6 +104,94 @@ class test_KATCPSensor(TimewarpAsyncTestCase):
         # Check that no stray listeners are left behind
         self.assertFalse(DUT._listeners)
 
+class test_ListenerDispatcher(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(test_ListenerDispatcher, self).setUp()
+        self.DUT = resource.ListenerDispatcher(ioloop=self.io_loop)
+        sensor_manager = mock.Mock()
+        sensor_manager.time.return_value = 1234.5
+        self.sensors = [
+            resource.KATCPSensor(dict(sensor_type=Sensor.INTEGER,
+                                      name='test.int%d' % i),
+                                 sensor_manager, self.DUT)
+            for i in range(2)]
+
+    @tornado.testing.gen_test
+    def test_dispatch(self):
+        sensor0, sensor1 = self.sensors
+        listener = mock.Mock()
+        reading_listener = mock.Mock()
+        batch_listener = mock.Mock()
+        sensor0.register_listener(listener)
+        sensor0.register_listener(reading_listener, reading=True)
+        self.DUT.register_batch_listener(batch_listener)
+        for value in range(3):
+            sensor0.set_value(value, timestamp=1000.0 + value)
+        sensor1.set_value(10)
+        # Listeners are only called at the end of the ioloop iteration
+        self.assertFalse(listener.called)
+        self.assertFalse(batch_listener.called)
+        yield tornado.gen.moment
+        # Only with the latest reading of each sensor
+        listener.assert_called_once_with(1234.5, 1002.0, 'nominal', 2)
+        reading_listener.assert_called_once_with(sensor0, sensor0.reading)
+        batch_listener.assert_called_once_with(
+            {sensor0: sensor0.reading, sensor1: sensor1.reading})
+
+        sensor1.set_value(11)
+        yield tornado.gen.moment
+        self.assertEqual(listener.call_count, 1)
+        self.assertEqual(batch_listener.call_count, 2)
+        self.DUT.unregister_batch_listener(batch_listener)
+        sensor1.set_value(12)
+        yield tornado.gen.moment
+        self.assertEqual(batch_listener.call_count, 2)
+
+    @tornado.testing.gen_test
+    def test_immediate_listeners(self):
+        sensor0, sensor1 = self.sensors
+        listener = mock.Mock()
+        immediate_listener = mock.Mock()
+        sensor0.register_listener(listener)
+        sensor0.register_listener(immediate_listener, immediate=True)
+        for value in range(3):
+            sensor0.set_value(value, timestamp=1000.0 + value)
+        # Immediate listeners see every reading as it arrives
+        self.assertEqual([call[0][3] for call in
+                          immediate_listener.call_args_list], [0, 1, 2])
+        yield tornado.gen.moment
+        listener.assert_called_once_with(1234.5, 1002.0, 'nominal', 2)
+        self.assertEqual(immediate_listener.call_count, 3)
+        # Waiting catches brief conditions that the dispatcher would skip
+        sensor1._manager.get_sampling_strategy.return_value = ('event', )
+        sensor1.set_value(0)
+        waiter = sensor1.wait(1, timeout=1)
+        yield tornado.gen.moment
+        sensor1.set_value(1)
+        sensor1.set_value(2)
+        result = yield waiter
+        self.assertTrue(result)
+        self.assertFalse(sensor1._listeners)
+
+    @tornado.testing.gen_test
+    def test_listener_stats(self):
+        sensor0, sensor1 = self.sensors
+        def on_update(received_timestamp, timestamp, status, value):
+            pass
+        sensor0.register_listener(on_update)
+        sensor1.register_listener(on_update)
+        sensor0.set_value(1)
+        sensor1.set_value(1)
+        yield tornado.gen.moment
+        sensor0.set_value(2)
+        yield tornado.gen.moment
+        stats = self.DUT.listener_stats()
+        name = __name__ + '.on_update'
+        self.assertEqual(list(stats), [name])
+        self.assertEqual(stats[name].calls, 3)
+        self.assertGreaterEqual(stats[name].total_time, stats[name].max_time)
+
+
 class ConcreteKATCPRequest(resource.KATCPRequest):
     def issue_request(self, *args, **kwargs):
         pass
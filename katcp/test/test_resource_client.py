@@ -382,6 +382,36 @@ class test_KATCPClientResource_Integrated(tornado.testing.AsyncTestCase):
                          sorted(n.replace('-', '_')
                                 for n in self.server.request_names))
 
+    @tornado.testing.gen_test(timeout=1)
+    def test_set_sampling_strategies(self):
+        DUT = yield self._get_DUT_and_sync(self.default_resource_spec)
+        n_msgs = len(self.server.messages)
+        result = yield DUT.set_sampling_strategies('', 'event')
+        self.assertEqual(result, {name: 'event' for name in DUT.sensor})
+        for name in DUT.sensor:
+            self.assertEqual(DUT.sensor[name].sampling_strategy, ('event',))
+        sampling_msgs = [msg for msg in self.server.messages[n_msgs:]
+                         if msg.name == 'sensor-sampling']
+        self.assertEqual(len(sampling_msgs), len(DUT.sensor))
+
+    @tornado.testing.gen_test(timeout=1)
+    def test_set_sampling_strategies_bulk(self):
+        self.server.PROTOCOL_INFO = ProtocolFlags(5, 1, [
+            ProtocolFlags.MULTI_CLIENT, ProtocolFlags.MESSAGE_IDS,
+            ProtocolFlags.BULK_SET_SENSOR_SAMPLING])
+        self.server.add_sensor(Sensor.boolean('a-bool'))
+        DUT = yield self._get_DUT_and_sync(self.default_resource_spec)
+        n_msgs = len(self.server.messages)
+        result = yield DUT.set_sampling_strategies('', ('period', 10))
+        self.assertEqual(result, {name: ('period', 10) for name in DUT.sensor})
+        for name in DUT.sensor:
+            self.assertEqual(DUT.sensor[name].sampling_strategy,
+                             ('period', '10.0'))
+        # All the sensors are set using a single request
+        sampling_msgs = [msg for msg in self.server.messages[n_msgs:]
+                         if msg.name == 'sensor-sampling']
+        self.assertEqual(len(sampling_msgs), 1)
+
     @tornado.testing.gen_test(timeout=1)
     def test_active(self):
         DUT = yield self._get_DUT_and_sync(self.default_resource_spec)
@@ -409,6 +439,61 @@ class test_KATCPClientResource_Integrated(tornado.testing.AsyncTestCase):
                         sorted(n.replace('-', '_').replace('.', '_')
                                for n in self.server.sensor_names))
 
+    @tornado.testing.gen_test(timeout=1)
+    def test_lazy_sensors(self):
+        self.server.add_sensor(Sensor.float('a.float'))
+        self.server.add_sensor(Sensor.boolean('a.boolean'))
+        DUT = yield self._get_DUT_and_sync(self.default_resource_spec)
+        ic = DUT._inspecting_client
+        # Sensor objects are only created when first looked up
+        self.assertEqual(ic._sensor_object_cache, {})
+        sensor = DUT.sensor.an_int
+        self.assertEqual(sensor.name, 'an.int')
+        self.assertEqual(list(ic._sensor_object_cache), ['an.int'])
+        self.assertIs(DUT.sensor['an_int'], sensor)
+        # Listing the sensors creates only those that match the filter
+        result = yield DUT.list_sensors('a_float')
+        self.assertEqual([s.name for s in result], ['a.float'])
+        self.assertEqual(sorted(ic._sensor_object_cache),
+                         ['a.float', 'an.int'])
+        # Setting a listener creates the sensor object
+        yield DUT.set_sensor_listener('a.boolean', lambda *args: None)
+        self.assertIn('a.boolean', ic._sensor_object_cache)
+        with self.assertRaises(AttributeError):
+            DUT.sensor.no_such_sensor
+
+    @tornado.testing.gen_test(timeout=1)
+    def test_wait_all_any(self):
+        sensors = [Sensor.integer('int.sensor%d' % i, default=0,
+                                  initial_status=Sensor.NOMINAL)
+                   for i in range(3)]
+        for sensor in sensors:
+            self.server.add_sensor(sensor)
+        DUT = yield self._get_DUT_and_sync(self.default_resource_spec)
+        yield DUT.set_sampling_strategies('int_sensor', 'event')
+        conditions = {'int.sensor0': 1,
+                      'int.sensor1': lambda reading: reading.value > 0,
+                      'int.sensor2': 0}
+        with self.assertRaises(resource.KATCPSensorError):
+            yield DUT.wait_all({'an.int': 0})
+        # Conditions that are never all satisfied
+        result = yield DUT.wait_all(conditions, timeout=0.05)
+        self.assertFalse(result)
+        self.assertEqual(result, {'int.sensor0': False, 'int.sensor1': False,
+                                  'int.sensor2': True})
+        # A single condition is enough for wait_any()
+        result = yield DUT.wait_any(conditions, timeout=0.05)
+        self.assertTrue(result)
+        # Conditions that are satisfied as readings arrive
+        for sensor in sensors[:2]:
+            self.io_loop.add_callback(sensor.set_value, 1)
+        result = yield DUT.wait_all(conditions, timeout=0.5)
+        self.assertTrue(result)
+        self.assertTrue(all(result.values()))
+        for sensor in sensors:
+            self.assertFalse(
+                DUT.sensor[resource.escape_name(sensor.name)]._listeners)
+
     @tornado.testing.gen_test(timeout=1)
     def test_interface_change(self):
         DUT = yield self._get_DUT_and_sync(self.default_resource_spec)
@@ -1168,6 +1253,38 @@ class test_KATCPClientResourceContainerIntegrated(tornado.testing.AsyncTestCase)
                 self.assertTrue(result[client.name])
             else:
                 self.assertFalse(result[client.name])
+        # Stragglers that satisfy the condition in the grace period count too
+        other_client = list(DUT.children.keys())[1]
+        self.io_loop.call_later(
+            0.05, self.servers[other_client].get_sensor('wait_sensor').set_value,
+            1)
+        result = yield group.wait('wait_sensor', 1, timeout=1.0, quorum=1,
+                                  max_grace_period=0.2)
+        self.assertTrue(result)
+        self.assertTrue(result[selected_client])
+        self.assertTrue(result[other_client])
+        # No listeners are left behind
+        for client in list(DUT.children.values()):
+            self.assertFalse(client.sensor.wait_sensor._listeners)
+        # Without a grace period all the stragglers are waited for
+        for i, server in enumerate(self.servers.values()):
+            self.io_loop.call_later(0.05 * i,
+                                    server.get_sensor('wait_sensor').set_value,
+                                    3)
+        result = yield group.wait('wait_sensor', 3, timeout=0.02, quorum=1,
+                                  max_grace_period=0)
+        self.assertTrue(all(result.values()))
+        for server in self.servers.values():
+            server.get_sensor('wait_sensor').set_value(1)
+        # The container can wait on the sensors of all its children at once
+        conditions = dict((resource.escape_name(name) + '_wait_sensor', 1)
+                          for name in (selected_client, other_client))
+        result = yield DUT.wait_all(conditions, timeout=0.1)
+        self.assertTrue(result)
+        conditions = dict((resource.escape_name(name) + '_wait_sensor', 2)
+                          for name in DUT.children)
+        result = yield DUT.wait_any(conditions, timeout=0.05)
+        self.assertFalse(result)
 
 
 class test_AttrMappingProxy(unittest.TestCase):
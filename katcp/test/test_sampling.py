@@ -430,3 +430,201 @@ class TestSampling(TimewarpAsyncTestCase):
 
 
 
+
+    @tornado.testing.gen_test(timeout=200)
+    def test_shared_strategy(self):
+        on_empty = mock.Mock()
+        DUT = sampling.SharedSampleStrategy(
+            sampling.format_inform_v5, 'auto', self.sensor, on_empty=on_empty)
+        msgs1, msgs2 = [], []
+        sub1 = DUT.subscribe('client1', msgs1.append)
+        yield self.wake_ioloop()
+        # The initial update is sent by the newly started strategy
+        self.assertEqual(len(msgs1), 1)
+        # A second subscriber gets an immediate update of its own
+        sub2 = DUT.subscribe('client2', msgs2.append)
+        self.assertEqual(len(msgs1), 1)
+        self.assertEqual(len(msgs2), 1)
+        self.assertEqual(DUT.subscriber_count(), 2)
+        self.assertEqual(sub2.get_sampling_formatted(), ('auto', []))
+        # Updates are formatted once and shared by all subscribers
+        self.sensor.set(self.ioloop_time, Sensor.WARN, 5)
+        self.assertEqual(len(msgs1), 2)
+        self.assertIs(msgs1[-1], msgs2[-1])
+        self.assertEqual(
+            str(msgs1[-1]),
+            '#sensor-status {0:.6f} 1 an.int warn 5'.format(self.ioloop_time))
+        # Paused subscribers miss updates, but get the current reading when
+        # they are resumed
+        sub2.pause()
+        self.sensor.set(self.ioloop_time, Sensor.NOMINAL, 7)
+        self.assertEqual(len(msgs1), 3)
+        self.assertEqual(len(msgs2), 2)
+        self.assertEqual(DUT.subscriber_count(), 2)
+        sub2.resume()
+        self.assertEqual(len(msgs2), 3)
+        self.assertEqual(
+            str(msgs2[-1]),
+            '#sensor-status {0:.6f} 1 an.int nominal 7'.format(
+                self.ioloop_time))
+        sub2.resume()
+        self.assertEqual(len(msgs2), 3)
+        # Nothing is formatted while every subscriber is paused
+        sub1.pause()
+        sub2.pause()
+        with mock.patch.object(DUT, '_format_inform') as format_inform:
+            self.sensor.set(self.ioloop_time, Sensor.NOMINAL, 8)
+        self.assertFalse(format_inform.called)
+        sub1.resume()
+        sub2.resume()
+        self.assertEqual(len(msgs1), 4)
+        self.assertEqual(len(msgs2), 4)
+        # Cancelling one subscription leaves the strategy running
+        sub1.cancel()
+        self.sensor.set(self.ioloop_time, Sensor.NOMINAL, 6)
+        self.assertEqual(len(msgs1), 4)
+        self.assertEqual(len(msgs2), 5)
+        self.assertFalse(on_empty.called)
+        # Until the last subscriber leaves
+        sub2.cancel()
+        on_empty.assert_called_once_with()
+        yield self.wake_ioloop()
+        self.assertFalse(DUT.strategy in self.sensor._observers)
+
+
+class TestSensorStatusBatcher(TimewarpAsyncTestCase):
+
+    def setUp(self):
+        super(TestSensorStatusBatcher, self).setUp()
+        self.msgs = []
+
+    def _inform(self, timestamp, name, status, value):
+        return katcp.Message.inform(
+            'sensor-status', timestamp, 1, name, status, value)
+
+    @tornado.testing.gen_test(timeout=200)
+    def test_coalesce(self):
+        DUT = sampling.SensorStatusBatcher(self.msgs.append, ioloop=self.io_loop)
+        DUT.inform(self._inform('1.0', 'a', 'nominal', 1))
+        DUT.inform(self._inform('1.0', 'b', 'warn', 2))
+        DUT.inform(self._inform('2.0', 'c', 'nominal', 3))
+        DUT.inform(self._inform('1.0', 'c', 'nominal', 4))
+        DUT.inform(self._inform('1.0', 'a', 'error', 5))
+        self.assertEqual(self.msgs, [])
+        yield self.wake_ioloop()
+        # Updates sharing a timestamp are combined, but c's second update
+        # must not be sent before its first
+        self.assertEqual([str(m) for m in self.msgs], [
+            '#sensor-status 1.0 2 a nominal 1 b warn 2',
+            '#sensor-status 2.0 1 c nominal 3',
+            '#sensor-status 1.0 2 c nominal 4 a error 5'])
+
+    @tornado.testing.gen_test(timeout=200)
+    def test_window(self):
+        DUT = sampling.SensorStatusBatcher(self.msgs.append, window=1,
+                                           ioloop=self.io_loop)
+        DUT.inform(self._inform('1.0', 'a', 'nominal', 1))
+        yield self.set_ioloop_time(0.5)
+        DUT.inform(self._inform('1.0', 'b', 'nominal', 2))
+        self.assertEqual(self.msgs, [])
+        yield self.set_ioloop_time(1)
+        self.assertEqual([str(m) for m in self.msgs], [
+            '#sensor-status 1.0 2 a nominal 1 b nominal 2'])
+        # Cancelled updates are never sent
+        DUT.inform(self._inform('2.0', 'a', 'nominal', 1))
+        DUT.cancel()
+        yield self.set_ioloop_time(3)
+        self.assertEqual(len(self.msgs), 1)
+
+
+class TestSampleScheduler(TimewarpAsyncTestCase):
+
+    def setUp(self):
+        super(TestSampleScheduler, self).setUp()
+        self.calls = []
+
+    def _callback(self, name):
+        return lambda: self.calls.append((name, self.ioloop_time))
+
+    @tornado.testing.gen_test(timeout=200)
+    def test_buckets(self):
+        DUT = sampling.SampleScheduler(self.io_loop, resolution=0.5)
+        self.io_loop.call_at = mock.Mock(wraps=self.io_loop.call_at)
+        DUT.call_at(1.2, self._callback('a'))
+        DUT.call_at(1.4, self._callback('b'))
+        removed = DUT.call_at(1.5, self._callback('c'))
+        DUT.call_at(2.1, self._callback('d'))
+        DUT.remove_timeout(removed)
+        # Timeouts due within the same resolution interval share one ioloop
+        # timeout, and only the earliest bucket is added to the ioloop
+        self.assertEqual(self.io_loop.call_at.call_count, 1)
+        yield self.set_ioloop_time(1.4)
+        self.assertEqual(self.calls, [])
+        yield self.set_ioloop_time(1.5)
+        self.assertEqual(self.calls, [('a', 1.5), ('b', 1.5)])
+        # Adding an earlier timeout reschedules the ioloop timeout
+        DUT.call_at(1.7, self._callback('e'))
+        yield self.set_ioloop_time(2.0)
+        self.assertEqual(self.calls[2:], [('e', 2.0)])
+        yield self.set_ioloop_time(2.5)
+        self.assertEqual(self.calls[3:], [('d', 2.5)])
+        self.assertEqual(DUT.timeout_count(), 0)
+
+    @tornado.testing.gen_test(timeout=200)
+    def test_remove_churn(self):
+        DUT = sampling.SampleScheduler(self.io_loop, resolution=0.5)
+        kept = DUT.call_at(150, self._callback('kept'))
+        for i in range(200):
+            # Long period strategies that are cancelled again
+            timeouts = [DUT.call_at(20 + i / 2, self._callback('removed'))
+                        for j in range(10)]
+            for timeout in timeouts:
+                DUT.remove_timeout(timeout)
+            DUT.remove_timeout(timeouts[0])
+        # Removed timeouts are dropped with their buckets and deadlines
+        self.assertEqual(DUT.timeout_count(), 1)
+        self.assertEqual(list(DUT._buckets), [150])
+        self.assertLess(len(DUT._deadlines), 100)
+        # Compacted once most of a bucket's timeouts are removed
+        timeouts = [DUT.call_at(150, self._callback('removed'))
+                    for i in range(100)]
+        for timeout in timeouts:
+            DUT.remove_timeout(timeout)
+        self.assertEqual(DUT.timeout_count(), 1)
+        self.assertLess(len(DUT._buckets[150]), 20)
+        yield self.set_ioloop_time(150)
+        self.assertEqual(self.calls, [('kept', 150)])
+        self.assertEqual(DUT.timeout_count(), 0)
+        DUT.remove_timeout(kept)
+
+    @tornado.testing.gen_test(timeout=200)
+    def test_strategies(self):
+        DUT = sampling.SampleScheduler(self.io_loop)
+        sensor = DeviceTestSensor(
+            Sensor.INTEGER, "an.int", "An integer.", "count", [-40, 30],
+            timestamp=self.ioloop_time, status=Sensor.NOMINAL, value=3)
+        informs = []
+        period1 = sampling.SamplePeriod(
+            lambda s, r: informs.append('period1'), sensor, 10, scheduler=DUT)
+        period2 = sampling.SamplePeriod(
+            lambda s, r: informs.append('period2'), sensor, 10, scheduler=DUT)
+        event_rate = sampling.SampleEventRate(
+            lambda s, r: informs.append('event-rate'), sensor, 0, 5,
+            scheduler=DUT)
+        for strategy in (period1, period2, event_rate):
+            strategy.start()
+        yield self.wake_ioloop()
+        self.assertEqual(sorted(informs), ['event-rate', 'period1', 'period2'])
+        informs[:] = []
+        yield self.set_ioloop_time(5)
+        self.assertEqual(informs, ['event-rate'])
+        yield self.set_ioloop_time(10)
+        self.assertEqual(informs, ['event-rate', 'period1', 'period2',
+                                   'event-rate'])
+        informs[:] = []
+        period1.cancel()
+        event_rate.cancel()
+        # Let the cancellations remove their timeouts before warping time
+        yield self.wake_ioloop()
+        yield self.set_ioloop_time(20)
+        self.assertEqual(informs, ['period2'])
@@ -0,0 +1,175 @@
+"""Tests for the sensor_bank module."""
+
+from __future__ import division, print_function, absolute_import
+
+import unittest
+
+import mock
+
+from thread import get_ident as get_thread_ident
+
+from katcp import Sensor
+from katcp.sampling import SampleStrategy, SampleDifferential
+
+try:
+    import numpy as np
+    from katcp.sensor_bank import SensorBank
+except ImportError:
+    np = None
+
+
+class Observer(object):
+    def __init__(self):
+        self.update = mock.Mock()
+
+
+class ChangesOnlyObserver(Observer):
+    CHANGES_ONLY = True
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestSensorBank(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = SensorBank(Sensor.INTEGER, ['s%d' % i for i in range(5)],
+                               'An integer sensor', 'counts', default=3)
+
+    def test_sensors(self):
+        self.assertEqual(len(self.bank), 5)
+        self.assertEqual([s.name for s in self.bank],
+                         ['s0', 's1', 's2', 's3', 's4'])
+        sensor = self.bank[2]
+        self.assertEqual(sensor.description, 'An integer sensor')
+        self.assertEqual(sensor.units, 'counts')
+        self.assertEqual(sensor.read()[1:], (Sensor.UNKNOWN, 3))
+        sensor.set(12.5, Sensor.WARN, 7)
+        reading = sensor.read()
+        self.assertEqual(reading, (12.5, Sensor.WARN, 7))
+        # Readings contain python values rather than numpy scalars
+        self.assertIs(type(reading.value), int)
+        self.assertIs(type(reading.timestamp), float)
+        self.assertEqual(self.bank.values[2], 7)
+        self.assertEqual(sensor.read_formatted(), ('12.500000', 'warn', '7'))
+
+    def test_unsupported_type(self):
+        with self.assertRaises(ValueError):
+            SensorBank(Sensor.STRING, ['s0'])
+
+    def test_set_many(self):
+        self.bank.set_many([1, 3], [10, 30], timestamp=5.0)
+        self.assertEqual([s.value() for s in self.bank], [3, 10, 3, 30, 3])
+        self.assertEqual(self.bank[3].read(), (5.0, Sensor.NOMINAL, 30))
+        self.assertEqual(self.bank[0].status(), Sensor.UNKNOWN)
+        self.bank.set_many(None, range(5), [Sensor.NOMINAL, Sensor.WARN,
+                                            Sensor.ERROR, Sensor.FAILURE,
+                                            Sensor.UNREACHABLE])
+        self.assertEqual([s.value() for s in self.bank], [0, 1, 2, 3, 4])
+        self.assertEqual(self.bank[4].status(), Sensor.UNREACHABLE)
+        self.bank.set_many(slice(1, 3), [20, 21], Sensor.ERROR, 6.0)
+        self.assertEqual(self.bank[2].read(), (6.0, Sensor.ERROR, 21))
+
+    def test_notification(self):
+        all_observer = Observer()
+        changes_observer = ChangesOnlyObserver()
+        self.bank[0].attach(all_observer)
+        self.bank[1].attach(all_observer)
+        self.bank[1].attach(changes_observer)
+        # Attaching twice does not count twice
+        self.bank[1].attach(changes_observer)
+
+        self.bank.set_many(None, [3, 3, 3, 3, 3], timestamp=1.0)
+        # Status changed from UNKNOWN to NOMINAL
+        all_observer.update.assert_any_call(
+            self.bank[0], (1.0, Sensor.NOMINAL, 3))
+        self.assertEqual(all_observer.update.call_count, 2)
+        changes_observer.update.assert_called_once_with(
+            self.bank[1], (1.0, Sensor.NOMINAL, 3))
+
+        all_observer.update.reset_mock()
+        changes_observer.update.reset_mock()
+        self.bank.set_many(None, [3, 3, 3, 3, 3], timestamp=2.0)
+        self.assertEqual(all_observer.update.call_count, 2)
+        self.assertFalse(changes_observer.update.called)
+        self.bank.set_many([1], [4], timestamp=3.0)
+        changes_observer.update.assert_called_once_with(
+            self.bank[1], (3.0, Sensor.NOMINAL, 4))
+
+        self.bank[1].detach(changes_observer)
+        self.bank[1].detach(changes_observer)
+        self.assertEqual(list(self.bank._change_observers), [0, 0, 0, 0, 0])
+        self.assertEqual(list(self.bank._all_observers), [1, 1, 0, 0, 0])
+
+    def test_float_and_boolean(self):
+        bank = SensorBank(Sensor.FLOAT, ['f0', 'f1'])
+        bank.set_many(None, [1.5, -2.25])
+        self.assertEqual([s.value() for s in bank], [1.5, -2.25])
+        bank = SensorBank(Sensor.BOOLEAN, ['b0', 'b1'])
+        bank.set_many(None, [True, False])
+        self.assertIs(bank[0].value(), True)
+        self.assertIs(bank[1].value(), False)
+
+    def test_sampling_strategies(self):
+        informs = []
+        inform = lambda sensor, reading: informs.append((sensor.name, reading))
+        event = SampleStrategy.get_strategy('event', inform, self.bank[0])
+        auto = SampleStrategy.get_strategy('auto', inform, self.bank[1])
+        self.assertTrue(event.CHANGES_ONLY)
+        self.assertFalse(auto.CHANGES_ONLY)
+        self.bank[0].attach(event)
+        self.bank[1].attach(auto)
+        self.assertEqual(list(self.bank._change_observers), [1, 0, 0, 0, 0])
+        self.assertEqual(list(self.bank._all_observers), [0, 1, 0, 0, 0])
+
+    def test_differential_strategy(self):
+        informs = []
+        inform = lambda sensor, reading: informs.append(reading.value)
+        sensor = self.bank[0]
+        diff = SampleStrategy.get_strategy('differential', inform, sensor, 5)
+        diff._ioloop_thread_id = get_thread_ident()
+        sensor.attach(diff)
+        diff.update = mock.Mock(wraps=diff.update)
+        for value in [3, 4, 6, 9, 10, 20, 21, 13]:
+            self.bank.set_many([0], [value], timestamp=1.0)
+        # Changes within the threshold of the last reported value are
+        # filtered out by the bank
+        self.assertEqual(informs, [3, 9, 20, 13])
+        self.assertEqual(diff.update.call_count, 4)
+        # Readings set on the sensor itself are tracked too
+        sensor.set(2.0, Sensor.NOMINAL, 16)
+        self.bank.set_many([0], [17], timestamp=3.0)
+        self.assertEqual(diff.update.call_count, 5)
+        self.bank.set_many([0], [19], timestamp=4.0)
+        self.assertEqual(informs, [3, 9, 20, 13, 19])
+
+        # Several differential strategies are notified of every change
+        informs2 = []
+        diff2 = SampleStrategy.get_strategy(
+            'differential', lambda s, r: informs2.append(r.value), sensor, 1)
+        diff2._ioloop_thread_id = get_thread_ident()
+        sensor.attach(diff2)
+        self.bank.set_many([0], [20], timestamp=5.0)
+        self.assertEqual((informs[-1], informs2), (19, [20]))
+        # The remaining strategy is tracked from its last reported reading
+        sensor.detach(diff2)
+        self.bank.set_many([0], [24], timestamp=6.0)
+        self.assertEqual(diff.update.call_count, 7)
+        self.bank.set_many([0], [25], timestamp=7.0)
+        self.assertEqual(informs, [3, 9, 20, 13, 19, 25])
+
+    def test_boolean_differential(self):
+        bank = SensorBank(Sensor.BOOLEAN, ['b0', 'b1'], default=False)
+        # The standard strategy is rejected when it is set
+        with self.assertRaises(ValueError):
+            SampleStrategy.get_strategy(
+                'differential', lambda s, r: None, bank[0], 1)
+        # Differential observers of boolean sensors do not break the bank
+        diff = mock.Mock(spec=SampleDifferential, CHANGES_ONLY=True,
+                         _threshold=0.5, _lastStatus=None)
+        bank[0].attach(diff)
+        bank.set_many(None, [True, True], timestamp=1.0)
+        bank.set_many(None, [True, False], timestamp=2.0)
+        bank[0].set(3.0, Sensor.NOMINAL, False)
+        bank.set_many([0], [True], timestamp=4.0)
+        self.assertEqual(
+            [args[1].value for args, _ in diff.update.call_args_list],
+            [True, False, True])
@@ -18,6 +18,7 @@ import thread
 import threading
 
 import mock
+import tornado.concurrent
 import tornado.testing
 
 import katcp
@@ -46,7 +47,7 @@ log_handler = TestLogHandler()
 logging.getLogger("katcp").addHandler(log_handler)
 logger = logging.getLogger(__name__)
 
-NO_HELP_MESSAGES = 16       # Number of requests on DeviceTestServer
+NO_HELP_MESSAGES = 17       # Number of requests on DeviceTestServer
 
 class test_ClientConnection(unittest.TestCase):
     def test_init(self):
@@ -286,6 +287,185 @@ class TestVersionCompatibility(unittest.TestCase):
         with self.assertRaises(ValueError):
             DeviceTestServerWrong('', 0)
 
+
+class FakeStream(object):
+    """Just enough of an IOStream for KATCPServer.send_message()."""
+    def __init__(self):
+        self._write_buffer_size = 0
+        self._write_futures = []
+        self.written = []
+        self.KATCPServer_address = ('127.0.0.1', 12345)
+        self.KATCPServer_closing = False
+        self.KATCPServer_held = None
+        self.KATCPServer_max_buffered = 0
+        self.KATCPServer_dropped = 0
+        self.KATCPServer_bytes_in = 0
+        self.KATCPServer_bytes_out = 0
+        self.KATCPServer_send_hook = None
+
+    def closed(self):
+        return False
+
+    def write(self, data):
+        if data:
+            self.written.append(data)
+            self._write_buffer_size += len(data)
+        f = tornado.concurrent.Future()
+        self._write_futures.append(f)
+        return f
+
+    def drain(self):
+        self._write_buffer_size = 0
+        for f in self._write_futures:
+            f.set_result(None)
+        self._write_futures = []
+
+
+class TestSlowClientPolicy(tornado.testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TestSlowClientPolicy, self).setUp()
+        self.device = mock.Mock()
+        self.server = katcp.server.KATCPServer(self.device, '', 0)
+        self.server.ioloop = self.io_loop
+        self.server.ioloop_thread_id = thread.get_ident()
+        self.server.SLOW_CLIENT_BUFFER_SIZE = 100
+        self.stream = FakeStream()
+        self.client_conn = mock.Mock()
+        self.server._connections[self.stream] = self.client_conn
+
+    def status(self, name, value):
+        return katcp.Message.inform('sensor-status', '1.0', '1', name,
+                                    'nominal', value)
+
+    def send(self, *msgs):
+        for msg in msgs:
+            self.server.send_message(self.stream, msg)
+
+    @tornado.testing.gen_test
+    def test_drop_sensor_status(self):
+        self.server.SLOW_CLIENT_POLICY = 'drop-sensor-status'
+        big = katcp.Message.inform('big', 'x' * 200)
+        self.send(self.status('a', 1), big, self.status('a', 2),
+                  self.status('b', 3), self.status('a', 4),
+                  katcp.Message.inform('other'))
+        # Only #sensor-status informs are held back, latest per sensor
+        self.assertEqual(self.stream.written, [
+            '#sensor-status 1.0 1 a nominal 1\n', str(big) + '\n',
+            '#other\n'])
+        stats = self.server.get_write_stats(self.stream)
+        self.assertEqual(stats, dict(buffered=246, max_buffered=246,
+                                     falling_behind=True, held=2, dropped=1))
+        self.stream.drain()
+        yield gen.moment
+        self.assertEqual(self.stream.written[3:], [
+            '#sensor-status 1.0 1 b nominal 3\n',
+            '#sensor-status 1.0 1 a nominal 4\n'])
+        self.assertFalse(
+            self.server.get_write_stats(self.stream)['falling_behind'])
+        self.assertFalse(self.device.on_client_falling_behind.called)
+
+    @tornado.testing.gen_test
+    def test_pause_sampling(self):
+        self.server.SLOW_CLIENT_POLICY = 'pause-sampling'
+        self.send(katcp.Message.inform('big', 'x' * 200), self.status('a', 1),
+                  self.status('a', 2))
+        self.assertEqual(len(self.stream.written), 1)
+        self.device.on_client_falling_behind.assert_called_once_with(
+            self.client_conn)
+        self.assertEqual(self.server.get_write_stats(self.stream)['dropped'],
+                         2)
+        self.stream.drain()
+        yield gen.moment
+        self.device.on_client_caught_up.assert_called_once_with(
+            self.client_conn)
+        self.assertEqual(len(self.stream.written), 1)
+        self.send(self.status('a', 3))
+        self.assertEqual(self.stream.written[1:],
+                         ['#sensor-status 1.0 1 a nominal 3\n'])
+
+    def test_mass_send(self):
+        self.server.SLOW_CLIENT_POLICY = 'drop-sensor-status'
+        other_stream = FakeStream()
+        self.server._connections[other_stream] = mock.Mock()
+        self.send(katcp.Message.inform('big', 'x' * 200))
+        # Mass sends follow the slow client policy of each client
+        status = self.status('a', 1)
+        self.server.mass_send_message(status)
+        self.assertEqual(len(self.stream.written), 1)
+        self.assertEqual(self.server.get_write_stats(self.stream)['held'], 1)
+        self.assertEqual(other_stream.written, [status.to_wire()])
+        self.assertEqual(other_stream.KATCPServer_bytes_out,
+                         len(status.to_wire()))
+
+    def test_disconnect(self):
+        self.send(katcp.Message.inform('big', 'x' * 200), self.status('a', 1))
+        # The default policy keeps writing
+        self.assertEqual(len(self.stream.written), 2)
+        self.assertEqual(self.server.get_write_stats(self.stream)['held'], 0)
+
+
+class TestSensorNameIndex(unittest.TestCase):
+    def setUp(self):
+        self.DUT = katcp.server.SensorNameIndex(cache_size=3)
+        for name in ['psu.voltage', 'cpu.temp', 'cpu.power.on', 'psu.current',
+                     'cpu.voltage', 'cpu']:
+            self.DUT.add(name)
+
+    def test_match(self):
+        DUT = self.DUT
+        self.assertEqual(len(DUT), 6)
+        self.assertEqual(DUT.match(None), (False, [
+            'cpu', 'cpu.power.on', 'cpu.temp', 'cpu.voltage', 'psu.current',
+            'psu.voltage']))
+        self.assertEqual(DUT.match('cpu.temp'), (True, ['cpu.temp']))
+        self.assertEqual(DUT.match('cpu.tem'), (True, []))
+        self.assertEqual(DUT.match('/voltage/'),
+                         (False, ['cpu.voltage', 'psu.voltage']))
+        self.assertEqual(DUT.match('/^cpu\./'),
+                         (False, ['cpu.power.on', 'cpu.temp', 'cpu.voltage']))
+        self.assertEqual(DUT.match('/^cpu?/'), (False, [
+            'cpu', 'cpu.power.on', 'cpu.temp', 'cpu.voltage']))
+        self.assertEqual(DUT.match('/^cpu|psu.c/'), (False, [
+            'cpu', 'cpu.power.on', 'cpu.temp', 'cpu.voltage', 'psu.current']))
+        self.assertEqual(DUT.match('/^(?i)CPU.T/'), (False, ['cpu.temp']))
+
+    def test_literal_prefix(self):
+        prefix = katcp.server.SensorNameIndex._literal_prefix
+        self.assertEqual(prefix(None), '')
+        self.assertEqual(prefix('cpu'), '')
+        self.assertEqual(prefix('/cpu/'), '')
+        self.assertEqual(prefix('/^cpu/'), 'cpu')
+        self.assertEqual(prefix('/^cpu.temp/'), 'cpu')
+        self.assertEqual(prefix('/^cpu\.temp/'), 'cpu')
+        self.assertEqual(prefix('/^cpu*/'), 'cp')
+        self.assertEqual(prefix('/^cpu{0,1}/'), 'cp')
+        self.assertEqual(prefix('/^cpu|psu/'), '')
+        self.assertEqual(prefix('/^cpu(?i)/'), '')
+
+    def test_cache(self):
+        DUT = self.DUT
+        self.assertEqual(DUT.match('/^psu/'),
+                         (False, ['psu.current', 'psu.voltage']))
+        # Cached results are reused
+        self.assertIs(DUT.match('/^psu/')[1], DUT.match('/^psu/')[1])
+        DUT.add('psu.power')
+        DUT.add('psu.power')
+        self.assertEqual(DUT.match('/^psu/'),
+                         (False, ['psu.current', 'psu.power', 'psu.voltage']))
+        self.assertEqual(DUT.match('psu.power'), (True, ['psu.power']))
+        DUT.remove('psu.power')
+        DUT.remove('psu.power')
+        self.assertEqual(DUT.match('/^psu/'),
+                         (False, ['psu.current', 'psu.voltage']))
+        self.assertEqual(DUT.match('psu.power'), (True, []))
+        self.assertNotIn('psu.power', DUT)
+        self.assertIn('psu.voltage', DUT)
+        # Least recently used patterns are evicted
+        DUT.match(None)
+        DUT.match('/^cpu/')
+        self.assertEqual(list(DUT._cache), ['psu.power', None, '/^cpu/'])
+
 katcp_version = __version__
 
 class test_DeviceServer(unittest.TestCase, TestUtilMixin):
@@ -335,6 +515,106 @@ class test_DeviceServer(unittest.TestCase, TestUtilMixin):
             '!sensor-sampling-clear ok'])
         self.server.clear_strategies.assert_called_once_with(client_connection)
 
+    def test_sensor_name_index(self):
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+        def listed(*args):
+            req = mock_req('sensor-list', *args)
+            reply = self.server.request_sensor_list(req, req.msg)
+            names = [call[0][0] for call in req.inform.call_args_list]
+            return str(reply), names
+
+        names = sorted(self.server._sensors)
+        self.assertEqual(listed(), ('!sensor-list ok %d' % len(names), names))
+        self.assertEqual(listed('/^an\\./')[1],
+                         [name for name in names if name.startswith('an.')])
+        self.server.add_sensor(katcp.Sensor.integer('an.aardvark'))
+        self.assertEqual(listed('/^an\\./')[1][0], 'an.aardvark')
+        self.assertEqual(listed('an.aardvark'), ('!sensor-list ok 1',
+                                                 ['an.aardvark']))
+        self.server.remove_sensor('an.aardvark')
+        self.assertEqual(listed(), ('!sensor-list ok %d' % len(names), names))
+        self.assertEqual(listed('an.aardvark'),
+                         ('!sensor-list fail Unknown\\_sensor\\_name.', []))
+
+    def test_streamed_sensor_informs(self):
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+        self.server.SENSOR_INFORM_CHUNK_SIZE = 2
+        for i in range(5):
+            self.server.add_sensor(katcp.Sensor.integer('streamed.int%d' % i))
+        names = sorted(self.server._sensors)
+        req = mock_req('sensor-list')
+        client = req.client_connection
+        # Pretend the client is slow after the first chunk
+        client.write_buffer_size.side_effect = (
+            [self.server._server.MAX_WRITE_BUFFER_SIZE] + [0] * len(names))
+        client.flush.return_value = gen.maybe_future(None)
+        reply = self.server.request_sensor_list(req, req.msg).result(timeout=1)
+        self.assertEqual(str(reply), '!sensor-list ok %d' % len(names))
+        self.assertEqual([call[0][0] for call in req.inform.call_args_list],
+                         names)
+        client.flush.assert_called_once_with()
+        # Stop streaming if the client disconnects
+        req = mock_req('sensor-value')
+        req.client_connection.write_buffer_size.return_value = None
+        reply = self.server.request_sensor_value(req, req.msg)
+        with self.assertRaises(katcp.core.AsyncReply):
+            reply.result(timeout=1)
+        self.assertEqual(req.inform.call_count, 2)
+
+    def test_shared_sampling_strategies(self):
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+        s = katcp.Sensor.integer('an-int', params=[0, 10])
+        s.set(1234, katcp.Sensor.NOMINAL, 3)
+        self.server.add_sensor(s)
+        self.server._strategies = defaultdict(lambda : {})
+        req1 = mock_req('sensor-sampling', 'an-int', 'event')
+        req2 = mock_req('sensor-sampling', 'an-int', 'event')
+        req3 = mock_req('sensor-sampling', 'an-int', 'period', 10)
+        for req in (req1, req2, req3):
+            self.server.request_sensor_sampling(req, req.msg).result(timeout=1)
+        client1, client2, client3 = [req.client_connection
+                                     for req in (req1, req2, req3)]
+        for client in (client1, client2, client3):
+            client.inform.assert_wait_call_count(count=1)
+        # Identical strategies are shared, different ones are not
+        self.assertEqual(len(self.server._shared_strategies), 2)
+        shared = self.server._strategies[client1][s].shared_strategy
+        self.assertIs(self.server._strategies[client2][s].shared_strategy,
+                      shared)
+        self.assertEqual(shared.subscriber_count(), 2)
+        # The same inform message is sent to both clients
+        self.server.ioloop.add_callback(s.set, 1235, katcp.Sensor.WARN, 4)
+        client1.inform.assert_wait_call_count(count=2)
+        client2.inform.assert_wait_call_count(count=2)
+        (msg1, ), _ = client1.inform.call_args
+        (msg2, ), _ = client2.inform.call_args
+        self.assertIs(msg1, msg2)
+        self._assert_msgs_equal(
+            [msg1], [r'#sensor-status 1235.000000 1 an-int warn 4'])
+        # Clients that fall behind have their strategies paused
+        self.server.ioloop.add_callback(
+            self.server.on_client_falling_behind, client1)
+        self.server.ioloop.add_callback(s.set, 1236, katcp.Sensor.WARN, 5)
+        client2.inform.assert_wait_call_count(count=3)
+        self.server.sync_with_ioloop()
+        self.assertEqual(client1.inform.call_count, 2)
+        self.server.ioloop.add_callback(
+            self.server.on_client_caught_up, client1)
+        client1.inform.assert_wait_call_count(count=3)
+        (msg1, ), _ = client1.inform.call_args
+        self._assert_msgs_equal(
+            [msg1], [r'#sensor-status 1236.000000 1 an-int warn 5'])
+        # Shared strategies are removed once nobody uses them anymore
+        self.server.ioloop.add_callback(self.server.clear_strategies, client1)
+        self.server.ioloop.add_callback(self.server.clear_strategies, client3)
+        self.server.sync_with_ioloop()
+        self.assertEqual(self.server._shared_strategies.keys(),
+                         [(s, 'event', ())])
+        self.server.ioloop.add_callback(self.server.clear_strategies, client2)
+        self.server.sync_with_ioloop()
+        self.assertEqual(self.server._shared_strategies, {})
+
     def test_has_sensor(self):
         self.assertFalse(self.server.has_sensor('blaah'))
         self.server.add_sensor(katcp.Sensor.boolean('blaah', 'blaah sens'))
@@ -378,6 +658,31 @@ class test_DeviceServer51(test_DeviceServer):
     def test_excluded_default_handlers(self):
         pass                  #  No excluded default handlers for v5.1 as of yet
 
+    def test_bulk_sensor_sampling(self):
+        self.server.PROTOCOL_INFO = katcp.ProtocolFlags(5, 1, [
+            katcp.ProtocolFlags.MULTI_CLIENT,
+            katcp.ProtocolFlags.MESSAGE_IDS,
+            katcp.ProtocolFlags.BULK_SET_SENSOR_SAMPLING])
+        self.server.add_sensor(katcp.Sensor.boolean('a-sens'))
+        start_thread_with_cleanup(self, self.server)
+        self.server.wait_running(timeout=1.)
+        self.server._strategies = defaultdict(lambda : {})
+        req = mock_req('sensor-sampling', 'an.int,a-sens', 'event')
+        reply = self.server.request_sensor_sampling(req, req.msg).result(
+            timeout=1)
+        self._assert_msgs_equal([reply],
+                                ['!sensor-sampling ok an.int,a-sens event'])
+        client = req.client_connection
+        self.assertEqual(
+            sorted(sensor.name for sensor in self.server._strategies[client]),
+            ['a-sens', 'an.int'])
+        # An unknown sensor fails the request without changing any strategies
+        req = mock_req('sensor-sampling', 'an.int,no.such', 'none',
+                       client_conn=client)
+        with self.assertRaises(FailReply):
+            self.server.request_sensor_sampling(req, req.msg).result(timeout=1)
+        self.assertEqual(len(self.server._strategies[client]), 2)
+
     def test_request_timeout_hint(self):
         req = mock_req('request-timeout-hint')
         handle_mock_req(self.server, req)
@@ -587,6 +892,7 @@ class TestDeviceServerClientIntegrated(unittest.TestCase, TestUtilMixin):
             (r"#help help", ""),
             (r"#help log-level", ""),
             (r"#help new-command", ""),
+            (r"#help perf-stats", ""),
             (r"#help raise-exception", ""),
             (r"#help raise-fail", ""),
             (r"#help restart", ""),
@@ -701,6 +1007,7 @@ class TestDeviceServerClientIntegrated(unittest.TestCase, TestUtilMixin):
             (r"#help[6] help", ""),
             (r"#help[6] log-level", ""),
             (r"#help[6] new-command", ""),
+            (r"#help[6] perf-stats", ""),
             (r"#help[6] raise-exception", ""),
             (r"#help[6] raise-fail", ""),
             (r"#help[6] restart", ""),
@@ -1011,6 +1318,86 @@ class TestDeviceServerClientIntegrated(unittest.TestCase, TestUtilMixin):
             tornado_future.result()
 
 
+class MetricsTestServer(DeviceTestServer):
+    REQUEST_METRICS = True
+
+
+class TestRequestMetrics(unittest.TestCase, TestUtilMixin):
+    def setUp(self):
+        self.server = MetricsTestServer('', 0)
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+        host, port = self.server.bind_address
+        self.client = BlockingTestClient(self, host, port)
+        start_thread_with_cleanup(self, self.client, start_timeout=1)
+        self.assertTrue(self.client.wait_protocol(timeout=1))
+
+    def sensor_value(self, name):
+        return self.server.get_sensor('katcp.request.' + name).value()
+
+    def test_request_metrics(self):
+        get_msgs = self.client.message_recorder(
+            whitelist=['interface-changed'], replies=False)
+        self.assertEqual(self.sensor_value('in-flight'), 0)
+        self.assertFalse(self.server.has_sensor('katcp.request.watchdog.count'))
+        self.client.assert_request_succeeds('watchdog')
+        self.client.assert_request_succeeds('watchdog')
+        self.client.assert_request_fails('raise-fail')
+        self.client.assert_request_fails('no-such-request',
+                                         status_equals='invalid')
+
+        self.assertEqual(self.sensor_value('watchdog.count'), 2)
+        self.assertEqual(self.sensor_value('watchdog.failures'), 0)
+        self.assertGreater(self.sensor_value('watchdog.latency-p99'), 0)
+        self.assertGreaterEqual(self.sensor_value('watchdog.latency-p99'),
+                                self.sensor_value('watchdog.latency-p50'))
+        self.assertEqual(self.sensor_value('raise-fail.count'), 1)
+        self.assertEqual(self.sensor_value('raise-fail.failures'), 1)
+        self.assertEqual(self.sensor_value('invalid'), 1)
+        self.assertEqual(self.sensor_value('in-flight'), 0)
+        self.assertFalse(
+            self.server.has_sensor('katcp.request.no-such-request.count'))
+        # Clients are told about the new sensors, in one inform per request
+        self.assertEqual(
+            [msg.arguments for msg in get_msgs(min_number=2)],
+            [sum([['sensor-list', 'katcp.request.%s.%s' % (name, suffix),
+                   'added']
+                  for suffix in ('count', 'failures', 'latency-p50',
+                                 'latency-p99')], [])
+             for name in ('watchdog', 'raise-fail')])
+
+        reply, informs = self.client.blocking_request(
+            katcp.Message.request('perf-stats'))
+        self.assertEqual(reply.arguments, ['ok', '3'])
+        self.assertEqual([inform.arguments[:4] for inform in informs[:2]],
+                         [['request', 'raise-fail', '1', '1'],
+                          ['request', 'watchdog', '2', '0']])
+        client_args = informs[2].arguments
+        self.assertEqual(client_args[0], 'client')
+        bytes_in, bytes_out = int(client_args[2]), int(client_args[3])
+        self.assertGreater(bytes_in, len('?watchdog\n') * 2)
+        self.assertGreater(bytes_out, bytes_in)
+
+    def test_client_disconnect(self):
+        host, port = self.server.bind_address
+        client = BlockingTestClient(self, host, port)
+        start_thread_with_cleanup(self, client, start_timeout=1)
+        self.assertTrue(client.wait_protocol(timeout=1))
+        client.request(katcp.Message.request('slow-command', '10'))
+        self.assertTrue(*self.client.wait_condition(
+            1, lambda: self.sensor_value('in-flight') == 1))
+        # The request of a disconnected client is no longer in flight
+        client.stop()
+        client.join(timeout=1)
+        self.assertTrue(*self.client.wait_condition(
+            1, lambda: self.sensor_value('in-flight') == 0))
+        self.assertEqual(self.server._request_metrics._pending_by_client, {})
+
+    def test_disabled(self):
+        server = DeviceTestServer('', 0)
+        self.assertIsNone(server._request_metrics)
+        self.assertFalse(server.has_sensor('katcp.request.in-flight'))
+
+
 class TestHandlerFiltering(unittest.TestCase):
     class DeviceWithEverything(katcp.DeviceServer):
         PROTOCOL_INFO = katcp.ProtocolFlags(
@@ -1123,3 +1510,262 @@ class TestDeviceServerClientIntegratedAsync(
     def _setup_server(self):
         self.server = AsyncDeviceTestServer('', 0)
         start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+
+class TestDeviceServerClientIntegratedSampleScheduler(
+        TestDeviceServerClientIntegrated):
+
+    def _setup_server(self):
+        self.server = DeviceTestServer('', 0)
+        self.server.SAMPLE_SCHEDULER_RESOLUTION = 0.001
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+    def test_sample_scheduler(self):
+        """Test that sampling strategies share the device's scheduler."""
+        self.client.assert_request_succeeds(
+            'sensor-sampling', 'an.int', 'period', 0.1)
+        scheduler = self.server._sample_scheduler
+        self.assertIsInstance(scheduler, katcp.sampling.SampleScheduler)
+        self.assertEqual(scheduler.resolution, 0.001)
+
+
+class TestDeviceServerClientIntegratedBulkRead(TestDeviceServerClientIntegrated):
+
+    def _setup_server(self):
+        self.server = DeviceTestServer('', 0)
+        self.server._server.BULK_READ = True
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+    def test_pipelined_requests(self):
+        """Test that many pipelined requests are all handled in order."""
+        get_msgs = self.client.message_recorder(
+                blacklist=self.BLACKLIST, replies=True)
+        no_requests = 500
+        self.client.raw_send(''.join('?watchdog[{0}]\n'.format(i)
+                                     for i in range(1, no_requests + 1)))
+        self._assert_msgs_equal(
+            get_msgs(min_number=no_requests, timeout=5),
+            [r"!watchdog[{0}] ok".format(i) for i in range(1, no_requests + 1)])
+
+    def test_message_too_large(self):
+        """Test that a connection sending an over-sized line is closed."""
+        self.server._server.MAX_MSG_SIZE = 1024
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.addCleanup(sock.close)
+        sock.connect(self.server_addr)
+        sock.settimeout(1)
+        sock.sendall('?watchdog ' + 'a'*2048)
+        data = sock.recv(4096)
+        while data:
+            data = sock.recv(4096)
+        # Normal clients are unaffected
+        self.client.assert_request_succeeds('watchdog')
+
+    def test_complete_message_too_large(self):
+        """Test that an over-sized line is rejected even if complete."""
+        self.server._server.MAX_MSG_SIZE = 1024
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.addCleanup(sock.close)
+        sock.connect(self.server_addr)
+        sock.settimeout(1)
+        sock.sendall('?watchdog[1]\n?watchdog[2] ' + 'a'*2048 +
+                     '\n?watchdog[3]\n')
+        data = ''
+        chunk = sock.recv(4096)
+        while chunk:
+            data += chunk
+            chunk = sock.recv(4096)
+        # Lines before the over-sized one are handled, later ones are not
+        self.assertIn('!watchdog[1] ok', data)
+        self.assertNotIn('!watchdog[2]', data)
+        self.assertNotIn('!watchdog[3]', data)
+
+
+class TestDeviceServerClientIntegratedHandlerPool(
+        TestDeviceServerClientIntegrated):
+
+    def _setup_server(self):
+        self.server = DeviceTestServer('', 0)
+        self.server.set_concurrency_options(handler_pool_size=2)
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+    def test_blocking_handler(self):
+        """Test that a blocking handler does not hold up other clients."""
+        unblock = threading.Event()
+        self.addCleanup(unblock.set)
+
+        def request_block(server, req, msg):
+            unblock.wait(5)
+            return req.make_reply('ok')
+        # Copy the class-level handler dict so as not to affect other tests
+        self.server._request_handlers = dict(
+            self.server._request_handlers, block=request_block)
+        get_msgs = self.client.message_recorder(
+                blacklist=self.BLACKLIST, replies=True)
+        self.client.raw_send('?block[1]\n?watchdog[2]\n')
+        host, port = self.server.bind_address
+        other_client = BlockingTestClient(self, host, port)
+        start_thread_with_cleanup(self, other_client, start_timeout=1)
+        self.assertTrue(other_client.wait_protocol(timeout=1))
+        other_client.assert_request_succeeds('watchdog')
+        # Requests from the blocked client are still handled in order
+        self.assertEqual(get_msgs(), [])
+        unblock.set()
+        self._assert_msgs_equal(get_msgs(min_number=2, timeout=1),
+                                ['!block[1] ok', '!watchdog[2] ok'])
+
+
+class TestDeviceServerClientIntegratedPipelined(
+        TestDeviceServerClientIntegrated):
+
+    def _setup_server(self):
+        self.server = AsyncDeviceTestServer('', 0)
+        self.server._server.MAX_IN_FLIGHT_REQUESTS = 2
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+    def test_pipelined_requests(self):
+        """Test that requests with message ids overlap within the window."""
+        @gen.coroutine
+        def request_sleep(server, req, msg):
+            yield gen.sleep(float(msg.arguments[0]))
+            raise gen.Return(req.make_reply('ok', msg.arguments[0]))
+        # Copy the class-level handler dict so as not to affect other tests
+        self.server._request_handlers = dict(
+            self.server._request_handlers, sleep=request_sleep)
+        get_msgs = self.client.message_recorder(
+                blacklist=self.BLACKLIST, replies=True)
+        self.client.raw_send('?sleep[1] 0.3\n?sleep[2] 0.1\n?sleep[3] 0.0\n'
+                             '?sleep 0.0\n?sleep[4] 0.0\n')
+        self._assert_msgs_equal(get_msgs(min_number=5, timeout=2), [
+            # Request 3 has to wait for 2 to make room in the window
+            '!sleep[2] ok 0.1',
+            '!sleep[3] ok 0.0',
+            '!sleep[1] ok 0.3',
+            # Requests without ids wait for all earlier requests
+            '!sleep ok 0.0',
+            '!sleep[4] ok 0.0'])
+
+
+class TestDeviceServerClientIntegratedPipelinedHandlerThread(
+        TestDeviceServerClientIntegrated):
+
+    def _setup_server(self):
+        self.server = DeviceTestServer('', 0)
+        self.server._server.MAX_IN_FLIGHT_REQUESTS = 40
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+    def test_handler_queue_full(self):
+        """Test that requests overflowing the handler queue are failed."""
+        unblock = threading.Event()
+        self.addCleanup(unblock.set)
+
+        def request_block(server, req, msg):
+            unblock.wait(5)
+            return req.make_reply('ok')
+        # Copy the class-level handler dict so as not to affect other tests
+        self.server._request_handlers = dict(
+            self.server._request_handlers, block=request_block)
+        get_msgs = self.client.message_recorder(
+                blacklist=self.BLACKLIST, replies=True)
+        self.client.raw_send('?block[1]\n' + ''.join(
+            '?watchdog[{0}]\n'.format(mid) for mid in range(2, 41)))
+        # Once the 30 queue slots are taken, requests are failed without
+        # waiting for the blocked handler
+        msgs = get_msgs(min_number=9, timeout=1)
+        self.assertGreaterEqual(len(msgs), 9)
+        for msg in msgs:
+            self.assertEqual(msg.name, 'watchdog')
+            self.assertEqual(msg.arguments[0], 'fail')
+        unblock.set()
+        msgs += get_msgs(min_number=40 - len(msgs), timeout=1)
+        # Every request is replied to
+        self.assertEqual(sorted(int(msg.mid) for msg in msgs), range(1, 41))
+        replies = dict((int(msg.mid), msg.arguments[0]) for msg in msgs)
+        self.assertEqual(replies[1], 'ok')
+        self.assertEqual(replies[2], 'ok')
+        self.assertEqual(replies[40], 'fail')
+
+
+class TestDeviceServerClientIntegratedStreamedSensorInforms(
+        TestDeviceServerClientIntegrated):
+
+    def _setup_server(self):
+        self.server = DeviceTestServer('', 0)
+        self.server.SENSOR_INFORM_CHUNK_SIZE = 1
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+    def test_streamed_sensor_value(self):
+        """Test that streamed informs precede their reply and later replies."""
+        for i in range(50):
+            self.server.add_sensor(katcp.Sensor.integer(
+                'streamed.int%02d' % i, default=i,
+                initial_status=katcp.Sensor.NOMINAL))
+        get_msgs = self.client.message_recorder(
+                blacklist=self.BLACKLIST, replies=True)
+        self.client.raw_send('?sensor-value[1] /^streamed/\n?watchdog[2]\n')
+        msgs = get_msgs(min_number=52, timeout=5)
+        self.assertEqual([m.name for m in msgs[:-2]], ['sensor-value'] * 50)
+        self.assertEqual([m.arguments[2] for m in msgs[:-2]],
+                         ['streamed.int%02d' % i for i in range(50)])
+        self._assert_msgs_equal(msgs[-2:], ['!sensor-value[1] ok 50',
+                                            '!watchdog[2] ok'])
+
+
+class TestDeviceServerClientIntegratedBatchedSensorStatus(
+        TestDeviceServerClientIntegrated):
+
+    def _setup_server(self):
+        self.server = DeviceTestServer('', 0)
+        self.server.SENSOR_STATUS_BATCH_WINDOW = 0
+        start_thread_with_cleanup(self, self.server, start_timeout=1)
+
+    def test_batched_sensor_status(self):
+        """Test that updates in one ioloop iteration are combined."""
+        self.server.add_sensor(katcp.Sensor.integer(
+            'another.int', params=[0, 10], default=1,
+            initial_status=katcp.Sensor.NOMINAL))
+        get_msgs = self.client.message_recorder(
+                whitelist=('sensor-status',), informs=True)
+        self.client.assert_request_succeeds('sensor-sampling', 'an.int', 'auto')
+        self.client.assert_request_succeeds(
+            'sensor-sampling', 'another.int', 'auto')
+        get_msgs.wait_number(2)
+        get_msgs()
+
+        def set_sensors():
+            self.server.get_sensor('an.int').set(1234, katcp.Sensor.WARN, 4)
+            self.server.get_sensor('another.int').set(
+                1234, katcp.Sensor.NOMINAL, 5)
+            self.server.get_sensor('an.int').set(1235, katcp.Sensor.WARN, 5)
+        self.server.ioloop.add_callback(set_sensors)
+        self._assert_msgs_equal(get_msgs(min_number=2), [
+            r'#sensor-status 1234.000000 2 an.int warn 4 another.int nominal 5',
+            r'#sensor-status 1235.000000 1 an.int warn 5'])
+
+    def test_batched_sensor_status_precedes_other_messages(self):
+        """Test that buffered updates are sent before later messages."""
+        self.server.SENSOR_STATUS_BATCH_WINDOW = 10
+        get_msgs = self.client.message_recorder(
+                whitelist=('sensor-status', 'sensor-value',
+                           'sensor-sampling-clear'),
+                informs=True, replies=True)
+        self.client.assert_request_succeeds('sensor-sampling', 'an.int', 'auto')
+
+        def set_sensor(*args):
+            # Wait for the update to be buffered
+            self.server._server.call_from_thread(partial(
+                self.server.get_sensor('an.int').set, *args)).result(timeout=1)
+        set_sensor(1234, katcp.Sensor.WARN, 4)
+        self.client.blocking_request(
+            katcp.Message.request('sensor-value', 'an.int'))
+        set_sensor(1235, katcp.Sensor.WARN, 5)
+        self.client.blocking_request(
+            katcp.Message.request('sensor-sampling-clear'))
+        msgs = get_msgs(min_number=6, timeout=1)
+        self._assert_msgs_equal(msgs, [
+            r'#sensor-status 12345.000000 1 an.int nominal 3',
+            r'#sensor-status 1234.000000 1 an.int warn 4',
+            r'#sensor-value[2] 1234.000000 1 an.int warn 4',
+            r'!sensor-value[2] ok 1',
+            r'#sensor-status 1235.000000 1 an.int warn 5',
+            r'!sensor-sampling-clear[3] ok'])
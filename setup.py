@@ -30,10 +30,14 @@ setup(
     use_katversion=True,
     install_requires=[
         "ply",
-        "tornado>=4.3",
+        "tornado>=4.5",
         "futures",
         "future"
     ],
+    extras_require={
+        # katcp.sensor_bank
+        "numpy": ["numpy"],
+    },
     # run tests and install these requirements with python setup.py nosetests
     tests_require=[
         "unittest2",